@@ -1,26 +1,26 @@
 from django.contrib import admin
 
-from .models import Listing, Category, Bid, Comment, Watchlist
+from .models import Listing, Category, Bid, ProxyBid, Comment, WatchlistEntry
 
 class ListingAdmin(admin.ModelAdmin):
-    list_display = ('title', 'description', 'img_url', 'price', 'owner', 'category', 'is_active')
+    list_display = ('title', 'description', 'img_url', 'price', 'current_price', 'bid_count', 'owner', 'category', 'ends_at', 'is_active')
 
 class BidAdmin(admin.ModelAdmin):
     list_display = ('price', 'listing', 'user', 'is_winner')
 
+class ProxyBidAdmin(admin.ModelAdmin):
+    list_display = ('max_price', 'listing', 'user')
+
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('content', 'listing', 'user')
 
-class WatchlistAdmin(admin.ModelAdmin):
-    list_display = ('user', 'listings_count')
-
-    # why? cuz cant display many-to-many without querying the db
-    def listings_count(self, obj):
-        # return '\n'.join(listing.title for listing in obj.listings.all())
-        return obj.listings.count()
+class WatchlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'listing')
+    list_select_related = ('user', 'listing')
 
 admin.site.register(Listing, ListingAdmin)
 admin.site.register(Bid, BidAdmin)
+admin.site.register(ProxyBid, ProxyBidAdmin)
 admin.site.register(Comment, CommentAdmin)
-admin.site.register(Watchlist, WatchlistAdmin)
+admin.site.register(WatchlistEntry, WatchlistEntryAdmin)
 admin.site.register(Category)
@@ -0,0 +1,188 @@
+"""Read-only json api (v1) over listings, their bids and categories.
+
+- listings and bids are keyset paginated (see pagination.py)
+- `?fields=id,title,...` limits listing fields (and columns queried)
+- responses carry `ETag`/`Last-Modified`, so clients could revalidate
+  with `If-None-Match`/`If-Modified-Since` and get a `304` back
+- `listings/export` streams all listings as ndjson (one json per line)
+  in constant memory
+"""
+import hashlib
+import json
+
+from django.core.exceptions import BadRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition, require_GET
+
+from . import archive, caching, pagination
+from .models import Bid, Category, Listing
+
+
+# field: (columns it needs, how to get it from a listing)
+LISTING_FIELDS = {
+    'id': (['id'], lambda l: l.id),
+    'title': (['title'], lambda l: l.title),
+    'description': (['description'], lambda l: l.description),
+    'img_url': (['img_url'], lambda l: l.img_url),
+    'price': (['price'], lambda l: l.price),
+    'current_price': (['current_price'], lambda l: l.current_price),
+    'bid_count': (['bid_count'], lambda l: l.bid_count),
+    'is_active': (['is_active'], lambda l: l.is_active),
+    'category': (['category_id'], lambda l: l.category_id),
+    'owner': (['owner__username'], lambda l: l.owner.username),
+    'updated_at': (['updated_at'], lambda l: l.updated_at),
+    'url': (['id'], lambda l: l.get_absolute_url()),
+}
+
+# rows fetched at a time by ndjson export
+EXPORT_CHUNK_SIZE = 2000
+
+
+def get_fields(request):
+    """Listing fields requested by client (`?fields=...`), all by default."""
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(LISTING_FIELDS)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = set(fields) - set(LISTING_FIELDS)
+    if unknown:
+        raise BadRequest(f'unknown fields: {", ".join(sorted(unknown))}')
+    return fields
+
+
+def select_fields(queryset, fields):
+    """Only query columns needed by listing `fields`
+    (id and updated_at are always needed, for pagination and caching).
+    """
+    columns = {'id', 'updated_at'}
+    for field in fields:
+        columns.update(LISTING_FIELDS[field][0])
+    if 'owner__username' in columns:
+        queryset = queryset.select_related('owner')
+    return queryset.only(*columns)
+
+
+def serialize_listing(listing, fields):
+    return {field: LISTING_FIELDS[field][1](listing) for field in fields}
+
+
+def conditional_json(request, data, etag, last_modified=None):
+    """Respond with `data` as json, or with a `304` if client's copy is still fresh."""
+    etag = quote_etag(etag)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp()),
+    )
+    if response is None:
+        response = JsonResponse(data)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+@require_GET
+def listings(request):
+    """Active listings (newest first), optionally of a category (`?category=<id>`)."""
+    fields = get_fields(request)
+    queryset = Listing.objects.filter(is_active=True)
+    if request.GET.get('category'):
+        try:
+            queryset = queryset.filter(category_id=int(request.GET['category']))
+        except ValueError:
+            raise BadRequest('invalid category')
+    page = pagination.paginate(request, select_fields(queryset, fields))
+
+    # page is fresh as long as same listings in it are unchanged
+    fingerprint = ','.join(f'{listing.id}:{listing.updated_at.timestamp()}' for listing in page)
+    etag = hashlib.md5(f'{request.get_full_path()}|{fingerprint}'.encode()).hexdigest()
+    last_modified = max((listing.updated_at for listing in page), default=None)
+    return conditional_json(request, {
+        'results': [serialize_listing(listing, fields) for listing in page],
+        'next': page.next_url,
+        'previous': page.previous_url,
+    }, etag, last_modified)
+
+
+def listing_updated_at(request, listing_id):
+    """When listing (`listing_id`) was last changed (None if it doesn't exist).
+    Queried once per request.
+    """
+    if not hasattr(request, '_listing_updated_at'):
+        request._listing_updated_at = (
+            Listing.objects.filter(pk=listing_id).values_list('updated_at', flat=True).first()
+        )
+    return request._listing_updated_at
+
+
+def listing_etag(request, listing_id):
+    updated_at = listing_updated_at(request, listing_id)
+    if updated_at is None:
+        return None
+    return f'{listing_id}-{updated_at.timestamp()}'
+
+
+@require_GET
+@condition(etag_func=listing_etag, last_modified_func=listing_updated_at)
+def listing_detail(request, listing_id):
+    fields = get_fields(request)
+    listing = get_object_or_404(select_fields(Listing.objects.all(), fields), pk=listing_id)
+    return JsonResponse(serialize_listing(listing, fields))
+
+
+@require_GET
+@condition(etag_func=listing_etag, last_modified_func=listing_updated_at)
+def listing_bids(request, listing_id):
+    """Bids of a listing (newest, ie. highest, first).
+    Any new bid changes listing's `updated_at` too.
+    """
+    listing = get_object_or_404(Listing.objects.only('id', 'archived_at'), pk=listing_id)
+    if listing.archived_at is not None:
+        page = pagination.paginate_list(request, archive.archived_bids(listing_id))
+    else:
+        page = pagination.paginate(request, Bid.objects.filter(listing_id=listing_id).select_related('user'))
+    return JsonResponse({
+        'results': [
+            {
+                'id': bid.id,
+                'price': bid.price,
+                'user': bid.user.username,
+                'is_winner': bid.is_winner,
+            }
+            for bid in page
+        ],
+        'next': page.next_url,
+        'previous': page.previous_url,
+    })
+
+
+def catalog_etag(request):
+    return f'catalog-{caching.get_version(caching.CATALOG)}'
+
+
+@require_GET
+@condition(etag_func=catalog_etag)
+def categories(request):
+    return JsonResponse({
+        'results': list(Category.objects.order_by('id').values('id', 'name')),
+    })
+
+
+@require_GET
+def export_listings(request):
+    """Stream all listings (active or not) as ndjson."""
+    fields = get_fields(request)
+    queryset = select_fields(Listing.objects.order_by('id'), fields)
+
+    def lines():
+        for listing in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield json.dumps(serialize_listing(listing, fields), cls=DjangoJSONEncoder) + '\n'
+
+    response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="listings.ndjson"'
+    return response
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        # connect signal handlers (and db instrumentation/tuning of auctions.metrics/database)
+        from . import database, metrics, signals  # noqa: F401
@@ -0,0 +1,146 @@
+"""Archival of long closed listings (see `manage.py archive_closed_listings`).
+
+Once a listing has been closed for `ARCHIVE_AFTER_DAYS` days,
+its bids and comments are moved out of the hot tables into one
+`ListingArchive` row (zlib compressed json, see `pack`),
+and its proxy bids (of no use once closed) are dropped.
+Listing itself keeps its bidding summary (price, bid count)
+and its leading (winning) bid row, so listing pages, api and
+`get_max_bid_price` never notice.
+
+Pages and api read bids/comments of archived listings (`listing.archived_at` is set)
+from archive instead (`listing_comments`, `archived_bids`, `archived_comments`),
+as same (unsaved) model instances, so templates don't tell the difference.
+"""
+import json
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caching
+from .models import Bid, Comment, Listing, ListingArchive, ProxyBid, User
+
+
+# max listings archived by one `archive_closed_listings` call (one transaction)
+ARCHIVE_BATCH_SIZE = 500
+
+# archived columns (rows are packed as lists, in this order)
+BID_COLUMNS = ['id', 'user_id', 'price', 'is_winner']
+COMMENT_COLUMNS = ['id', 'user_id', 'content']
+
+
+def pack(rows):
+    """Compress `rows` (lists of json values)."""
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def archive_closed_listings(now=None, days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive (up to `batch_size`) listings closed more than `days` ago
+    (`ARCHIVE_AFTER_DAYS` setting by default), earliest closed first.
+    Return ids of archived listings.
+    """
+    now = now or timezone.now()
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    with transaction.atomic():
+        # straight off the partial index on `closed_at`
+        listings = dict(
+            Listing.objects
+            .filter(is_active=False, archived_at__isnull=True, closed_at__lte=now - timedelta(days=days))
+            .order_by('closed_at')
+            .select_for_update(skip_locked=True)
+            .values_list('id', 'leading_bid_id')[:batch_size]
+        )
+        if not listings:
+            return []
+        ids = list(listings)
+
+        bids = {listing_id: [] for listing_id in ids}
+        for row in Bid.objects.filter(listing_id__in=ids).order_by('id').values_list('listing_id', *BID_COLUMNS):
+            bids[row[0]].append([*row[1:3], str(row[3]), row[4]])
+        comments = {listing_id: [] for listing_id in ids}
+        for row in Comment.objects.filter(listing_id__in=ids).order_by('id').values_list('listing_id', *COMMENT_COLUMNS):
+            comments[row[0]].append(list(row[1:]))
+        ListingArchive.objects.bulk_create([
+            ListingArchive(
+                listing_id=listing_id, bids=pack(bids[listing_id]), comments=pack(comments[listing_id]),
+                archived_at=now,
+            )
+            for listing_id in ids
+        ])
+
+        # leading bids stay (listing summary points at them)
+        delete_rows(Bid, ids, keep_leading=True)
+        delete_rows(Comment, ids)
+        delete_rows(ProxyBid, ids)
+        Listing.objects.filter(pk__in=ids).update(archived_at=now)
+
+        caching.bump_version(*map(caching.listing_version_name, ids))
+        return ids
+
+
+def delete_rows(model, listing_ids, keep_leading=False):
+    """Delete rows of `model` (bids, comments or proxy bids) of listings (`listing_ids`)
+    by a plain DELETE, not `QuerySet.delete()`, which would load every row
+    to send its `post_delete` signal (only invalidating cached listing pages,
+    done once for the whole batch instead) and look for rows to cascade to
+    (there are none: only listings point at bids, at leading ones, which are kept
+    if `keep_leading`).
+    """
+    quote = connection.ops.quote_name
+    table, listing_column = model._meta.db_table, model._meta.get_field('listing').column
+    sql = f'DELETE FROM {quote(table)} WHERE {quote(listing_column)} IN ({", ".join(["%s"] * len(listing_ids))})'
+    if keep_leading:
+        listing_table = Listing._meta.db_table
+        leading_column = Listing._meta.get_field('leading_bid').column
+        sql += (
+            f' AND NOT EXISTS (SELECT 1 FROM {quote(listing_table)}'
+            f' WHERE {quote(listing_table)}.{quote(leading_column)} = {quote(table)}.{quote(model._meta.pk.column)})'
+        )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, listing_ids)
+
+
+def load_users(rows):
+    """Users of archived `rows` (user id is 2nd column) by id, in one query.
+    (rows of since deleted users are dropped, as they would've been by cascade)
+    """
+    return User.objects.in_bulk({row[1] for row in rows})
+
+
+def archived_bids(listing_id):
+    """Bids of archived listing (`listing_id`), as (unsaved) `Bid`s with users, newest first."""
+    rows = unpack(ListingArchive.objects.values_list('bids', flat=True).get(listing_id=listing_id))
+    users = load_users(rows)
+    return [
+        Bid(id=bid_id, listing_id=listing_id, user=users[user_id], price=Decimal(price), is_winner=is_winner)
+        for bid_id, user_id, price, is_winner in reversed(rows)
+        if user_id in users
+    ]
+
+
+def archived_comments(listing_id):
+    """Comments of archived listing (`listing_id`), as (unsaved) `Comment`s with users, newest first."""
+    rows = unpack(ListingArchive.objects.values_list('comments', flat=True).get(listing_id=listing_id))
+    users = load_users(rows)
+    return [
+        Comment(id=comment_id, listing_id=listing_id, user=users[user_id], content=content)
+        for comment_id, user_id, content in reversed(rows)
+        if user_id in users
+    ]
+
+
+def listing_comments(listing):
+    """Comments of `listing`, newest first, wherever they are:
+    a queryset (hot table) or a list (archive).
+    """
+    if listing.archived_at is not None:
+        return archived_comments(listing.id)
+    return listing.comments.select_related('user').order_by('-id')
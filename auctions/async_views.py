@@ -0,0 +1,145 @@
+"""Async variants of read-heavy pages (mounted under `/async/`).
+
+Django (3.2) ORM is sync only, so each independent query runs
+in its own thread (`run_db`) and a view awaits all of them at once
+instead of one after another.
+Pages are rendered exactly like their sync counterparts (see views.py).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import archive, categories, pagination, utils
+from .models import Category, Comment, Listing
+from .views import listing_page_context
+
+
+async def run_db(func, *args):
+    """Run db-bound `func` in a thread of its own
+    (and release its db connection when done, unless it's persistent).
+    """
+    def run():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+def load_user_state(request):
+    """Resolve (lazy) user of request and their watched listings
+    so templates won't have to query db.
+    """
+    if request.user.is_authenticated:
+        request.watchlist.ids
+    return request.user
+
+
+async def render_async(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def index(request):
+    page, _ = await asyncio.gather(
+        run_db(pagination.paginate, request, Listing.objects.filter(is_active=True)),
+        run_db(load_user_state, request),
+    )
+    if pagination.wants_json(request):
+        return pagination.json_response(page)
+    return await render_async(request, 'auctions/index.html', {
+        'listings': page,
+        'page': page,
+    })
+
+
+def get_listing(listing_id):
+    try:
+        return Listing.objects.select_related('leading_bid', 'owner', 'category').get(pk=listing_id)
+    except Listing.DoesNotExist:
+        raise Http404('No listing matches the given query.')
+
+
+def get_comments(request, listing_id, archived=False):
+    """First page of comments of listing (see `views.first_comments_page`)."""
+    if archived:
+        comments = archive.archived_comments(listing_id)
+    else:
+        comments = Comment.objects.filter(listing_id=listing_id).select_related('user').order_by('-id')
+    return pagination.first_page(request, comments, reverse('listing_comments', args=(listing_id,)))
+
+
+async def get_listing_and_comments(request, listing_id):
+    """Listing and its first page of comments, queried at once
+    (archived listings have no comments in hot table: read them from archive).
+    """
+    listing, comments = await asyncio.gather(
+        run_db(get_listing, listing_id),
+        run_db(get_comments, request, listing_id),
+    )
+    if listing.archived_at is not None:
+        comments = await run_db(get_comments, request, listing_id, True)
+    return listing, comments
+
+
+async def display_listing(request, listing_id):
+    (listing, comments), _ = await asyncio.gather(
+        get_listing_and_comments(request, listing_id),
+        run_db(load_user_state, request),
+    )
+    context = await sync_to_async(listing_page_context)(request, listing, comments)
+    return await render_async(request, 'auctions/listing.html', context)
+
+
+async def all_categories(request):
+    summaries, _ = await asyncio.gather(
+        run_db(categories.get_summaries),
+        run_db(load_user_state, request),
+    )
+    return await render_async(request, 'auctions/categories.html', {'categories': summaries})
+
+
+def get_category(pk):
+    try:
+        return Category.objects.get(pk=pk)
+    except Category.DoesNotExist:
+        raise Http404('No category matches the given query.')
+
+
+async def display_category(request, pk):
+    category, page, summary, _ = await asyncio.gather(
+        run_db(get_category, pk),
+        run_db(pagination.paginate, request, Listing.objects.filter(category_id=pk, is_active=True)),
+        run_db(categories.get_summary, pk),
+        run_db(load_user_state, request),
+    )
+    if pagination.wants_json(request):
+        return pagination.json_response(page)
+    return await render_async(request, 'auctions/category.html', {
+        'category': category,
+        'listings': page,
+        'page': page,
+        'summary': summary,
+    })
+
+
+async def listing_json(request, listing_id):
+    """Listing (with bidding summary), its newest comments
+    and whether it's on current user's watchlist, as json.
+    """
+    (listing, comments), user = await asyncio.gather(
+        get_listing_and_comments(request, listing_id),
+        run_db(load_user_state, request),
+    )
+    data = utils.listing_to_dict(listing)
+    data['comments'] = [
+        {'user': comment.user.username, 'content': comment.content}
+        for comment in comments
+    ]
+    # older comments (`?format=json` for json)
+    data['comments_next'] = comments.next_url
+    data['is_watched'] = user.is_authenticated and listing.id in request.watchlist
+    return JsonResponse(data)
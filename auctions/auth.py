@@ -0,0 +1,45 @@
+"""Authentication fast path: users of sessions loaded from cache.
+
+`AuthenticationMiddleware` loads user of every request (by id stored in
+session) through auth backend's `get_user`: a query per request.
+`CachedModelBackend` caches users (`USER_CACHE_TIMEOUT` setting,
+0 disables it) under a per user version, bumped whenever user is saved
+or deleted (see auctions.signals): password changes (sessions of old password
+stop validating right away), last login updates, profile edits.
+(Users changed by queryset `update()` go unnoticed until timeout.)
+
+Along with a cached session backend (`SESSION_ENGINE` setting),
+logged in requests need no query at all before views run.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import caching
+
+
+def version_name(user_id):
+    return f'user:{user_id}'
+
+
+def user_changed(user_id):
+    """Invalidate cached user (`user_id`)."""
+    caching.bump_version(version_name(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """`ModelBackend` loading users of sessions from cache."""
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 0)
+        if not timeout:
+            return super().get_user(user_id)
+
+        # a user loaded before a change is cached under old version, never read
+        key = f'auctions:user:{user_id}:{caching.get_version(version_name(user_id))}'
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, timeout)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,327 @@
+"""Per-url benchmarks (see `manage.py benchmark_urls`).
+
+Every url of auctions.urls is requested (in process, by test client)
+against data already in db (eg. seeded by auctions.seeding) and measured:
+- wall_ms: whole request/response (streamed content included)
+- queries, db_ms: db queries run, by any thread (async views query from a pool)
+- render_ms: rendering templates
+- peak_kb: peak memory allocated
+  (in a separate run, as tracing allocations slows everything down)
+Timings are the best of repeated runs (after a warm up run):
+noise (other processes, gc...) only ever adds time, so best run is
+the most repeatable figure to compare runs with.
+
+Results are plain dicts (json friendly) and could be compared with
+a baseline of an earlier run (see `compare`).
+"""
+import gc
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.db.backends.utils import CursorWrapper
+from django.template.backends.django import Template
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import bidding, images
+from .models import Listing, User
+from .seeding import SEED_PASSWORD
+
+
+# how each url is requested: `setup` (if any) runs before timing
+Request = namedtuple('Request', 'method user kwargs data setup', defaults=(None, None, None, None))
+
+# metric: (min relative change, min absolute change) reported
+# timings are only flagged when well beyond run to run noise
+# (single runs of a page commonly take up to ~70% longer, by 10ms or so)
+# (query counts are exact: any increase is a regression)
+THRESHOLDS = {
+    'wall_ms': (0.75, 15.0),
+    # (queries of async views overlap, so their db time is noisier: single runs vary 3-20ms)
+    # (a missing index at 10000 listings costs far more)
+    'db_ms': (0.75, 25.0),
+    'render_ms': (0.75, 8.0),
+    'peak_kb': (0.5, 256),
+    'queries': (0, 1),
+}
+
+
+class Probe:
+    """Count/time db queries and template rendering while installed."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    @contextmanager
+    def installed(self):
+        probe = self
+        execute = CursorWrapper._execute_with_wrappers
+        render = Template.render
+
+        def timed_execute(cursor, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return execute(cursor, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with probe.lock:
+                    probe.queries += 1
+                    probe.db_time += elapsed
+
+        def timed_render(template, *args, **kwargs):
+            # templates rendered within templates are timed by outer one
+            depth = getattr(probe.local, 'depth', 0)
+            probe.local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                return render(template, *args, **kwargs)
+            finally:
+                probe.local.depth = depth
+                if not depth:
+                    elapsed = time.perf_counter() - start
+                    with probe.lock:
+                        probe.render_time += elapsed
+
+        # patched on classes (not per connection) so queries of all threads count
+        with mock.patch.object(CursorWrapper, '_execute_with_wrappers', timed_execute), \
+                mock.patch.object(Template, 'render', timed_render):
+            yield self
+
+
+class Targets:
+    """Rows urls are requested with, and how each url is requested."""
+    def __init__(self):
+        # a watching user and a busy listing of someone else
+        self.user = User.objects.filter(watchlist_entries__isnull=False).order_by('id').first()
+        self.listing = (
+            Listing.objects
+            .filter(is_active=True, bid_count__gt=0, category__isnull=False, ends_at__isnull=True)
+            .exclude(owner=self.user)
+            .order_by('-bid_count', 'id')
+            .first()
+        )
+        if self.user is None or self.listing is None:
+            raise ValueError('not enough data to benchmark (seed db first)')
+        self.owner = self.listing.owner
+        self.category = self.listing.category
+        self.other_user = User.objects.exclude(pk__in=[self.user.pk, self.owner.pk]).order_by('id').first()
+        self.counter = 0
+        self.listing_with_image = None
+
+    def url_kwargs(self, pattern):
+        """Values of `pattern`'s params (by param name)
+        (others are up to each url's request, see `requests`).
+        """
+        values = {
+            'listing_id': self.listing.id,
+            'pk': self.category.id,
+            'username': self.owner.username,
+        }
+        return {name: values[name] for name in pattern.pattern.converters if name in values}
+
+    def unique(self):
+        self.counter += 1
+        return self.counter
+
+    def fresh_listing(self):
+        """A new active listing (of owner) with a bid (of other user)."""
+        listing = Listing.objects.create(
+            owner=self.owner, category=self.category,
+            title='benchmark listing', description='benchmark listing', price=10,
+        )
+        bidding.place_bid(listing, self.other_user, 11)
+        return listing
+
+    def image_listing(self):
+        """A listing with an image (seeded ones have none).
+        Fetched once (by `fetch_placeholder`), then served from image cache.
+        """
+        if self.listing_with_image is None:
+            self.listing_with_image = Listing.objects.create(
+                owner=self.owner, category=self.category,
+                title='benchmark listing', description='benchmark listing', price=10,
+                img_url='https://images.example.com/benchmark.png',
+            )
+        return self.listing_with_image
+
+    def requests(self, name, pattern):
+        """How to request url `name` (a new request per run, as runs may change data).
+        Yield (label, request factory).
+        """
+        kwargs = self.url_kwargs(pattern)
+        if name == 'place_bid':
+            yield name, lambda: Request(
+                'post', self.user, kwargs,
+                {'price': Listing.objects.get(pk=self.listing.pk).current_price + 1},
+            )
+        elif name == 'place_max_bid':
+            def request():
+                listing = self.fresh_listing()
+                return Request('post', self.user, {'listing_id': listing.id}, {'max_price': 100})
+            yield name, request
+        elif name == 'accept_max_bid':
+            yield name, lambda: Request('post', self.owner, {'listing_id': self.fresh_listing().id})
+        elif name == 'add_comment':
+            yield name, lambda: Request('post', self.user, kwargs, {'content': 'benchmark comment'})
+        elif name == 'add_to_watchlist':
+            yield name, lambda: Request('post', self.user, {'listing_id': self.fresh_listing().id})
+        elif name == 'remove_from_watchlist':
+            def request():
+                listing = self.fresh_listing()
+                return Request(
+                    'post', self.user, {'listing_id': listing.id},
+                    setup=lambda client: client.post(f'/listings/{listing.id}/watch'),
+                )
+            yield name, request
+        elif name == 'listing_image':
+            def request():
+                listing = self.image_listing()
+                return Request('get', self.user, {
+                    'listing_id': listing.id, 'rendition': 'thumb', 'digest': images.url_digest(listing.img_url),
+                })
+            yield name, request
+        elif name == 'search':
+            yield name, lambda: Request('get', self.user, kwargs, {'q': self.listing.title.split()[0]})
+        else:
+            yield name, lambda: Request('get', self.user, kwargs)
+
+        # form submissions (besides their pages)
+        if name == 'login':
+            yield f'{name} (POST)', lambda: Request(
+                'post', None, kwargs, {'username': self.user.username, 'password': SEED_PASSWORD},
+            )
+        elif name == 'register':
+            def request():
+                username = f'benchmark{self.unique()}'
+                return Request('post', None, kwargs, {
+                    'username': username, 'email': '', 'password': username, 'confirmation': username,
+                })
+            yield f'{name} (POST)', request
+        elif name == 'create_listing':
+            yield f'{name} (POST)', lambda: Request('post', self.user, kwargs, {
+                'title': 'benchmark listing', 'description': 'benchmark listing', 'price': 10,
+                'category': self.category.id,
+            })
+
+
+def fetch_placeholder(url):
+    """Image fetcher of benchmarks (never hits network): placeholder image."""
+    with open(finders.find('auctions/images/notfound.png'), 'rb') as f:
+        return f.read()
+
+
+def named_urls():
+    """(name, pattern) of every named url of auctions."""
+    from . import urls
+    return [(pattern.name, pattern) for pattern in urls.urlpatterns if pattern.name]
+
+
+def perform(name, make_request, probe=None):
+    """Make a new request (by `make_request`) to url `name` and run it.
+    Return (status, seconds taken).
+    """
+    request = make_request()
+    client = Client()
+    if request.user is not None:
+        client.force_login(request.user)
+    if request.setup:
+        request.setup(client)
+    cache.clear()
+    path = reverse(name, kwargs=request.kwargs)
+    if probe:
+        probe.reset()
+    start = time.perf_counter()
+    response = getattr(client, request.method)(path, request.data or {})
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response.status_code, time.perf_counter() - start
+
+
+def measure(name, make_request, repeat=5):
+    """Metrics (see module docstring) of requests to url `name` made by `make_request`."""
+    probe = Probe()
+    runs = []
+    # first request warms up caches of templates, urls, db connection...
+    perform(name, make_request)
+    # no gc pauses while timing (like timeit)
+    gc.collect()
+    gc.disable()
+    try:
+        with probe.installed():
+            for _ in range(repeat):
+                status, elapsed = perform(name, make_request, probe)
+                runs.append((elapsed, probe.queries, probe.db_time, probe.render_time))
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        perform(name, make_request)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'wall_ms': round(min(run[0] for run in runs) * 1000, 3),
+        'queries': max(run[1] for run in runs),
+        'db_ms': round(min(run[2] for run in runs) * 1000, 3),
+        'render_ms': round(min(run[3] for run in runs) * 1000, 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(repeat=5, log=None):
+    """Benchmark every url against data in db. Return {label: metrics}."""
+    targets = Targets()
+    results = {}
+    with tempfile.TemporaryDirectory() as image_cache_dir, override_settings(
+        IMAGE_FETCHER='auctions.benchmarking.fetch_placeholder', IMAGE_CACHE_DIR=image_cache_dir,
+        # /metrics as scraped (test client's address)
+        METRICS_ALLOWED_IPS=['127.0.0.1'],
+    ):
+        for name, pattern in named_urls():
+            for label, make_request in targets.requests(name, pattern):
+                results[label] = measure(name, make_request, repeat)
+                if log:
+                    log(label, results[label])
+    return results
+
+
+def compare(baseline, results):
+    """Compare `results` with `baseline` (both {dataset: {label: metrics}}).
+    Return [(dataset, label, metric, old value, new value, is regression?)]
+    of every metric out of its threshold (either way) or changed status.
+    Urls missing from baseline are reported too, by their status (old value None),
+    not as regressions (until baseline is recorded again).
+    """
+    changes = []
+    for dataset, urls in results.items():
+        for label, metrics in urls.items():
+            old_metrics = baseline.get(dataset, {}).get(label)
+            if old_metrics is None:
+                changes.append((dataset, label, 'status', None, metrics['status'], False))
+                continue
+            if metrics['status'] != old_metrics['status']:
+                changes.append((dataset, label, 'status', old_metrics['status'], metrics['status'], True))
+            for metric, (relative, absolute) in THRESHOLDS.items():
+                old, new = old_metrics[metric], metrics[metric]
+                limit = max(old * relative, absolute)
+                if abs(new - old) >= limit:
+                    changes.append((dataset, label, metric, old, new, new > old))
+    return changes
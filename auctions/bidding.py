@@ -0,0 +1,283 @@
+"""Bidding engine.
+
+All writes that touch listing's bidding state go through here.
+Each one is a conditional UPDATE on the listing row (compare-and-swap),
+so concurrent bidders/closers can't both pass the same check:
+- a bid only goes in if its price is still greater than listing's current price
+- a listing only closes once, and only its leading bid at that moment wins
+
+The UPDATE is the first statement of the transaction, so it also takes
+the write lock (row lock on postgres, db lock on sqlite) and bids of a
+listing get inserted in increasing price order
+(ie. "last bid is the max bid" always holds).
+
+Users could also set a max price (proxy bid, see `place_max_bid`)
+and have the engine bid for them. Whenever price changes, proxies are
+resolved in one step (see `_resolve_proxies`): only the winning proxy bids,
+just enough to beat the runner-up, so proxies never generate
+a bid war of rows, and bids still go in increasing price order.
+
+Listings with an end time stop taking bids once it has passed
+(whether or not they're closed yet) and get closed in batches
+by `close_expired_listings` (see `manage.py close_expired_listings`).
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Subquery
+from django.utils import timezone
+
+from . import caching, categories, events, metrics
+from .models import Bid, Listing, ProxyBid
+
+
+# max listings closed by one `close_expired_listings` call (one transaction)
+EXPIRY_BATCH_SIZE = 1000
+
+# how much a proxy bids over the price it has to beat
+BID_INCREMENT = Decimal('1.00')
+
+
+class BidError(Exception):
+    """Base class for bids rejected by the engine."""
+
+
+class ListingClosed(BidError):
+    """Listing isn't active (anymore)."""
+
+
+class Outbid(BidError):
+    """Bid price isn't greater than current price of listing."""
+    def __init__(self, price, current_price):
+        self.price = price
+        self.current_price = current_price
+        super().__init__(
+            f"Your bid (${price}) must be greater than the current max bid of (${current_price})"
+        )
+
+
+class MaxBidTooLow(BidError):
+    """New max price of a proxy bid isn't greater than user's current max price."""
+    def __init__(self, max_price, current_max_price):
+        self.max_price = max_price
+        self.current_max_price = current_max_price
+        super().__init__(
+            f"Your max bid (${max_price}) must be greater than your current max bid of (${current_max_price})"
+        )
+
+
+def place_bid(listing, user, price):
+    """Place a new bid of `price` by `user` on `listing`.
+    Return created bid.
+    Raise `ListingClosed` or `Outbid` if bid can't be placed.
+    """
+    with transaction.atomic():
+        claimed = Listing.objects.filter(
+            not_ended(timezone.now()),
+            pk=listing.pk,
+            is_active=True,
+            current_price__lt=price,
+        ).update(current_price=price)
+        if not claimed:
+            raise _rejection_reason(listing.pk, price)
+        # saving a bid also updates rest of listing's bidding summary
+        bid = Bid.objects.create(listing_id=listing.pk, user=user, price=price)
+        # users with a higher max price respond right away
+        _resolve_proxies(listing.pk)
+        _sync_summary(listing)
+        return bid
+
+
+def place_max_bid(listing, user, max_price):
+    """Set (or raise) max price `user` is willing to pay for `listing`
+    and bid on their behalf if they could lead.
+    Return user's proxy bid.
+    Raise `ListingClosed`, `Outbid` (max price isn't over current price)
+    or `MaxBidTooLow` (max price isn't over user's current max price).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # nothing to change in summary yet, claim listing (and lock it) all the same
+        claimed = Listing.objects.filter(
+            not_ended(now),
+            pk=listing.pk,
+            is_active=True,
+            current_price__lt=max_price,
+        ).update(updated_at=now)
+        if not claimed:
+            raise _rejection_reason(listing.pk, max_price)
+
+        current = ProxyBid.objects.filter(listing_id=listing.pk, user=user).first()
+        if current is not None:
+            if max_price <= current.max_price:
+                raise MaxBidTooLow(max_price, current.max_price)
+            # a raised max is a new max: ranks after earlier ones of same price
+            current.delete()
+        proxy = ProxyBid.objects.create(listing_id=listing.pk, user=user, max_price=max_price)
+
+        if _resolve_proxies(listing.pk) is not None:
+            _sync_summary(listing)
+        return proxy
+
+
+def close_listing(listing):
+    """Close `listing` and mark its leading bid (if any) as winner.
+    Return winning bid (or None).
+    Raise `ListingClosed` if listing is already closed.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        closed = (
+            Listing.objects
+            .filter(pk=listing.pk, is_active=True)
+            .update(is_active=False, updated_at=now, closed_at=now)
+        )
+        if not closed:
+            raise ListingClosed()
+        # closed listings leave active listings pages too
+        caching.listing_changed(listing.pk, catalog=True)
+        # listing is locked and closed now: no bid could sneak in
+        # so leading bid is final
+        leading_bid_id, category_id, current_price, bid_count = (
+            Listing.objects
+            .filter(pk=listing.pk)
+            .values_list('leading_bid_id', 'category_id', 'current_price', 'bid_count')
+            .get()
+        )
+        categories.refresh(category_id, -1)
+        events.publish_listing_event(listing.pk, 'closed', current_price=current_price, bid_count=bid_count)
+        metrics.LISTINGS_CLOSED.inc(reason='accepted')
+        if leading_bid_id is None:
+            return None
+        Bid.objects.filter(pk=leading_bid_id).update(is_winner=True)
+        return Bid.objects.get(pk=leading_bid_id)
+
+
+def close_expired_listings(now=None, batch_size=EXPIRY_BATCH_SIZE):
+    """Close (up to `batch_size`) listings whose end time has passed (by `now`),
+    earliest ending first, and mark their leading bids as winners.
+    Return ids of closed listings.
+    """
+    now = now or timezone.now()
+    # (when they actually got closed, also tells this batch apart from earlier ones)
+    closed_at = timezone.now()
+    with transaction.atomic():
+        # claim rows by the UPDATE itself, as first statement (as bids do):
+        # a transaction that reads first can't upgrade its lock on sqlite
+        # and fails right away (no busy timeout) if a bid commits meanwhile
+        # due listings come straight off the partial index on `ends_at`: never scans other listings
+        # (rows are skipped, not waited for, if another worker has them locked)
+        due = (
+            Listing.objects
+            .filter(is_active=True, ends_at__lte=now)
+            .order_by('ends_at')
+            .select_for_update(skip_locked=True)
+            .values('id')[:batch_size]
+        )
+        claimed = Listing.objects.filter(pk__in=Subquery(due)).update(
+            is_active=False, updated_at=closed_at, closed_at=closed_at,
+        )
+        if not claimed:
+            return []
+        closed = list(
+            Listing.objects
+            .filter(is_active=False, ends_at__lte=now, closed_at=closed_at)
+            .order_by('ends_at')
+            .values_list('id', 'category_id', 'current_price', 'bid_count', 'leading_bid_id')
+        )
+        ids = [row[0] for row in closed]
+        # no bid is accepted after end time, so leading bids are final
+        Bid.objects.filter(pk__in=[row[4] for row in closed if row[4] is not None]).update(is_winner=True)
+
+        for category_id, count in Counter(row[1] for row in closed).items():
+            categories.refresh(category_id, -count)
+        caching.bump_version(caching.CATALOG, *map(caching.listing_version_name, ids))
+        for listing_id, _, current_price, bid_count, _ in closed:
+            events.publish_listing_event(listing_id, 'closed', current_price=current_price, bid_count=bid_count)
+        metrics.LISTINGS_CLOSED.inc(len(ids), reason='expired')
+        return ids
+
+
+def _resolve_proxies(listing_id):
+    """Let proxy bids of listing (`listing_id`) respond to its current price.
+    Only the top proxy (highest max, earliest on ties) could end up leading,
+    so it bids once: runner-up's max (or current price) plus an increment,
+    capped by its own max.
+    Return created bid (or None if top proxy already leads or can't).
+    Listing must be locked (ie. called within a bidding transaction).
+    """
+    current_price, leader_id = (
+        Listing.objects
+        .filter(pk=listing_id)
+        .values_list('current_price', 'leading_bid__user_id')
+        .get()
+    )
+    # top two of a sorted index, whatever number of proxies
+    top = list(ProxyBid.objects.filter(listing_id=listing_id).order_by('-max_price', 'id')[:2])
+    if not top:
+        return None
+    first = top[0]
+    runner_up_max = top[1].max_price if len(top) > 1 else None
+
+    if first.user_id == leader_id:
+        # already leading: only bid again if runner-up could beat current price
+        if runner_up_max is None or runner_up_max <= current_price:
+            return None
+        to_beat = runner_up_max
+    else:
+        if first.max_price <= current_price:
+            return None
+        to_beat = current_price if runner_up_max is None else max(current_price, runner_up_max)
+
+    price = min(first.max_price, to_beat + BID_INCREMENT)
+    metrics.PROXY_BIDS.inc()
+    return Bid.objects.create(listing_id=listing_id, user_id=first.user_id, price=price)
+
+
+def _sync_summary(listing):
+    """Sync caller's `listing` with its new bidding summary
+    and push it to listing viewers.
+    """
+    listing.current_price, listing.bid_count, listing.leading_bid_id, category_id = (
+        Listing.objects
+        .filter(pk=listing.pk)
+        .values_list('current_price', 'bid_count', 'leading_bid_id', 'category_id')
+        .get()
+    )
+    # price range of its category might have moved
+    categories.bid_placed(category_id, listing.current_price)
+    events.publish_listing_event(
+        listing.pk, 'bid',
+        current_price=listing.current_price,
+        bid_count=listing.bid_count,
+    )
+
+
+def next_expiry():
+    """End time of the first active listing to end (or None)."""
+    return (
+        Listing.objects
+        .filter(is_active=True, ends_at__isnull=False)
+        .order_by('ends_at')
+        .values_list('ends_at', flat=True)
+        .first()
+    )
+
+
+def not_ended(now):
+    """Match listings that haven't reached their end time (by `now`)."""
+    return Q(ends_at__isnull=True) | Q(ends_at__gt=now)
+
+
+def _rejection_reason(listing_id, price):
+    """Find out why a bid of `price` on listing (`listing_id`) was rejected."""
+    is_active, ends_at, current_price = (
+        Listing.objects
+        .filter(pk=listing_id)
+        .values_list('is_active', 'ends_at', 'current_price')
+        .get()
+    )
+    if not is_active or (ends_at is not None and ends_at <= timezone.now()):
+        return ListingClosed()
+    return Outbid(price, current_price)
@@ -0,0 +1,104 @@
+"""Page and fragment caching of listing pages.
+
+Cached content is never invalidated by deleting it, instead its key
+includes a version which is bumped whenever underlying rows change
+(see `auctions.signals`), so old entries are just never read again:
+- `catalog` version: listings and categories (index/category pages)
+- `listing:<id>` version: a listing, its bids and comments (listing page)
+
+Versions are bumped both right away and once transaction commits,
+so a page rendered from not yet committed (or rolled back) data
+could never be cached under the latest version.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+
+CATALOG = 'catalog'
+
+
+def listing_version_name(listing_id):
+    return f'listing:{listing_id}'
+
+
+def get_timeout():
+    """Seconds to keep cached pages/fragments (0: caching is disabled)."""
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 0)
+
+
+def get_version(name):
+    """Get current version of `name` (eg. `catalog`)."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        # version could have been evicted
+        # never restart from a number that might have been used before
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(*names):
+    """Invalidate everything cached under current versions of `names`."""
+    def bump():
+        for name in names:
+            try:
+                cache.incr(_version_key(name))
+            except ValueError:
+                cache.set(_version_key(name), time.time_ns(), None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def listing_changed(listing_id, catalog=False):
+    """Invalidate cached pages of listing (`listing_id`)
+    and, if `catalog`, pages listing it too.
+    """
+    names = [listing_version_name(listing_id)]
+    if catalog:
+        names.append(CATALOG)
+    bump_version(*names)
+
+
+def cache_anonymous_page(version_of):
+    """Cache pages rendered for anonymous users
+    keyed by page url and version returned by `version_of(**view_kwargs)`.
+    json variants (`?format=json`) aren't cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = get_timeout()
+            if (
+                not timeout
+                or request.method != 'GET'
+                or request.user.is_authenticated
+                or request.GET.get('format') == 'json'
+            ):
+                return view(request, *args, **kwargs)
+
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = f'auctions:page:{version_of(**kwargs)}:{path_hash}'
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                if hasattr(response, 'render'):
+                    response.render()
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def _version_key(name):
+    return f'auctions:version:{name}'
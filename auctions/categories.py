@@ -0,0 +1,143 @@
+"""Category summaries: active listings count and current price range
+of each category (`CategorySummary`), shown on categories page,
+category pages and nav.
+
+Summaries are kept up to date incrementally, by `refresh`, whenever
+a listing is created or deleted (see auctions.signals) or closed
+(see auctions.bidding): count moves by the change, and price range
+is recomputed by two index seeks, all in one UPDATE.
+Bids never change counts, and rarely price range (see `bid_placed`):
+summary is only touched when they do.
+(Listings edited by admin, eg. moved to another category, aren't tracked:
+`manage.py rebuild_category_summary` recomputes all summaries from scratch.)
+
+All summaries are read at once and cached (see `get_summaries`)
+under `categories` version, bumped on every change
+(so nav, on every page, is served from cache between changes).
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Subquery
+from django.utils.functional import SimpleLazyObject
+
+from . import caching
+from .models import Category, CategorySummary, Listing
+
+
+VERSION = 'categories'
+
+
+def _price(category_id, order):
+    return Subquery(
+        Listing.objects
+        .filter(category_id=category_id, is_active=True)
+        .order_by(order)
+        .values('current_price')[:1]
+    )
+
+
+def refresh(category_id, delta=0):
+    """Add `delta` to active listings count of category (`category_id`)
+    and recompute its price range.
+    """
+    if category_id is None:
+        return
+    updated = CategorySummary.objects.filter(pk=category_id).update(
+        active_listings=F('active_listings') + delta,
+        min_price=_price(category_id, 'current_price'),
+        max_price=_price(category_id, '-current_price'),
+    )
+    if not updated:
+        # summary never built (eg. category predates it)
+        rebuild([category_id])
+    caching.bump_version(VERSION)
+
+
+def bid_placed(category_id, price):
+    """A listing of category (`category_id`) got bid up to `price`:
+    recompute price range of category only if it moved, ie. bid went over max price
+    or listing was the cheapest one (no active listing is left at min price).
+    """
+    if category_id is None:
+        return
+    updated = (
+        CategorySummary.objects
+        .filter(pk=category_id)
+        .filter(
+            Q(max_price__lt=price)
+            | ~Exists(Listing.objects.filter(category_id=category_id, is_active=True, current_price=OuterRef('min_price')))
+        )
+        .update(
+            min_price=_price(category_id, 'current_price'),
+            max_price=_price(category_id, '-current_price'),
+        )
+    )
+    if updated:
+        caching.bump_version(VERSION)
+
+
+def rebuild(category_ids=None):
+    """Recompute summaries of categories (`category_ids`, all by default) from scratch."""
+    categories = Category.objects.all()
+    listings = Listing.objects.filter(is_active=True, category__isnull=False)
+    if category_ids is not None:
+        categories = categories.filter(pk__in=category_ids)
+        listings = listings.filter(category_id__in=category_ids)
+    stats = {
+        row['category']: row
+        for row in (
+            listings
+            .values('category')
+            .annotate(count=Count('id'), min_price=Min('current_price'), max_price=Max('current_price'))
+            .order_by()
+        )
+    }
+    with transaction.atomic():
+        CategorySummary.objects.filter(pk__in=categories.values('pk')).delete()
+        CategorySummary.objects.bulk_create([
+            CategorySummary(
+                category_id=category_id,
+                active_listings=stats.get(category_id, {}).get('count', 0),
+                min_price=stats.get(category_id, {}).get('min_price'),
+                max_price=stats.get(category_id, {}).get('max_price'),
+            )
+            for category_id in categories.values_list('id', flat=True)
+        ])
+    caching.bump_version(VERSION)
+
+
+def get_summaries():
+    """All categories (by name) with their summaries, as dicts
+    (`id`, `name`, `active_listings`, `min_price`, `max_price`).
+    One cached read (one query on a cold cache) whatever number of categories/listings.
+    """
+    key = f'auctions:categories:{caching.get_version(VERSION)}'
+    summaries = cache.get(key)
+    if summaries is None:
+        summaries = [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'active_listings': row['summary__active_listings'] or 0,
+                'min_price': row['summary__min_price'],
+                'max_price': row['summary__max_price'],
+            }
+            for row in Category.objects.order_by('name', 'id').values(
+                'id', 'name', 'summary__active_listings', 'summary__min_price', 'summary__max_price',
+            )
+        ]
+        # never stale: key changes with version
+        cache.set(key, summaries, None)
+    return summaries
+
+
+def get_summary(category_id):
+    """Summary (see `get_summaries`) of category (`category_id`) or None."""
+    return next((summary for summary in get_summaries() if summary['id'] == category_id), None)
+
+
+def nav_categories(request):
+    """Context processor: categories (and counts) shown in nav
+    (read only by templates that use them).
+    """
+    return {'nav_categories': SimpleLazyObject(get_summaries)}
@@ -0,0 +1,27 @@
+"""Per connection database tuning.
+
+`SQLITE_PRAGMAS` setting (pragma: value) is run on every new sqlite
+connection (see commerce/settings_production.py), eg.
+- `journal_mode = WAL`: readers never block writers (nor the other way)
+- `synchronous = NORMAL`: no fsync per commit (only at checkpoints, still safe in WAL mode)
+- `busy_timeout`: ms to wait for a lock before failing with "database is locked"
+- `mmap_size`: bytes of db file read through memory map instead of read() calls
+Connections last for `CONN_MAX_AGE`, so pragmas are only paid once per connection.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if not pragmas or connection.vendor != 'sqlite':
+        return
+    # raw cursor: not a query of any request (not logged nor timed)
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
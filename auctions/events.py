@@ -0,0 +1,151 @@
+"""Real-time listing events (new bids, listing closed).
+
+Events are published to a per-listing channel of a pub/sub broker
+and pushed to browsers as Server-Sent Events by `listing_events`
+(an ASGI app mounted by `commerce.asgi`, see `EVENTS_PATH`).
+
+Broker is pluggable (`EVENTS_BROKER` setting). Default `InProcessBroker`
+only reaches subscribers of the same process, so when running multiple
+(asgi) processes, a broker backed by a shared service is needed.
+A broker has to provide:
+- `publish(channel, event)`: callable from any thread
+- `subscribe(channel)`: return a subscription with async `get()` and `close()`
+"""
+import asyncio
+import json
+import re
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+EVENTS_PATH = re.compile(r'^/listings/(?P<listing_id>\d+)/events$')
+
+# seconds between keep-alive comments sent to idle subscribers
+KEEPALIVE_INTERVAL = 15
+
+
+class Subscription:
+    """Events of one channel queued for one subscriber."""
+    # events kept for a slow subscriber before dropping new ones
+    max_pending = 100
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Pub/sub between threads/event loop of current process."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            # subscribers live in event loop, publishers mostly don't (sync views)
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'auctions.events.InProcessBroker'))()
+    return _broker
+
+
+def listing_channel(listing_id):
+    return f'listing:{listing_id}'
+
+
+def publish_listing_event(listing_id, event_type, **data):
+    """Publish event to subscribers of listing (`listing_id`)
+    once current transaction (if any) commits.
+    """
+    event = {'type': event_type, 'listing_id': listing_id, **data}
+    transaction.on_commit(lambda: get_broker().publish(listing_channel(listing_id), event))
+
+
+def format_event(event):
+    """Encode `event` as a Server-Sent Event."""
+    data = json.dumps(event, default=str)
+    return f'event: {event["type"]}\ndata: {data}\n\n'.encode()
+
+
+async def listing_events(scope, receive, send, listing_id):
+    """ASGI app streaming events of listing (`listing_id`) until client disconnects."""
+    subscription = get_broker().subscribe(listing_channel(listing_id))
+    try:
+        # consume request (no body expected) before waiting for disconnect
+        message = await receive()
+        while message['type'] == 'http.request' and message.get('more_body'):
+            message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while True:
+                next_event = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected},
+                    timeout=KEEPALIVE_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    next_event.cancel()
+                    return
+                if next_event in done:
+                    body = format_event(next_event.result())
+                else:
+                    next_event.cancel()
+                    body = b': keep-alive\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+    finally:
+        subscription.close()
@@ -1,7 +1,29 @@
 from django import forms
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
-from .models import Bid, Comment
+from .models import Bid, Comment, Listing, ProxyBid
+
+
+class NewListingForm(forms.ModelForm):
+    class Meta:
+        model = Listing
+        fields = ['title', 'description', 'img_url', 'price', 'category', 'ends_at']
+        widgets = {
+            'ends_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
+        help_texts = {
+            'ends_at': 'Leave empty to keep listing open until you accept a bid.',
+        }
+
+    def clean_ends_at(self):
+        """validate end time (if any).
+        MUST BE IN THE FUTURE.
+        """
+        data = self.cleaned_data['ends_at']
+        if data is not None and data <= timezone.now():
+            raise ValidationError("End time must be in the future")
+        return data
 
 
 class NewBidForm(forms.ModelForm):
@@ -25,6 +47,28 @@ class NewBidForm(forms.ModelForm):
         return data
 
 
+class MaxBidForm(forms.ModelForm):
+    class Meta:
+        model = ProxyBid
+        fields = ['max_price']
+        labels = {
+            'max_price': 'Max bid (we bid for you, up to it)',
+        }
+
+    def __init__(self, *args, **kwargs):
+        self.max_bid_price = kwargs.pop('max_bid_price')
+        super().__init__(*args, **kwargs)
+
+    def clean_max_price(self):
+        """validate max price.
+        MUST BE GREATER THAN max bid so far.
+        """
+        data = self.cleaned_data['max_price']
+        if data <= self.max_bid_price:
+            raise ValidationError(f"Your max bid (${data}) must be greater than the current max bid of (${self.max_bid_price})")
+        return data
+
+
 class NewCommentForm(forms.ModelForm):
     # trick used to hide field label @form
     # cuz its repetiting (keep saying comment, add comment, leave a comment...)
@@ -33,3 +77,12 @@ class NewCommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ['content']
+
+
+class SearchForm(forms.Form):
+    """search query and filters (submitted as GET params)"""
+    q = forms.CharField(max_length=256, label='')
+    category = forms.IntegerField(required=False)
+    min_price = forms.DecimalField(required=False, min_value=0, max_digits=11, decimal_places=2)
+    max_price = forms.DecimalField(required=False, min_value=0, max_digits=11, decimal_places=2)
+    include_closed = forms.BooleanField(required=False)
@@ -0,0 +1,382 @@
+"""Listing images, proxied (see `image_view`).
+
+Pages never hot-link `listing.img_url`, they link a local url instead
+(`/images/<listing id>/<rendition>/<digest of img_url>`, see `image_url`)
+which serves a rendition of the image:
+- `thumb`: small, for listing cards (index page)
+- `detail`: bigger, for listing page
+
+Remote image is fetched once (by fetcher of `IMAGE_FETCHER` setting,
+could be swapped for a stub locally), resized into renditions
+(by Pillow, if installed; otherwise original is served as is)
+and stored in an on-disk cache (`IMAGE_CACHE_DIR` setting):
+- `blobs/<sha256 of content>`: renditions, content-addressed
+  (same image under several urls is stored once)
+- `refs/<sha256 of url and rendition>`: content type and blob of each url's rendition
+Cache is kept under `IMAGE_CACHE_MAX_BYTES` by evicting least recently used
+files (served files are touched, so mtime is last use).
+
+Url of an image changes with `img_url`, so responses are cached by browsers
+(and any proxy) for good.
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .models import Listing
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+
+# rendition: max (width, height)
+RENDITIONS = {
+    'thumb': (320, 240),
+    'detail': (1024, 768),
+}
+
+# only images browsers render without running anything (no svg)
+# content type: leading bytes of its files
+IMAGE_SIGNATURES = {
+    'image/jpeg': (b'\xff\xd8\xff',),
+    'image/png': (b'\x89PNG\r\n\x1a\n',),
+    'image/gif': (b'GIF87a', b'GIF89a'),
+    'image/webp': (b'RIFF',),
+}
+
+# proxied images never change under their url
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# seconds before retrying a url that couldn't be fetched
+FAILURE_TIMEOUT = 300
+
+
+class ImageError(Exception):
+    """Remote image couldn't be fetched (or isn't an image)."""
+
+
+def url_digest(img_url):
+    """Short digest of `img_url`, part of its proxied urls."""
+    return hashlib.sha256(img_url.encode()).hexdigest()[:16]
+
+
+def image_url(listing, rendition):
+    """Local url of `rendition` of `listing`'s image (or None if it has no image)."""
+    if not listing.img_url:
+        return None
+    return reverse('listing_image', args=(listing.id, rendition, url_digest(listing.img_url)))
+
+
+def sniff(data):
+    """Content type of image `data` (by its leading bytes) or None if not a known image."""
+    for content_type, signatures in IMAGE_SIGNATURES.items():
+        if data.startswith(signatures):
+            if content_type == 'image/webp' and data[8:12] != b'WEBP':
+                continue
+            return content_type
+    return None
+
+
+def public_address(hostname, port):
+    """An address of `hostname` to connect to; raise `ImageError`
+    unless all of its addresses are public (never let users point server at internal hosts).
+    """
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)]
+    except (socket.gaierror, UnicodeError) as e:
+        raise ImageError(f'unknown host: {hostname}') from e
+    if not addresses or any(not ipaddress.ip_address(address.split('%')[0]).is_global for address in addresses):
+        raise ImageError(f'host not allowed: {hostname}')
+    return addresses[0]
+
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+    """Connection to `address` (checked by `public_address`) instead of resolving host again,
+    which could resolve elsewhere by then (dns rebinding).
+    Host header (and tls certificate check, for https) still go by host.
+    """
+    address = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection, PinnedHTTPConnection):
+    pass
+
+
+class PublicHTTPHandler(urllib.request.AbstractHTTPHandler):
+    """http(s) handler connecting to public addresses only (see `PinnedHTTPConnection`).
+    Redirects are opened by it too, so every hop is checked.
+    """
+    def http_open(self, req):
+        return self.do_open(self.connection(PinnedHTTPConnection, req), req)
+
+    def https_open(self, req):
+        return self.do_open(self.connection(PinnedHTTPSConnection, req), req, context=ssl.create_default_context())
+
+    http_request = https_request = urllib.request.AbstractHTTPHandler.do_request_
+
+    def connection(self, connection_class, req):
+        parts = urllib.parse.urlsplit(req.full_url)
+        address = public_address(parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+
+        def connect(*args, **kwargs):
+            connection = connection_class(*args, **kwargs)
+            connection.address = address
+            return connection
+        return connect
+
+
+class RedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow a few redirects, to http(s) urls only."""
+    max_redirections = 3
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urllib.parse.urlsplit(newurl).scheme not in ('http', 'https'):
+            raise ImageError(f'unsupported redirect: {newurl}')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def build_opener():
+    """Opener of image urls: no proxies, no schemes but http(s), public hosts only."""
+    opener = urllib.request.OpenerDirector()
+    for handler in [
+        PublicHTTPHandler(),
+        RedirectHandler(),
+        urllib.request.HTTPErrorProcessor(),
+        urllib.request.HTTPDefaultErrorHandler(),
+        urllib.request.UnknownHandler(),
+    ]:
+        opener.add_handler(handler)
+    return opener
+
+
+def fetch_url(url):
+    """Default fetcher: GET `url` (http/https only, public hosts only, redirects included).
+    Return image bytes; raise `ImageError` if it can't.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageError(f'unsupported url: {url}')
+
+    max_bytes = settings.IMAGE_MAX_BYTES
+    request = urllib.request.Request(url, headers={'User-Agent': 'auctions-image-proxy'})
+    try:
+        with build_opener().open(request, timeout=settings.IMAGE_FETCH_TIMEOUT) as response:
+            data = response.read(max_bytes + 1)
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        raise ImageError(f'could not fetch {url}: {e}') from e
+    if len(data) > max_bytes:
+        raise ImageError(f'image too big: {url}')
+    return data
+
+
+def resize(data, rendition):
+    """Fit image `data` within `rendition` size.
+    Return (bytes, content type); as is without Pillow.
+    """
+    content_type = sniff(data)
+    if content_type is None:
+        raise ImageError('not an image')
+    if Image is None:
+        return data, content_type
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail(RENDITIONS[rendition])
+        out = io.BytesIO()
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image.save(out, 'PNG', optimize=True)
+            return out.getvalue(), 'image/png'
+        image.convert('RGB').save(out, 'JPEG', quality=85, optimize=True)
+        return out.getvalue(), 'image/jpeg'
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageError(f'could not resize image: {e}') from e
+
+
+class ImageCache:
+    """Content-addressed on-disk cache of renditions, LRU evicted (see module docstring)."""
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        # bytes on disk (as of last scan, plus what was written since)
+        self.size = None
+        self.lock = threading.Lock()
+        # one fetch per url at a time (of this process)
+        self.fetching = {}
+
+    def ref_path(self, key):
+        return os.path.join(self.root, 'refs', key[:2], key)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    def lookup(self, key):
+        """(blob path, content type) of `key` (or None if not cached)."""
+        try:
+            with open(self.ref_path(key)) as f:
+                digest, content_type = f.read().split()
+        except (OSError, ValueError):
+            return None
+        path = self.blob_path(digest)
+        try:
+            # last use (for LRU)
+            os.utime(path)
+            os.utime(self.ref_path(key))
+        except OSError:
+            # blob got evicted
+            return None
+        return path, content_type
+
+    def open_blob(self, cached):
+        """Open blob of `cached` (blob path, content type, as returned by `lookup`/`store`).
+        Return (file, content type) or None if it got evicted since
+        (eg. by another process: once open, file stays readable even if evicted).
+        """
+        if cached is None:
+            return None
+        path, content_type = cached
+        try:
+            return open(path, 'rb'), content_type
+        except FileNotFoundError:
+            return None
+
+    def store(self, key, data, content_type):
+        """Store `data` as rendition `key`. Return (blob path, content type)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        written = 0
+        if not os.path.exists(path):
+            written += self.write(path, data)
+        written += self.write(self.ref_path(key), f'{digest} {content_type}'.encode())
+        with self.lock:
+            if self.size is not None:
+                self.size += written
+            over = self.size is None or self.size > self.max_bytes
+        if over:
+            self.evict()
+        return path, content_type
+
+    def write(self, path, data):
+        # atomic: readers (other processes too) never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def evict(self):
+        """Remove least recently used files until cache is under 90% of max size."""
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        size = sum(file[1] for file in files)
+        if size > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for _, file_size, path in sorted(files):
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= file_size
+        with self.lock:
+            self.size = size
+
+    def get(self, img_url, rendition):
+        """(open file, content type) of `rendition` of `img_url`, fetched if not cached.
+        Raise `ImageError` if it couldn't be fetched.
+        """
+        key = hashlib.sha256(f'{rendition} {img_url}'.encode()).hexdigest()
+        cached = self.open_blob(self.lookup(key))
+        if cached is not None:
+            return cached
+        with self.lock:
+            lock = self.fetching.setdefault(img_url, threading.Lock())
+        with lock:
+            try:
+                # fetched by another thread meanwhile?
+                cached = self.open_blob(self.lookup(key))
+                if cached is not None:
+                    return cached
+                failure_key = f'image-failed:{key}'
+                if cache.get(failure_key):
+                    raise ImageError(f'recently failed: {img_url}')
+                try:
+                    data = import_string(settings.IMAGE_FETCHER)(img_url)
+                    # all renditions from one fetch
+                    renditions = {name: resize(data, name) for name in RENDITIONS}
+                except ImageError:
+                    cache.set(failure_key, True, FAILURE_TIMEOUT)
+                    raise
+                for name, (rendition_data, content_type) in renditions.items():
+                    stored = self.store(
+                        hashlib.sha256(f'{name} {img_url}'.encode()).hexdigest(), rendition_data, content_type,
+                    )
+                    if name == rendition:
+                        # (already evicted by another process: served from memory)
+                        result = self.open_blob(stored) or (io.BytesIO(rendition_data), content_type)
+                return result
+            finally:
+                with self.lock:
+                    self.fetching.pop(img_url, None)
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    root, max_bytes = settings.IMAGE_CACHE_DIR, settings.IMAGE_CACHE_MAX_BYTES
+    if _cache is None or (_cache.root, _cache.max_bytes) != (root, max_bytes):
+        _cache = ImageCache(root, max_bytes)
+    return _cache
+
+
+def image_view(request, listing_id, rendition, digest):
+    """Serve `rendition` of image of listing (`listing_id`).
+    Links to an older image of listing (`digest` of another url) get redirected.
+    """
+    if rendition not in RENDITIONS:
+        raise Http404()
+    img_url = (
+        get_object_or_404(Listing.objects.exclude(img_url='').only('img_url'), pk=listing_id)
+        .img_url
+    )
+    if digest != url_digest(img_url):
+        return HttpResponseRedirect(reverse('listing_image', args=(listing_id, rendition, url_digest(img_url))))
+    try:
+        file, content_type = get_cache().get(img_url, rendition)
+    except ImageError:
+        response = HttpResponseRedirect(static('auctions/images/notfound.png'))
+        response['Cache-Control'] = f'public, max-age={FAILURE_TIMEOUT}'
+        return response
+    response = FileResponse(file, content_type=content_type)
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
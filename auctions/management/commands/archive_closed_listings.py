@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Move bids and comments of listings closed for a while into compressed archive rows (in batches). '
+        'Listing pages and api still show them (read from archive).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='archive listings closed more than this many days ago',
+        )
+        parser.add_argument('--batch-size', type=int, default=archive.ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        archived = 0
+        while True:
+            ids = archive.archive_closed_listings(now, options['days'], options['batch_size'])
+            archived += len(ids)
+            if len(ids) < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'{archived} listing(s) archived.'))
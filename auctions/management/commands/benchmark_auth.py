@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from auctions.models import Category, Listing, User
+
+
+# (session backend, auth backend) compared
+CONFIGURATIONS = {
+    'db sessions, uncached users': ('db', 'django.contrib.auth.backends.ModelBackend'),
+    'cached_db sessions, cached users': ('cached_db', 'auctions.auth.CachedModelBackend'),
+    'signed cookies, cached users': ('signed_cookies', 'auctions.auth.CachedModelBackend'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare per request query floor (and latency) of logged in pages '
+        'with each session backend, with and without cached users, '
+        'against a throwaway (test) db.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='requests per configuration')
+        parser.add_argument('--path', default='/categories', help='logged in page requested')
+
+    def handle(self, *args, **options):
+        # requests are made by test client (allowed hosts... as in tests)
+        setup_test_environment()
+        # never touch real db
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = User.objects.create_user('benchmark', password='benchmark')
+            category = Category.objects.create(name='benchmark')
+            Listing.objects.create(
+                owner=user, category=category, title='benchmark listing', description='benchmark listing', price=10,
+            )
+            results = {
+                label: self.measure(session_backend, auth_backend, options['path'], options['requests'])
+                for label, (session_backend, auth_backend) in CONFIGURATIONS.items()
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f'{"configuration":<36}{"queries/request":>16}{"median ms":>12}')
+        for label, (queries, ms) in results.items():
+            self.stdout.write(f'{label:<36}{queries:>16.2f}{ms:>12.3f}')
+
+    def measure(self, session_backend, auth_backend, path, requests):
+        """(queries per request, median ms) of `requests` logged in requests to `path`."""
+        with override_settings(
+            SESSION_ENGINE=f'django.contrib.sessions.backends.{session_backend}',
+            AUTHENTICATION_BACKENDS=[auth_backend],
+            # rest of page from cache, so that only session/user loading is left
+            WATCHLIST_CACHE_TIMEOUT=60,
+        ):
+            cache.clear()
+            client = Client()
+            client.login(username='benchmark', password='benchmark')
+            # warm up (and fill caches)
+            client.get(path)
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    client.get(path)
+                    timings.append((time.perf_counter() - start) * 1000)
+        return len(queries) / requests, statistics.median(timings)
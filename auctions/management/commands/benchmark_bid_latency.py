@@ -0,0 +1,133 @@
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import override_settings
+
+from auctions import bidding
+from auctions.models import Listing, User
+from auctions.seeding import Seeder
+
+
+# sqlite profiles compared: (pragmas, reuse connections?)
+PROFILES = {
+    # django defaults: rollback journal, a connection per request
+    'default': ({'journal_mode': 'DELETE', 'synchronous': 'FULL'}, False),
+    # as in commerce/settings_production.py
+    'production': (
+        {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000, 'mmap_size': 256 * 1024 * 1024},
+        True,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway (test) db, then place bids one after another while reader threads '
+        'keep querying listing pages, and report bid latency (and read throughput) '
+        'of each sqlite profile (or of configured db, for other dbs).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=2000)
+        parser.add_argument('--readers', type=int, default=4, help='reader threads')
+        parser.add_argument('--bids', type=int, default=300, help='bids placed per profile')
+        parser.add_argument('--profiles', default=','.join(PROFILES), help='comma separated sqlite profiles')
+
+    def handle(self, *args, **options):
+        # never touch real db
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            Seeder().seed(users=100, categories=10, listings=options['listings'], closed_ratio=0)
+            if connection.vendor == 'sqlite':
+                profiles = {name: PROFILES[name] for name in options['profiles'].split(',')}
+            else:
+                profiles = {connection.vendor: ({}, True)}
+            results = {
+                name: self.measure(pragmas, reuse, options['readers'], options['bids'])
+                for name, (pragmas, reuse) in profiles.items()
+            }
+        finally:
+            connection.close()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f'{"profile":<12}{"bids":>6}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}{"reads/s":>10}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<12}{result["bids"]:>6}{result["errors"]:>8}'
+                f'{result["p50"]:>10.2f}{result["p95"]:>10.2f}{result["max"]:>10.2f}{result["reads"]:>10.0f}'
+            )
+
+    def measure(self, pragmas, reuse, readers, bids):
+        """Bid latency (ms) and read throughput with `readers` threads reading meanwhile."""
+        # new connections (of every thread) get profile's pragmas
+        connection.close()
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            listing_ids = list(Listing.objects.filter(is_active=True).values_list('id', flat=True))
+            user_ids = list(User.objects.values_list('id', flat=True))
+            stop = threading.Event()
+            reads = [0] * readers
+            threads = [
+                threading.Thread(target=self.read, args=(i, listing_ids, reuse, stop, reads))
+                for i in range(readers)
+            ]
+            for thread in threads:
+                thread.start()
+
+            rng = random.Random(0)
+            timings, errors = [], 0
+            started = time.perf_counter()
+            try:
+                for _ in range(bids):
+                    listing = Listing.objects.only('id', 'owner_id', 'current_price').get(pk=rng.choice(listing_ids))
+                    # (anyone but owner)
+                    user = User(id=next(user_id for user_id in rng.sample(user_ids, 2) if user_id != listing.owner_id))
+                    start = time.perf_counter()
+                    try:
+                        bidding.place_bid(listing, user, listing.current_price + 1)
+                    except (OperationalError, bidding.BidError):
+                        errors += 1
+                    else:
+                        timings.append((time.perf_counter() - start) * 1000)
+                    if not reuse:
+                        connection.close()
+            finally:
+                elapsed = time.perf_counter() - started
+                stop.set()
+                for thread in threads:
+                    thread.join()
+                connection.close()
+
+        timings.sort()
+        return {
+            'bids': len(timings),
+            'errors': errors,
+            'p50': statistics.median(timings) if timings else 0,
+            'p95': timings[int(len(timings) * 0.95)] if timings else 0,
+            'max': timings[-1] if timings else 0,
+            'reads': sum(reads) / elapsed,
+        }
+
+    def read(self, index, listing_ids, reuse, stop, reads):
+        """Query like listing pages do, until `stop`."""
+        rng = random.Random(index)
+        try:
+            while not stop.is_set():
+                list(Listing.objects.filter(is_active=True).order_by('-id')[:20])
+                listing = Listing.objects.select_related('leading_bid', 'owner', 'category').get(
+                    pk=rng.choice(listing_ids),
+                )
+                list(listing.comments.select_related('user').order_by('-id')[:20])
+                reads[index] += 1
+                if not reuse:
+                    connection.close()
+        except OperationalError:
+            # (counted by writer's errors/latency, readers just stop)
+            pass
+        finally:
+            connection.close()
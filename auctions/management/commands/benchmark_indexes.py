@@ -0,0 +1,129 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from auctions.models import Bid, Category, Listing, User
+from auctions.pagination import PAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway (test) db and report query plans and timings '
+        'of hot listing/bid queries without and with indexes of auctions models.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--bids', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=20, help='runs per query (median is reported)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        # never touch real db
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(options['listings'], options['bids'], options['batch_size'])
+            queries = self.hot_queries()
+
+            self.drop_indexes()
+            before = self.measure(queries, options['repeat'])
+            self.create_indexes()
+            after = self.measure(queries, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for name in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, results in (('before', before), ('after', after)):
+                ms, plan = results[name]
+                self.stdout.write(f'  {label:<6} {ms:9.3f} ms  {plan}')
+
+    def seed(self, listings_count, bids_count, batch_size):
+        rng = random.Random(0)
+        User.objects.bulk_create(User(username=f'user{i}') for i in range(100))
+        Category.objects.bulk_create(Category(name=f'category{i}') for i in range(20))
+        # bulk_create doesn't set ids on all backends, so reload
+        users = list(User.objects.all())
+        categories = list(Category.objects.all())
+
+        for start in range(0, listings_count, batch_size):
+            Listing.objects.bulk_create(
+                Listing(
+                    title=f'listing{i}',
+                    description='',
+                    price=Decimal(10),
+                    current_price=Decimal(10),
+                    owner=rng.choice(users),
+                    category=rng.choice(categories),
+                    # most listings on a long running site are closed
+                    is_active=rng.random() < 0.2,
+                )
+                for i in range(start, min(start + batch_size, listings_count))
+            )
+
+        listing_ids = list(Listing.objects.values_list('id', flat=True))
+        for start in range(0, bids_count, batch_size):
+            Bid.objects.bulk_create(
+                Bid(listing_id=rng.choice(listing_ids), user=rng.choice(users), price=Decimal(11 + i))
+                for i in range(start, min(start + batch_size, bids_count))
+            )
+
+        self.sample_listing = Listing.objects.filter(is_active=True).order_by('?').first()
+        self.middle_id = listing_ids[len(listing_ids) // 2]
+
+    def hot_queries(self):
+        """Querysets run by views (one page worth of rows)."""
+        listing = self.sample_listing
+        active = Listing.objects.filter(is_active=True)
+        return {
+            'index (first page)': active.order_by('-id')[:PAGE_SIZE + 1],
+            'index (deep page)': active.filter(id__lt=self.middle_id).order_by('-id')[:PAGE_SIZE + 1],
+            'category page': active.filter(category_id=listing.category_id).order_by('-id')[:PAGE_SIZE + 1],
+            'profile page': active.filter(owner_id=listing.owner_id).order_by('-id')[:PAGE_SIZE + 1],
+            'last bid of listing': Bid.objects.filter(listing_id=listing.id).order_by('-id')[:1],
+        }
+
+    def measure(self, queries, repeat):
+        """Run each query `repeat` times.
+        Return {name: (median ms, query plan)}.
+        """
+        results = {}
+        for name, queryset in queries.items():
+            # time db only (not building model instances)
+            sql, params = queryset.query.sql_with_params()
+            timings = []
+            with connection.cursor() as cursor:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - start) * 1000)
+            plan = ' | '.join(line.strip() for line in queryset.explain().splitlines())
+            results[name] = (statistics.median(timings), plan)
+        return results
+
+    def indexes(self):
+        for model in (Listing, Bid):
+            for index in model._meta.indexes:
+                yield model, index
+
+    def drop_indexes(self):
+        with connection.schema_editor() as schema_editor:
+            for model, index in self.indexes():
+                schema_editor.remove_index(model, index)
+        self.analyze()
+
+    def create_indexes(self):
+        with connection.schema_editor() as schema_editor:
+            for model, index in self.indexes():
+                schema_editor.add_index(model, index)
+        self.analyze()
+
+    def analyze(self):
+        # refresh planner statistics
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
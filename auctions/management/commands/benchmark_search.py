@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from auctions import search
+from auctions.models import Category, Listing, User
+from auctions.seeding import WORDS, random_text
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway (test) db with listings and compare search latency '
+        'of fts5 and inverted index backends with a naive icontains scan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=5, help='runs per query (median is reported)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--backends', default='fts5,inverted,naive',
+            help='comma separated backends to benchmark (naive: icontains scan)',
+        )
+
+    def handle(self, *args, **options):
+        backends = options['backends'].split(',')
+        queries = {
+            'common word': WORDS[0],
+            'rare word': WORDS[5000],
+            'two words': f'{WORDS[3]} {WORDS[40]}',
+            'prefix': WORDS[100][:4],
+        }
+
+        # never touch real db
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            started = time.perf_counter()
+            self.seed(options['listings'], options['batch_size'])
+            self.stdout.write(f'seeded {options["listings"]} listings in {time.perf_counter() - started:.1f}s')
+
+            results = {}
+            for name in backends:
+                if name == 'naive':
+                    run = self.naive_search
+                else:
+                    backend = {'fts5': search.FTS5Backend, 'inverted': search.InvertedIndexBackend}[name]()
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        backend.rebuild()
+                    self.stdout.write(f'built {name} index in {time.perf_counter() - started:.1f}s')
+                    run = self.backend_search(backend)
+                results[name] = {
+                    label: self.measure(run, query, options['repeat'])
+                    for label, query in queries.items()
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f'{"query":<14}' + ''.join(f'{name + " ms":>14}' for name in backends))
+        for label in queries:
+            self.stdout.write(f'{label:<14}' + ''.join(f'{results[name][label]:>14.2f}' for name in backends))
+
+    def seed(self, count, batch_size):
+        rng = random.Random(0)
+        owner = User.objects.create(username='owner')
+        Category.objects.bulk_create(Category(name=WORDS[i]) for i in range(20))
+        category_ids = list(Category.objects.values_list('id', flat=True))
+
+        for start in range(0, count, batch_size):
+            Listing.objects.bulk_create(
+                Listing(
+                    title=random_text(rng, 4),
+                    description=random_text(rng, 30),
+                    price=Decimal(10),
+                    current_price=Decimal(rng.randint(10, 1000)),
+                    owner=owner,
+                    category_id=rng.choice(category_ids),
+                    is_active=rng.random() < 0.5,
+                )
+                for _ in range(start, min(start + batch_size, count))
+            )
+
+    def backend_search(self, backend):
+        def run(query):
+            return backend.search(search.tokenize(query), [('is_active', '=', True)], search.MAX_RESULTS)
+        return run
+
+    def naive_search(self, query):
+        matching = Q(is_active=True)
+        for term in search.tokenize(query):
+            matching &= Q(title__icontains=term) | Q(description__icontains=term)
+        return list(Listing.objects.filter(matching).order_by('-id').values_list('id', flat=True)[:search.MAX_RESULTS])
+
+    def measure(self, run, query, repeat):
+        """Median ms of running `query` `repeat` times."""
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from auctions import benchmarking
+from auctions.seeding import Seeder
+
+
+BASELINE_PATH = Path(__file__).resolve().parents[2] / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every url (wall time, db queries and time, template render time, peak memory) '
+        'against throwaway dbs seeded at several sizes, and compare with a baseline. '
+        'Exits with an error if any url regressed. '
+        'NOTE: timings depend on machine, so (re)record baseline on same machine you compare on.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='100,10000',
+            help='comma separated number of listings of each dataset (users, bids... scale with them)',
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='runs per url (best is reported)')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH), help='baseline json to compare with')
+        parser.add_argument('--update-baseline', action='store_true', help='save results as baseline instead')
+        parser.add_argument('--output', help='also save results (json) to this file')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        results = {}
+        # requests are made by test client (allowed hosts, outbox... as in tests)
+        setup_test_environment()
+        try:
+            for size in sizes:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{size} listings'))
+                results[str(size)] = self.benchmark(size, options['repeat'])
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline saved to {baseline_path}.'))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(f'No baseline at {baseline_path} (record one with --update-baseline).')
+            return
+
+        changes = benchmarking.compare(json.loads(baseline_path.read_text()), results)
+        regressions = [change for change in changes if change[-1]]
+        if changes:
+            self.stdout.write(self.style.MIGRATE_HEADING('Changes from baseline'))
+        for dataset, label, metric, old, new, is_regression in changes:
+            if old is None:
+                self.stdout.write(self.style.WARNING(f'  {dataset:>8} {label:<28} not in baseline (new url?)'))
+                continue
+            line = f'  {dataset:>8} {label:<28} {metric:<10} {old:>10} -> {new:<10}'
+            self.stdout.write(self.style.ERROR(line + ' REGRESSION') if is_regression else line)
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) from baseline.')
+        self.stdout.write(self.style.SUCCESS('No regressions from baseline.'))
+
+    def benchmark(self, size, repeat):
+        """Seed a throwaway db with `size` listings and benchmark all urls against it."""
+        # never touch real db
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            Seeder().seed(
+                users=max(20, size // 10),
+                listings=size,
+                bids_per_listing=5,
+                comments_per_listing=3,
+                watched_per_user=10,
+            )
+            self.stdout.write(
+                f'  {"url":<28} {"status":>6} {"wall ms":>9} {"queries":>7} {"db ms":>9} '
+                f'{"render ms":>9} {"peak kb":>9}'
+            )
+            return benchmarking.run_benchmarks(repeat, log=self.log)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def log(self, label, metrics):
+        self.stdout.write(
+            f'  {label:<28} {metrics["status"]:>6} {metrics["wall_ms"]:>9.2f} {metrics["queries"]:>7} '
+            f'{metrics["db_ms"]:>9.2f} {metrics["render_ms"]:>9.2f} {metrics["peak_kb"]:>9.1f}'
+        )
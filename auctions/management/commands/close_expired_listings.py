@@ -0,0 +1,67 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from auctions import bidding
+
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = (
+        'Close listings whose end time has passed (in batches) and mark their winning bids. '
+        'Runs once, or keeps running as a worker with --loop.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=bidding.EXPIRY_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='keep closing listings as they expire')
+        parser.add_argument(
+            '--max-sleep', type=float, default=5.0,
+            help='max seconds a worker waits before checking for due listings again',
+        )
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            closed = self.close_due(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{closed} listing(s) closed.'))
+            return
+
+        try:
+            while True:
+                try:
+                    closed = self.close_due(options['batch_size'])
+                except DatabaseError:
+                    # eg. db busy with bids: worker must outlive it, due listings are retried
+                    logger.warning('closing expired listings failed, retrying', exc_info=True)
+                    close_old_connections()
+                    time.sleep(options['max_sleep'])
+                    continue
+                if closed:
+                    self.stdout.write(f'{timezone.now():%Y-%m-%d %H:%M:%S} {closed} listing(s) closed.')
+                time.sleep(self.seconds_until_next_expiry(options['max_sleep']))
+        except KeyboardInterrupt:
+            pass
+
+    def close_due(self, batch_size):
+        """Close all listings due by now. Return how many were closed."""
+        now = timezone.now()
+        closed = 0
+        while True:
+            ids = bidding.close_expired_listings(now, batch_size)
+            closed += len(ids)
+            if len(ids) < batch_size:
+                return closed
+
+    def seconds_until_next_expiry(self, max_sleep):
+        """Sleep until first listing ends (one index lookup), not polling all the time,
+        but wake up at least every `max_sleep` seconds
+        (for listings created meanwhile that end sooner).
+        """
+        ends_at = bidding.next_expiry()
+        if ends_at is None:
+            return max_sleep
+        return min(max(0.0, (ends_at - timezone.now()).total_seconds()), max_sleep)
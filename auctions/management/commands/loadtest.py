@@ -0,0 +1,85 @@
+import math
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile (`q` in 0-100) of already sorted values."""
+    if not sorted_values:
+        return math.nan
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def fetch(url, timeout):
+    """GET `url`. Return (latency in seconds, ok?)."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test running servers and report requests/sec and latency percentiles per path. '
+        'eg. compare wsgi and asgi by running both against same db:\n'
+        '  python manage.py runserver 8000\n'
+        '  uvicorn commerce.asgi:application --port 8001 --workers 1\n'
+        '  python manage.py loadtest --target wsgi=http://127.0.0.1:8000 '
+        '--target asgi=http://127.0.0.1:8001 --path /async/ --path /async/listings/1'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='NAME=BASE_URL of a server to test (repeat to compare servers)',
+        )
+        parser.add_argument('--path', action='append', help='path to request (repeatable, default: /)')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=500, help='requests per path per target')
+        parser.add_argument('--warmup', type=int, default=10, help='requests per path before measuring')
+        parser.add_argument('--timeout', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, base_url = target.partition('=')
+            if not sep:
+                raise CommandError(f'target must be NAME=BASE_URL, got: {target}')
+            targets.append((name, base_url.rstrip('/')))
+        paths = options['path'] or ['/']
+
+        self.stdout.write(f'{"target":<10} {"path":<30} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}')
+        for path in paths:
+            for name, base_url in targets:
+                stats = self.run(base_url + path, options)
+                self.stdout.write(
+                    f'{name:<10} {path:<30} {stats["rps"]:>9.1f} '
+                    f'{stats["p50"] * 1000:>9.2f} {stats["p99"] * 1000:>9.2f} {stats["errors"]:>7}'
+                )
+
+    def run(self, url, options):
+        """Request `url` concurrently. Return throughput and latency stats."""
+        timeout = options['timeout']
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(lambda _: fetch(url, timeout), range(options['warmup'])))
+
+            start = time.perf_counter()
+            results = list(pool.map(lambda _: fetch(url, timeout), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            'rps': len(results) / elapsed,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99),
+            'errors': sum(not ok for _, ok in results),
+        }
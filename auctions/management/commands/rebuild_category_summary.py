@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from auctions import categories
+
+
+class Command(BaseCommand):
+    help = 'Rebuild category summaries (active listings count, price range) from scratch.'
+
+    def handle(self, *args, **options):
+        categories.rebuild()
+        self.stdout.write(self.style.SUCCESS('Category summaries rebuilt.'))
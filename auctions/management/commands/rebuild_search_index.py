@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from auctions import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search index of listings from scratch.'
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index ({backend.name}) rebuilt.'))
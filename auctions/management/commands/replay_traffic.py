@@ -0,0 +1,173 @@
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.models import Category, Listing
+from auctions.seeding import SEED_PASSWORD, WORDS
+
+from .loadtest import percentile
+
+
+# share of each action in traffic (browsing dominates, writes are rare)
+DEFAULT_MIX = 'browse=40,category=15,view=30,search=5,bid=5,watch=5'
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Time redirecting responses themselves (eg. after watching a listing)
+    not the pages they redirect to.
+    """
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    """A logged in user (own session) of server at `base_url`."""
+    def __init__(self, base_url, username, timeout):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect())
+        status, body = self.request('/login')
+        match = CSRF_TOKEN.search(body)
+        if status != 200 or match is None:
+            raise CommandError(f'could not load login page of {base_url}')
+        status, _ = self.request('/login', {'username': username, 'password': SEED_PASSWORD}, match.group(1))
+        if status != 302:
+            raise CommandError(f'could not login as {username} (was db seeded with `manage.py seed_data`?)')
+
+    def request(self, path, data=None, csrf_token=None):
+        """GET (or POST `data` to) `path`. Return (status, body); status is 0 on network errors."""
+        if data is not None:
+            # csrf cookie (rotated on login) is a valid token too
+            csrf_token = csrf_token or next(cookie.value for cookie in self.cookies if cookie.name == 'csrftoken')
+            data = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': csrf_token}).encode()
+        request = urllib.request.Request(self.base_url + path, data=data)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, ''
+        except (urllib.error.URLError, OSError):
+            return 0, ''
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a realistic traffic mix (browse, view listing, search, bid, watch...) '
+        'of logged in users against a running server using same db '
+        '(seeded by `manage.py seed_data`), and report throughput and latency percentiles per action. eg.\n'
+        '  python manage.py seed_data --listings 100000\n'
+        '  python manage.py runserver 8000\n'
+        '  python manage.py replay_traffic --target http://127.0.0.1:8000 --mix browse=50,view=40,bid=10'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', required=True, help='base url of server')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'ACTION=WEIGHT,... (default: {DEFAULT_MIX})')
+        parser.add_argument('--users', type=int, default=16, help='concurrent virtual users')
+        parser.add_argument('--requests', type=int, default=2000, help='total requests')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--timeout', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        self.rng = random.Random(options['seed'])
+        self.rng_lock = threading.Lock()
+        # what's there to browse (sampled once, from same db as server)
+        self.listing_ids = list(
+            Listing.objects.filter(is_active=True).order_by('?').values_list('id', flat=True)[:10000]
+        )
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        if not self.listing_ids:
+            raise CommandError('no active listings (seed db first with `manage.py seed_data`)')
+
+        base_url = options['target'].rstrip('/')
+        usernames = [f'user{i}' for i in range(options['users'])]
+        with ThreadPoolExecutor(max_workers=options['users']) as pool:
+            users = list(pool.map(lambda username: VirtualUser(base_url, username, options['timeout']), usernames))
+
+            actions = self.choices(list(mix), list(mix.values()), options['requests'])
+            # each user runs its share of actions one after another (like a browser)
+            start = time.perf_counter()
+            results = pool.map(
+                lambda i: [self.run(users[i], action) for action in actions[i::len(users)]],
+                range(len(users)),
+            )
+            results = [result for user_results in results for result in user_results]
+            elapsed = time.perf_counter() - start
+
+        self.report(mix, results, elapsed)
+
+    def parse_mix(self, mix):
+        weights = {}
+        for part in mix.split(','):
+            action, sep, weight = part.partition('=')
+            if not sep or not hasattr(self, f'do_{action}'):
+                raise CommandError(f'invalid mix entry: {part}')
+            weights[action] = float(weight)
+        return weights
+
+    def choices(self, population, weights=None, k=1):
+        # shared by all threads
+        with self.rng_lock:
+            return self.rng.choices(population, weights, k=k)
+
+    def run(self, user, action):
+        """Run `action` as `user`. Return (action, latency in seconds, status)."""
+        path, data = getattr(self, f'do_{action}')()
+        start = time.perf_counter()
+        status, _ = user.request(path, data)
+        return action, time.perf_counter() - start, status
+
+    # actions: each returns (path, POST data or None)
+
+    def do_browse(self):
+        return '/', None
+
+    def do_category(self):
+        return f'/categories/{self.choices(self.category_ids)[0]}', None
+
+    def do_view(self):
+        return f'/listings/{self.choices(self.listing_ids)[0]}', None
+
+    def do_search(self):
+        # users search for (mostly) common words
+        return f'/search?q={self.choices(WORDS[:500])[0]}', None
+
+    def do_bid(self):
+        listing_id = self.choices(self.listing_ids)[0]
+        listing = Listing.objects.only('current_price').get(pk=listing_id)
+        price = listing.current_price + self.choices(range(1, 20))[0]
+        return f'/listings/{listing_id}/bid', {'price': price}
+
+    def do_watch(self):
+        return f'/listings/{self.choices(self.listing_ids)[0]}/watch', {}
+
+    def report(self, mix, results, elapsed):
+        """Per action: throughput, latency percentiles,
+        rejected requests (4xx, eg. outbid or already watched) and errors (5xx, network).
+        """
+        self.stdout.write(
+            f'{"action":<10} {"requests":>9} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} '
+            f'{"p99 ms":>9} {"rejected":>9} {"errors":>7}'
+        )
+        for action in [*mix, 'total']:
+            rows = [row for row in results if action == 'total' or row[0] == action]
+            latencies = sorted(latency for _, latency, _ in rows)
+            rejected = sum(400 <= status < 500 for _, _, status in rows)
+            errors = sum(status == 0 or status >= 500 for _, _, status in rows)
+            self.stdout.write(
+                f'{action:<10} {len(rows):>9} {len(rows) / elapsed:>9.1f} '
+                f'{percentile(latencies, 50) * 1000:>9.2f} {percentile(latencies, 95) * 1000:>9.2f} '
+                f'{percentile(latencies, 99) * 1000:>9.2f} {rejected:>9} {errors:>7}'
+            )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.seeding import SEED_PASSWORD, Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed db with users, categories, listings, bids, comments and watchlists at any scale '
+        '(eg. --listings 1000000), to reproduce production sized data locally. '
+        f'Seeded users are named user<n> and share password "{SEED_PASSWORD}".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--listings', type=int, default=10000)
+        parser.add_argument('--bids-per-listing', type=int, default=5, help='on average')
+        parser.add_argument('--comments-per-listing', type=int, default=2, help='on average')
+        parser.add_argument('--watched-per-user', type=int, default=10, help='on average')
+        parser.add_argument('--closed-ratio', type=float, default=0.5, help='share of closed listings')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='random seed (same seed, same data)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def log(message):
+            self.stdout.write(f'[{time.perf_counter() - started:7.1f}s] {message}')
+
+        seeder = Seeder(batch_size=options['batch_size'], seed=options['seed'], log=log)
+        counts = seeder.seed(
+            users=options['users'],
+            categories=options['categories'],
+            listings=options['listings'],
+            bids_per_listing=options['bids_per_listing'],
+            comments_per_listing=options['comments_per_listing'],
+            watched_per_user=options['watched_per_user'],
+            closed_ratio=options['closed_ratio'],
+        )
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary} in {time.perf_counter() - started:.1f}s.'))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from auctions.models import Bid, Listing
+
+
+class Command(BaseCommand):
+    help = 'Rebuild bidding summary of listings (current price, bids count, leading bid) from bids table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="report listings out of sync but don't fix them")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        listings = (
+            Listing.objects
+            # bids of archived listings were moved out (see auctions.archive), only their summary is left
+            .filter(archived_at__isnull=True)
+            .annotate(actual_bid_count=Count('bids'), last_bid_id=Max('bids__id'))
+            .order_by('id')
+        )
+
+        repaired = 0
+        batch = []
+        for listing in listings.iterator(chunk_size=batch_size):
+            batch.append(listing)
+            if len(batch) == batch_size:
+                repaired += self.sync_batch(batch, options['dry_run'])
+                batch = []
+        if batch:
+            repaired += self.sync_batch(batch, options['dry_run'])
+
+        verb = 'out of sync' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'{repaired} listing(s) {verb}.'))
+
+    def sync_batch(self, listings, dry_run):
+        """Compare summary of each listing in `listings` with its bids
+        and fix listings that don't match.
+        Return number of listings out of sync.
+        """
+        # why last bid? bids have increasing prices (see NewBidForm)
+        last_bids = Bid.objects.in_bulk([l.last_bid_id for l in listings if l.last_bid_id])
+
+        now = timezone.now()
+        stale = []
+        for listing in listings:
+            leading_bid = last_bids.get(listing.last_bid_id)
+            current_price = listing.price if leading_bid is None else leading_bid.price
+            if (
+                listing.bid_count != listing.actual_bid_count
+                or listing.leading_bid_id != listing.last_bid_id
+                or listing.current_price != current_price
+            ):
+                listing.bid_count = listing.actual_bid_count
+                listing.leading_bid = leading_bid
+                listing.current_price = current_price
+                listing.updated_at = now
+                stale.append(listing)
+
+        if stale and not dry_run:
+            with transaction.atomic():
+                Listing.objects.bulk_update(stale, ['bid_count', 'leading_bid', 'current_price', 'updated_at'])
+        return len(stale)
@@ -0,0 +1,296 @@
+"""In-process metrics (counters and histograms) exported at `/metrics`
+in prometheus text format.
+
+Metrics are module-level objects, updated from anywhere, eg.
+    metrics.BIDS.inc(kind='bid', outcome='placed')
+    metrics.REQUEST_DURATION.observe(0.012, view='index', method='GET', status='200')
+each update holds (only) its metric's lock for a dict update,
+so they're cheap and safe across threads.
+
+Multiple worker processes: set `METRICS_DIR` setting (a directory shared
+by all workers). Each process then writes a snapshot of its metrics there
+(`<pid>.json`, every `METRICS_FLUSH_INTERVAL` seconds at most, and at exit)
+and `/metrics` adds up snapshots of all processes (dead ones too:
+counters never go down).
+
+`/metrics` is only served to staff users and to scrapers
+from `METRICS_ALLOWED_IPS` setting (addresses), refused (403) to anyone else.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        # label values (in `labelnames` order): value
+        self.values = {}
+        registry.register(self)
+
+    def key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        registry.changed()
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    # seconds, from fast queries to slow pages
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        self.buckets = tuple(buckets or self.default_buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # one slot per bucket (not cumulative) and one for +Inf
+        slot = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[slot] += 1
+            self.values[key] = (counts, total + value)
+        registry.changed()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pid = os.getpid()
+        self.dirty = threading.Event()
+        self.flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        """Values of all metrics (json friendly)."""
+        snapshot = {}
+        for name, metric in self.metrics.items():
+            with metric.lock:
+                values = [[list(key), value] for key, value in metric.values.items()]
+            snapshot[name] = values
+        return snapshot
+
+    def changed(self):
+        """Note that values changed (to be written to `METRICS_DIR`, if set)."""
+        if not getattr(settings, 'METRICS_DIR', None):
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                # forked: values (and flusher thread) are parent's
+                self.pid = os.getpid()
+                self.flusher = None
+                for metric in self.metrics.values():
+                    metric.reset()
+            if self.flusher is None:
+                os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+                self.flusher.start()
+                atexit.register(self.flush)
+        self.dirty.set()
+
+    def flush_periodically(self):
+        while True:
+            self.dirty.wait()
+            self.dirty.clear()
+            try:
+                self.flush()
+            except OSError:
+                # metrics never break the app (next write retries)
+                pass
+            time.sleep(getattr(settings, 'METRICS_FLUSH_INTERVAL', 5))
+
+    def flush(self):
+        """Write snapshot of this process' metrics to `METRICS_DIR`."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with self.flush_lock:
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            # readers never see a partial file
+            os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """Values of all metrics, of all processes (if `METRICS_DIR` is set)."""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return self.snapshot()
+        self.flush()
+        snapshots = []
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                with open(os.path.join(directory, filename)) as f:
+                    snapshots.append(json.load(f))
+        return self.merge(snapshots)
+
+    def merge(self, snapshots):
+        """Add up values of same metric/labels across `snapshots`."""
+        merged = {}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                totals = merged.setdefault(name, {})
+                for key, value in values:
+                    key = tuple(key)
+                    if metric.type == 'histogram':
+                        counts, total = value
+                        old_counts, old_total = totals.get(key) or ([0] * len(counts), 0.0)
+                        totals[key] = ([a + b for a, b in zip(old_counts, counts)], old_total + total)
+                    else:
+                        totals[key] = totals.get(key, 0) + value
+        return {name: [[list(key), value] for key, value in totals.items()] for name, totals in merged.items()}
+
+    def render(self, snapshot):
+        """Prometheus text format (0.0.4) of `snapshot`."""
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(snapshot.get(name, []), key=lambda item: item[0]):
+                labels = list(zip(metric.labelnames, key))
+                if metric.type == 'histogram':
+                    counts, total = value
+                    cumulative = 0
+                    for bound, count in zip([*metric.buckets, '+Inf'], counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {total}')
+                    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+registry = Registry()
+
+
+# auctions metrics
+
+BIDS = Counter(
+    'auctions_bids_total', 'Bids (and max bids) submitted, by outcome.', ['kind', 'outcome'],
+)
+ACCEPTED_BIDS = Counter(
+    'auctions_accepted_bids_total', 'Owners accepting max bid (closing listing), by outcome.', ['outcome'],
+)
+PROXY_BIDS = Counter(
+    'auctions_proxy_bids_total', 'Bids placed automatically on behalf of max bids.',
+)
+LISTINGS_CLOSED = Counter(
+    'auctions_listings_closed_total', 'Listings closed, by reason.', ['reason'],
+)
+COMMENTS = Counter(
+    'auctions_comments_total', 'Comments submitted, by outcome.', ['outcome'],
+)
+WATCHLIST_CHANGES = Counter(
+    'auctions_watchlist_changes_total', 'Watchlist additions/removals, by outcome.', ['action', 'outcome'],
+)
+WRITES_BEHIND = Counter(
+    'auctions_write_behind_writes_total', 'Writes flushed by write-behind queue, by kind and outcome.',
+    ['kind', 'outcome'],
+)
+REQUEST_DURATION = Histogram(
+    'auctions_request_duration_seconds', 'Time to respond, by view.', ['view', 'method', 'status'],
+)
+DB_QUERY_DURATION = Histogram(
+    'auctions_db_query_duration_seconds', 'Time of db queries, by db and statement.', ['alias', 'statement'],
+)
+
+
+def can_scrape(request):
+    # (address first: scrapers never load a session/user)
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()) or request.user.is_staff
+
+
+def metrics_view(request):
+    """All metrics, in prometheus text format (staff and allowed addresses only)."""
+    # (refused before reading any snapshot)
+    if not can_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+class MetricsMiddleware:
+    """Time responses of every view (`REQUEST_DURATION`)."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            view=match.view_name if match else '<unresolved>',
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
+
+
+def time_query(execute, sql, params, many, context):
+    """`execute_wrapper` of every db connection (`DB_QUERY_DURATION`)."""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERY_DURATION.observe(
+            time.perf_counter() - start,
+            alias=context['connection'].alias,
+            statement=sql.split(None, 1)[0].upper() if sql else '',
+        )
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # (sent again whenever connection reconnects)
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
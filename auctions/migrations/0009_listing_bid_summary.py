@@ -0,0 +1,46 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_bid_summary(apps, schema_editor):
+    """Compute bidding summary of existing listings from their bids."""
+    Listing = apps.get_model('auctions', 'Listing')
+    for listing in Listing.objects.all():
+        bids = listing.bids.order_by('id')
+        leading_bid = bids.last()
+        listing.bid_count = bids.count()
+        listing.leading_bid = leading_bid
+        listing.current_price = listing.price if leading_bid is None else leading_bid.price
+        listing.save(update_fields=['bid_count', 'leading_bid', 'current_price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_bid_is_winner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='watchlist',
+            name='listings',
+            field=models.ManyToManyField(blank=True, related_name='watchlists', to='auctions.Listing'),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='current_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=11),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='leading_bid',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.bid'),
+        ),
+        migrations.RunPython(fill_bid_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.8 on 2026-10-18 02:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fts_table(apps, schema_editor):
+    """Create and fill FTS5 index of listings (sqlite only, when FTS5 is compiled in).
+    Other dbs use SearchTerm (fill it with `manage.py rebuild_search_index`).
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        cursor.execute(
+            "CREATE VIRTUAL TABLE auctions_listing_fts USING fts5("
+            "title, description, category, tokenize='unicode61', prefix='2 3')"
+        )
+        cursor.execute(
+            "INSERT INTO auctions_listing_fts (rowid, title, description, category) "
+            "SELECT l.id, l.title, l.description, COALESCE(c.name, '') "
+            "FROM auctions_listing l LEFT JOIN auctions_category c ON c.id = l.category_id"
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS auctions_listing_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_listing_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='auctions.listing')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'listing'], name='searchterm_term_idx'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.8 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('ends_at__isnull', False), ('is_active', True)), fields=['ends_at'], name='listing_active_ends_at_idx'),
+        ),
+    ]
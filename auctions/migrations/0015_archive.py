@@ -0,0 +1,45 @@
+# Generated by Django 3.2.8 on 2026-10-18 03:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F
+
+
+def fill_closed_at(apps, schema_editor):
+    """Closed listings were last changed when they were closed."""
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.filter(is_active=False).update(closed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_proxybid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingArchive',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='auctions.listing')),
+                ('bids', models.BinaryField()),
+                ('comments', models.BinaryField()),
+                ('archived_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('archived_at__isnull', True), ('is_active', False)), fields=['closed_at'], name='listing_unarchived_closed_idx'),
+        ),
+        migrations.RunPython(fill_closed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.8 on 2026-10-18 03:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max, Min
+
+
+def fill_category_summary(apps, schema_editor):
+    """Summarize active listings of existing categories."""
+    Category = apps.get_model('auctions', 'Category')
+    CategorySummary = apps.get_model('auctions', 'CategorySummary')
+    Listing = apps.get_model('auctions', 'Listing')
+    stats = {
+        row['category']: row
+        for row in (
+            Listing.objects.filter(is_active=True, category__isnull=False)
+            .values('category')
+            .annotate(count=Count('id'), min_price=Min('current_price'), max_price=Max('current_price'))
+        )
+    }
+    CategorySummary.objects.bulk_create([
+        CategorySummary(
+            category_id=category_id,
+            active_listings=stats.get(category_id, {}).get('count', 0),
+            min_price=stats.get(category_id, {}).get('min_price'),
+            max_price=stats.get(category_id, {}).get('max_price'),
+        )
+        for category_id in Category.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0015_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategorySummary',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='auctions.category')),
+                ('active_listings', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=11, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=11, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'current_price'], name='listing_active_cat_price_idx'),
+        ),
+        migrations.RunPython(fill_category_summary, migrations.RunPython.noop),
+    ]
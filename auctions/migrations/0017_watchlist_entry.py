@@ -0,0 +1,77 @@
+# Generated by Django 3.2.8 on 2026-10-18 03:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# rows copied per insert
+BATCH_SIZE = 1000
+
+
+def copy_watchlists(apps, schema_editor):
+    """Watchlist (m2m) rows -> watchlist entries."""
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    WatchlistEntry = apps.get_model('auctions', 'WatchlistEntry')
+    rows = Watchlist.listings.through.objects.values_list('watchlist__user_id', 'listing_id').order_by('id')
+    entries = []
+    for user_id, listing_id in rows.iterator(chunk_size=BATCH_SIZE):
+        entries.append(WatchlistEntry(user_id=user_id, listing_id=listing_id))
+        if len(entries) >= BATCH_SIZE:
+            WatchlistEntry.objects.bulk_create(entries)
+            entries = []
+    WatchlistEntry.objects.bulk_create(entries)
+
+
+def restore_watchlists(apps, schema_editor):
+    """Watchlist entries -> a watchlist (m2m) for every user."""
+    User = apps.get_model('auctions', 'User')
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    WatchlistEntry = apps.get_model('auctions', 'WatchlistEntry')
+    Watchlist.objects.bulk_create(
+        [Watchlist(user_id=user_id) for user_id in User.objects.values_list('id', flat=True)],
+        batch_size=BATCH_SIZE,
+    )
+    watchlist_ids = dict(Watchlist.objects.values_list('user_id', 'id'))
+    Through = Watchlist.listings.through
+    Through.objects.bulk_create(
+        [
+            Through(watchlist_id=watchlist_ids[user_id], listing_id=listing_id)
+            for user_id, listing_id in WatchlistEntry.objects.values_list('user_id', 'listing_id').iterator()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_category_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchlistEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watchlist_entries', to='auctions.listing')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='watchlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'watchlist entries',
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='watched_listings',
+            field=models.ManyToManyField(blank=True, related_name='watchers', through='auctions.WatchlistEntry', to='auctions.Listing'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchlistentry',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='watchlistentry_user_listing_unique'),
+        ),
+        migrations.RunPython(copy_watchlists, restore_watchlists),
+        migrations.DeleteModel(
+            name='Watchlist',
+        ),
+    ]
@@ -1,13 +1,18 @@
 from decimal import Decimal
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.core.validators import MinValueValidator
 from django.urls import reverse
+from django.utils import timezone
 
 
 class User(AbstractUser):
-    pass
+    # watchlist (see `WatchlistEntry`)
+    watched_listings = models.ManyToManyField(
+        'Listing', through='WatchlistEntry', blank=True, related_name='watchers',
+    )
 
 
 class Category(models.Model):
@@ -17,6 +22,22 @@ class Category(models.Model):
         return self.name
 
 
+class CategorySummary(models.Model):
+    """Active listings of a category: count and current price range.
+    Kept up to date incrementally as listings are created, bid on and closed
+    (see auctions.categories) and could be rebuilt using
+    `manage.py rebuild_category_summary`.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    active_listings = models.PositiveIntegerField(default=0)
+    # (null while category has no active listings)
+    min_price = models.DecimalField(max_digits=11, decimal_places=2, blank=True, null=True)
+    max_price = models.DecimalField(max_digits=11, decimal_places=2, blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.category_id}: {self.active_listings} active'
+
+
 class Listing(models.Model):
     title = models.CharField(max_length=128)
     description = models.TextField()
@@ -31,12 +52,77 @@ class Listing(models.Model):
     # which i need to RSA later...
     category = models.ForeignKey(Category, on_delete=models.CASCADE, blank=True, null=True, related_name='listings')
 
+    # bidding summary (denormalized from bids table)
+    # so that listing pages never have to scan bids
+    # kept in sync whenever a new bid is saved (see `Bid.save`)
+    # and could be rebuilt using `manage.py sync_bid_summary`
+    current_price = models.DecimalField(max_digits=11, decimal_places=2, editable=False)
+    bid_count = models.PositiveIntegerField(default=0, editable=False)
+    leading_bid = models.ForeignKey('Bid', on_delete=models.SET_NULL, blank=True, null=True, editable=False, related_name='+')
+
+    # last time listing (or its bidding summary) changed
+    # NOTE: queryset updates must set it explicitly (auto_now only works on save)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # when auction ends (no end: listing stays open until owner accepts a bid)
+    # no bids are accepted after it, and listing gets closed
+    # by `manage.py close_expired_listings` (see `bidding.close_expired_listings`)
+    ends_at = models.DateTimeField(blank=True, null=True)
+
+    # when listing was closed (by bidding engine)
+    # and when its bids and comments were moved to archive
+    # (see auctions.archive)
+    closed_at = models.DateTimeField(blank=True, null=True, editable=False)
+    archived_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        # active listings are always browsed newest first
+        # (see pagination.paginate), by all/category/owner
+        # partial indexes: closed listings aren't indexed at all
+        indexes = [
+            models.Index(fields=['-id'], condition=Q(is_active=True), name='listing_active_idx'),
+            models.Index(fields=['category', '-id'], condition=Q(is_active=True), name='listing_active_category_idx'),
+            models.Index(fields=['owner', '-id'], condition=Q(is_active=True), name='listing_active_owner_idx'),
+            # due listings are found in end time order
+            # without touching closed/never ending ones
+            models.Index(
+                fields=['ends_at'],
+                condition=Q(is_active=True, ends_at__isnull=False),
+                name='listing_active_ends_at_idx',
+            ),
+            # cheapest/priciest active listing of a category is one index seek
+            # (see `categories.refresh`)
+            models.Index(
+                fields=['category', 'current_price'],
+                condition=Q(is_active=True),
+                name='listing_active_cat_price_idx',
+            ),
+            # listings due for archival are found in closing order
+            # without touching active/already archived ones
+            models.Index(
+                fields=['closed_at'],
+                condition=Q(is_active=False, archived_at__isnull=True),
+                name='listing_unarchived_closed_idx',
+            ),
+        ]
+
     def __str__(self):
         return f'{self.title} ({self.price})'
 
+    def save(self, *args, **kwargs):
+        # before any bids, current price is just initial price
+        if not self.bid_count:
+            self.current_price = self.price
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('display_listing', args=(self.id,))
 
+    @property
+    def has_ended(self):
+        """Has listing's end time passed (even if it's not closed yet)?"""
+        return self.ends_at is not None and self.ends_at <= timezone.now()
+
 
 class Bid(models.Model):
     price = models.DecimalField(max_digits=11, decimal_places=2, validators=[MinValueValidator(Decimal(1.0))])
@@ -44,9 +130,56 @@ class Bid(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bids')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bids')
 
+    class Meta:
+        indexes = [
+            # bids of a listing in placing order (last bid is max bid)
+            # (sqlite's fk index already covers it, as it includes rowid
+            # but other backends need it)
+            models.Index(fields=['listing', 'id'], name='bid_listing_idx'),
+        ]
+
     def __str__(self):
         return f'{self.price}'
 
+    def save(self, *args, **kwargs):
+        """Save bid and update bidding summary of its listing
+        (in the same transaction).
+        """
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                Listing.objects.filter(pk=self.listing_id).update(
+                    current_price=self.price,
+                    bid_count=F('bid_count') + 1,
+                    leading_bid=self,
+                    updated_at=timezone.now(),
+                )
+
+
+class ProxyBid(models.Model):
+    """Max price a user is willing to pay for a listing.
+    Bidding engine bids on user's behalf (just enough to lead)
+    up to that price (see `bidding.place_max_bid`).
+    """
+    max_price = models.DecimalField(max_digits=11, decimal_places=2, validators=[MinValueValidator(Decimal(1.0))])
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='proxy_bids')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='proxy_bids')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'user'], name='proxybid_listing_user_unique'),
+        ]
+        indexes = [
+            # proxies of a listing from highest max price
+            # (earliest first on ties, they win)
+            # so the top two are just an index seek
+            models.Index(fields=['listing', '-max_price', 'id'], name='proxybid_listing_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.max_price} (max)'
+
 
 class Comment(models.Model):
     content = models.TextField()
@@ -57,9 +190,52 @@ class Comment(models.Model):
         return self.content
 
 
-class Watchlist(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='watchlist')
-    listings = models.ManyToManyField(Listing, blank=True, related_name='watchlists')
+class ListingArchive(models.Model):
+    """Bids and comments of a long closed listing,
+    compressed into one row (see auctions.archive).
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='archive')
+    # zlib compressed json: rows as lists (see `archive.pack`)
+    bids = models.BinaryField()
+    comments = models.BinaryField()
+    archived_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'archive of {self.listing_id}'
+
+
+class WatchlistEntry(models.Model):
+    """A listing on a user's watchlist.
+    Users have no watchlist row of their own: their watchlist is their entries
+    (none until they watch a listing), so every user has one, however created.
+    """
+    # lookups by user are seeks on (user, listing) unique index below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='watchlist_entries', db_index=False)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='watchlist_entries')
+
+    class Meta:
+        verbose_name_plural = 'watchlist entries'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'listing'], name='watchlistentry_user_listing_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} on {self.user_id}'s watchlist"
+
+
+class SearchTerm(models.Model):
+    """Inverted index entry (term -> listing) used by search
+    when sqlite's FTS5 isn't available (see auctions.search).
+    """
+    term = models.CharField(max_length=64)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # prefix lookups (term LIKE 'x%') are range scans on it
+            models.Index(fields=['term', 'listing'], name='searchterm_term_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user}'s watchlist"
+        return f'{self.term} ({self.listing_id})'
@@ -0,0 +1,145 @@
+"""Keyset (cursor) pagination of listings (and comments, bids).
+
+Pages are ordered by id (newest first) and linked by cursors
+(`?after=<id>` for next page, `?before=<id>` for previous one)
+instead of page numbers/offsets, so fetching any page is a range scan
+of `PAGE_SIZE + 1` rows no matter how deep it is.
+"""
+from django.core.exceptions import BadRequest
+from django.http import JsonResponse
+from django.utils.http import urlencode
+
+from . import utils
+
+
+PAGE_SIZE = 20
+
+
+class KeysetPage:
+    """One page of items and cursors of pages around it
+    (linked at `path`, if given, eg. a fragment endpoint paging through same items).
+    """
+    def __init__(self, request, items, has_next, has_previous, path=None):
+        self.request = request
+        self.items = items
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.path = path
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def next_url(self):
+        if not self.has_next or not self.items:
+            return None
+        return self._url(after=self.items[-1].id)
+
+    @property
+    def previous_url(self):
+        if not self.has_previous or not self.items:
+            return None
+        return self._url(before=self.items[0].id)
+
+    def _url(self, **cursor):
+        if self.path is not None:
+            return f'{self.path}?{urlencode(cursor)}'
+        # keep other query params (eg. format) as is
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params.update(cursor)
+        return f'{self.request.path}?{params.urlencode()}'
+
+
+def paginate(request, queryset, path=None):
+    """Get page of `queryset` pointed to by request's cursor (if any)."""
+    after = _get_cursor(request, 'after')
+    before = _get_cursor(request, 'before')
+
+    if before is not None:
+        # walk backwards then flip, so page still reads newest first
+        items = list(queryset.filter(id__gt=before).order_by('id')[:PAGE_SIZE + 1])
+        has_previous = len(items) > PAGE_SIZE
+        items = items[:PAGE_SIZE][::-1]
+        return KeysetPage(request, items, has_next=True, has_previous=has_previous, path=path)
+
+    if after is not None:
+        queryset = queryset.filter(id__lt=after)
+    items = list(queryset.order_by('-id')[:PAGE_SIZE + 1])
+    has_next = len(items) > PAGE_SIZE
+    return KeysetPage(request, items[:PAGE_SIZE], has_next=has_next, has_previous=after is not None, path=path)
+
+
+def paginate_list(request, items, path=None):
+    """Same as `paginate` but over already loaded `items` (newest first),
+    eg. rows of an archive (see auctions.archive).
+    """
+    after = _get_cursor(request, 'after')
+    before = _get_cursor(request, 'before')
+
+    if before is not None:
+        newer = [item for item in items if item.id > before]
+        return KeysetPage(request, newer[-PAGE_SIZE:], has_next=True, has_previous=len(newer) > PAGE_SIZE, path=path)
+
+    if after is not None:
+        items = [item for item in items if item.id < after]
+    return KeysetPage(
+        request, items[:PAGE_SIZE], has_next=len(items) > PAGE_SIZE, has_previous=after is not None, path=path,
+    )
+
+
+def first_page(request, items, path=None):
+    """First page of `items` (queryset or list, newest first), whatever request's cursor,
+    eg. first page of comments inlined in listing page (next ones are at `path`).
+    """
+    items = list(items[:PAGE_SIZE + 1])
+    return KeysetPage(request, items[:PAGE_SIZE], has_next=len(items) > PAGE_SIZE, has_previous=False, path=path)
+
+
+def wants_json(request):
+    """Did client ask for json variant of page (`?format=json`)?"""
+    return request.GET.get('format') == 'json'
+
+
+def json_response(page):
+    """Render a page of listings as json."""
+    return JsonResponse({
+        'results': [utils.listing_to_dict(listing) for listing in page],
+        'next': page.next_url,
+        'previous': page.previous_url,
+    })
+
+
+class ListingsPageMixin:
+    """Paginate listings of a view (`get_listings`)
+    into `listings` and `page` context variables
+    and serve page as json if asked to.
+    """
+    def get_listings(self):
+        raise NotImplementedError
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = paginate(self.request, self.get_listings())
+        context['page'] = page
+        context['listings'] = page
+        return context
+
+    def render_to_response(self, context, **response_kwargs):
+        if wants_json(self.request):
+            return json_response(context['page'])
+        return super().render_to_response(context, **response_kwargs)
+
+
+def _get_cursor(request, name):
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f'invalid cursor: {name}={value}')
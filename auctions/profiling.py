@@ -0,0 +1,269 @@
+"""Opt-in request profiling (see `ProfilingMiddleware`).
+
+A sample of requests (`PROFILING_SAMPLE_RATE` setting) is profiled:
+- sql queries: count and duration (grouped by normalized sql, see `normalize_sql`)
+  via `connection.execute_wrapper`
+  (queries run in other threads, eg. by async views, aren't seen)
+- templates: render time of each template (`listing.html`, `layout.html`,
+  included ones and inclusion tags ones, eg. `watchlist_forms.html`),
+  both inclusive and self (without templates rendered within it)
+- optionally (`PROFILING_CPROFILE` setting) cProfile of whole request
+
+Profiled responses carry a `Server-Timing` header (shown by browsers'
+dev tools), and profiles are aggregated by url name into a report
+(this process only) served to staff at `/profiling/report`.
+"""
+import cProfile
+import contextvars
+import io
+import pstats
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import JsonResponse
+from django.template.base import Template
+
+
+# max sql statements/templates/functions listed per url in report
+REPORT_TOP = 10
+
+# max distinct sql statements kept per url (others are added up under `OTHER_SQL`)
+# so that report stays bounded in a long running process
+MAX_SQL = 200
+OTHER_SQL = '(other statements)'
+
+# placeholder lists (`IN (%s, %s, ...)`, any length) and literals
+# (eg. LIMIT/OFFSET, inlined by django), in that order
+SQL_NORMALIZERS = [
+    (re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)'), '(...)'),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+]
+
+# profile of request being handled (if it's profiled)
+_current = contextvars.ContextVar('profile', default=None)
+
+
+def normalize_sql(sql):
+    """`sql` without what varies from one run of same statement to another."""
+    for pattern, replacement in SQL_NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class RequestProfile:
+    """Queries and template renders of one request."""
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        # sql: [count, seconds]
+        self.sql = {}
+        self.template_time = 0.0
+        # template name: [count, inclusive seconds, self seconds]
+        self.templates = {}
+        # time spent in child templates, of each template being rendered
+        self.stack = []
+
+    def time_query(self, execute, sql, params, many, context):
+        """`connection.execute_wrapper` timing each query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            stats = self.sql.setdefault(normalize_sql(sql), [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def time_template(self, name, render, *args):
+        self.stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return render(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            else:
+                self.template_time += elapsed
+            stats = self.templates.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += elapsed - children
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.2f};desc="templates"',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+
+class UrlStats:
+    """Profiles of one url, added up."""
+    def __init__(self):
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.sql = {}
+        self.templates = {}
+        self.functions = None
+
+    def add(self, profile, total, profiler=None):
+        self.requests += 1
+        self.total_time += total
+        self.max_time = max(self.max_time, total)
+        self.queries += profile.queries
+        self.db_time += profile.db_time
+        self.template_time += profile.template_time
+        for sql, (count, seconds) in profile.sql.items():
+            if sql not in self.sql and len(self.sql) >= MAX_SQL:
+                sql = OTHER_SQL
+            stats = self.sql.setdefault(sql, [0, 0.0])
+            stats[0] += count
+            stats[1] += seconds
+        for name, values in profile.templates.items():
+            stats = self.templates.setdefault(name, [0, 0.0, 0.0])
+            for i, value in enumerate(values):
+                stats[i] += value
+        if profiler is not None:
+            if self.functions is None:
+                self.functions = pstats.Stats(profiler)
+            else:
+                self.functions.add(profiler)
+
+    def as_dict(self):
+        requests = self.requests
+        data = {
+            'requests': requests,
+            'avg_ms': round(self.total_time / requests * 1000, 3),
+            'max_ms': round(self.max_time * 1000, 3),
+            'avg_queries': round(self.queries / requests, 2),
+            'avg_db_ms': round(self.db_time / requests * 1000, 3),
+            'avg_template_ms': round(self.template_time / requests * 1000, 3),
+            # hot paths first
+            'templates': [
+                {
+                    'name': name,
+                    'renders': count,
+                    'avg_ms': round(inclusive / requests * 1000, 3),
+                    'avg_self_ms': round(own / requests * 1000, 3),
+                }
+                for name, (count, inclusive, own) in sorted(
+                    self.templates.items(), key=lambda item: item[1][2], reverse=True,
+                )[:REPORT_TOP]
+            ],
+            'sql': [
+                {'sql': sql, 'count': count, 'total_ms': round(seconds * 1000, 3)}
+                for sql, (count, seconds) in sorted(
+                    self.sql.items(), key=lambda item: item[1][1], reverse=True,
+                )[:REPORT_TOP]
+            ],
+        }
+        if self.functions is not None:
+            out = io.StringIO()
+            self.functions.stream = out
+            self.functions.sort_stats('cumulative').print_stats(REPORT_TOP * 2)
+            data['cprofile'] = out.getvalue()
+        return data
+
+
+class Report:
+    """Profiles aggregated by url name."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.urls = {}
+
+    def add(self, url_name, profile, total, profiler=None):
+        with self.lock:
+            self.urls.setdefault(url_name, UrlStats()).add(profile, total, profiler)
+
+    def as_dict(self):
+        with self.lock:
+            # slowest urls (by time spent overall) first
+            urls = sorted(self.urls.items(), key=lambda item: item[1].total_time, reverse=True)
+            return {url_name: stats.as_dict() for url_name, stats in urls}
+
+    def clear(self):
+        with self.lock:
+            self.urls = {}
+
+
+report = Report()
+
+
+@staff_member_required
+def report_view(request):
+    """Report of profiled requests (json)."""
+    return JsonResponse(report.as_dict())
+
+
+def install_template_timing():
+    """Time every template render (of profiled requests).
+    Wraps engine's `Template._render` (once), which renders
+    top-level, extended, included and inclusion tags templates alike.
+    NOTE: blocks of a template are rendered (and timed) within its parent's span.
+    """
+    render = Template._render
+    if getattr(render, 'profiled', False):
+        return
+
+    def profiled_render(template, context):
+        profile = _current.get()
+        if profile is None:
+            return render(template, context)
+        return profile.time_template(template.name or '<unknown>', render, template, context)
+
+    profiled_render.profiled = True
+    Template._render = profiled_render
+
+
+class ProfilingMiddleware:
+    """Profile a sample of requests (see module docstring).
+    Should come first, so that whole request (other middlewares too) is profiled.
+    """
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed()
+        self.use_cprofile = getattr(settings, 'PROFILING_CPROFILE', False)
+        install_template_timing()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        profiler = cProfile.Profile() if self.use_cprofile else None
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile.time_query):
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        report.add(match.view_name if match else '<unresolved>', profile, total, profiler)
+        response['Server-Timing'] = profile.server_timing(total)
+        return response
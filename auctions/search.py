@@ -0,0 +1,215 @@
+"""Full-text search of listings (title, description, category name).
+
+Two backends, chosen by `SEARCH_BACKEND` setting
+(`auto` picks fts5 whenever it's available):
+- `fts5`: sqlite FTS5 virtual table (`auctions_listing_fts`, rowid is listing id)
+  ranked by bm25
+- `inverted`: precomputed inverted index in `SearchTerm` table
+  (term -> listing, weight), works on any db, ranked by summed weights
+
+Either way, index is kept up to date by signals (see auctions.signals)
+and could be rebuilt from scratch by `manage.py rebuild_search_index`.
+Every query term matches as a prefix ("cam" finds "camera"),
+and listings must match all terms.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Sum
+
+from .models import Listing, SearchTerm
+
+
+FTS_TABLE = 'auctions_listing_fts'
+
+# how much a term counts in each field
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'description': 1.0,
+    'category': 2.0,
+}
+
+# terms are cut to fit SearchTerm.term
+MAX_TERM_LENGTH = 64
+
+# max listings returned by a search
+MAX_RESULTS = 50
+
+
+def tokenize(text):
+    """Split `text` into lowercase terms (letters/digits only)."""
+    return [term[:MAX_TERM_LENGTH] for term in re.findall(r'\w+', text.lower())]
+
+
+def listing_fields(listing):
+    """Searchable text of `listing` by field."""
+    return {
+        'title': listing.title,
+        'description': listing.description,
+        'category': listing.category.name if listing.category_id else '',
+    }
+
+
+class FTS5Backend:
+    name = 'fts5'
+
+    def index(self, listing):
+        fields = listing_fields(listing)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [listing.id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, category) VALUES (%s, %s, %s, %s)',
+                [listing.id, fields['title'], fields['description'], fields['category']],
+            )
+
+    def remove(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [listing_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description, category) '
+                'SELECT l.id, l.title, l.description, COALESCE(c.name, \'\') '
+                'FROM auctions_listing l LEFT JOIN auctions_category c ON c.id = l.category_id'
+            )
+
+    def search(self, terms, filters, limit):
+        """Return ids of matching listings, best first."""
+        match = ' '.join(f'"{term}"*' for term in terms)
+        where = [f'{FTS_TABLE} MATCH %s']
+        params = [match]
+        for column, op, value in filters:
+            where.append(f'l.{column} {op} %s')
+            params.append(value)
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT l.id FROM {FTS_TABLE} JOIN auctions_listing l ON l.id = {FTS_TABLE}.rowid '
+                f'WHERE {" AND ".join(where)} '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}), l.id DESC LIMIT %s',
+                params,
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class InvertedIndexBackend:
+    name = 'inverted'
+
+    def terms(self, listing):
+        """Weighted terms of `listing`."""
+        weights = Counter()
+        for field, text in listing_fields(listing).items():
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+        return weights
+
+    def index(self, listing):
+        SearchTerm.objects.filter(listing_id=listing.id).delete()
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, listing_id=listing.id, weight=weight)
+            for term, weight in self.terms(listing).items()
+        )
+
+    def remove(self, listing_id):
+        SearchTerm.objects.filter(listing_id=listing_id).delete()
+
+    def rebuild(self, batch_size=2000):
+        SearchTerm.objects.all().delete()
+        batch = []
+        for listing in Listing.objects.select_related('category').iterator(chunk_size=batch_size):
+            batch.extend(
+                SearchTerm(term=term, listing_id=listing.id, weight=weight)
+                for term, weight in self.terms(listing).items()
+            )
+            if len(batch) >= batch_size:
+                SearchTerm.objects.bulk_create(batch)
+                batch = []
+        SearchTerm.objects.bulk_create(batch)
+
+    def search(self, terms, filters, limit):
+        """Return ids of matching listings, best first."""
+        queryset = Listing.objects.all()
+        for column, op, value in filters:
+            lookup = {'=': '', '>=': '__gte', '<=': '__lte'}[op]
+            queryset = queryset.filter(**{f'{column}{lookup}': value})
+        # must match every term
+        for term in terms:
+            queryset = queryset.filter(
+                id__in=SearchTerm.objects.filter(prefix_q('term', term)).values('listing_id')
+            )
+        matching = Q()
+        for term in terms:
+            matching |= prefix_q('search_terms__term', term)
+        queryset = (
+            queryset
+            .annotate(rank=Sum('search_terms__weight', filter=matching))
+            .order_by('-rank', '-id')
+        )
+        return list(queryset.values_list('id', flat=True)[:limit])
+
+
+def prefix_q(field, prefix):
+    """Match values of `field` starting with `prefix`
+    as a range (so any btree index on field is used, whatever db collation is)
+    instead of LIKE.
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+
+def fts5_available():
+    return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            name = 'fts5' if fts5_available() else 'inverted'
+        _backend = {'fts5': FTS5Backend, 'inverted': InvertedIndexBackend}[name]()
+    return _backend
+
+
+def index_listing(listing):
+    get_backend().index(listing)
+
+
+def remove_listing(listing_id):
+    get_backend().remove(listing_id)
+
+
+def rebuild_index():
+    get_backend().rebuild()
+
+
+def search(query, is_active=True, category_id=None, min_price=None, max_price=None, limit=MAX_RESULTS):
+    """Search listings matching (all terms of) `query`.
+    `is_active`: True/False to filter by state, None for all listings.
+    prices filter by current price.
+    Return listings, best match first.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return []
+
+    filters = []
+    if is_active is not None:
+        filters.append(('is_active', '=', is_active))
+    if category_id is not None:
+        filters.append(('category_id', '=', category_id))
+    if min_price is not None:
+        filters.append(('current_price', '>=', min_price))
+    if max_price is not None:
+        filters.append(('current_price', '<=', max_price))
+
+    ids = get_backend().search(terms, filters, limit)
+    listings = Listing.objects.in_bulk(ids)
+    return [listings[id] for id in ids if id in listings]
@@ -0,0 +1,207 @@
+"""Bulk seeding of realistic looking auctions data at any scale
+(see `manage.py seed_data`).
+
+Rows are inserted with `bulk_create` in batches (one transaction each)
+so no per-row signals/`save()` run, instead:
+- listings' bidding summary is computed while generating their bids
+- search index and category summaries are rebuilt once at the end
+All seeded users share one password (`SEED_PASSWORD`, hashed once).
+"""
+import itertools
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from . import categories as category_summaries, search
+from .models import Bid, Category, Comment, Listing, User, WatchlistEntry
+
+
+SEED_PASSWORD = 'password'
+
+# made up vocabulary for listings text (~10k words)
+SYLLABLES = ['ka', 'mo', 'ri', 'te', 'lu', 'sa', 'po', 'ne', 'di', 'go', 'ba', 'fe', 'zi', 'ro', 'mi', 'tu', 'ya', 'le', 'co', 'va', 'xe', 'nu']
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+# word usage is far from uniform (few common words, lots of rare ones)
+WORD_CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choices(WORDS, cum_weights=WORD_CUM_WEIGHTS, k=words))
+
+
+class Seeder:
+    """Generate rows of all auctions models.
+    `log` is called with a progress message after each step.
+    """
+    def __init__(self, batch_size=5000, seed=0, log=None):
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def seed(self, users=1000, categories=20, listings=10000, bids_per_listing=5,
+             comments_per_listing=2, watched_per_user=10, closed_ratio=0.5):
+        """Seed all models. Return number of rows created by model name."""
+        counts = {}
+        counts['users'] = self.seed_users(users)
+        counts['categories'] = self.seed_categories(categories)
+        counts['listings'], counts['bids'], counts['comments'] = self.seed_listings(
+            listings, bids_per_listing, comments_per_listing, closed_ratio,
+        )
+        counts['watchlist entries'] = self.seed_watchlists(watched_per_user)
+        search.rebuild_index()
+        self.log('rebuilt search index')
+        category_summaries.rebuild()
+        self.log('rebuilt category summaries')
+        return counts
+
+    def batches(self, count):
+        """(start, stop) of each batch of `count` rows."""
+        for start in range(0, count, self.batch_size):
+            yield start, min(start + self.batch_size, count)
+
+    def seed_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        # usernames continue from existing users (seeding twice doesn't clash)
+        offset = User.objects.count()
+        for start, stop in self.batches(count):
+            User.objects.bulk_create(
+                User(username=f'user{offset + i}', password=password)
+                for i in range(start, stop)
+            )
+        self.user_ids = list(User.objects.values_list('id', flat=True))
+        self.log(f'{count} users')
+        return count
+
+    def seed_categories(self, count):
+        Category.objects.bulk_create(
+            Category(name=' '.join(self.rng.sample(WORDS[:200], 2)).title())
+            for _ in range(count)
+        )
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        self.log(f'{count} categories')
+        return count
+
+    def seed_listings(self, count, bids_per_listing, comments_per_listing, closed_ratio):
+        """Seed listings along with their bids and comments.
+        Return numbers of listings, bids and comments created.
+        """
+        bids_count = comments_count = 0
+        for start, stop in self.batches(count):
+            with transaction.atomic():
+                listings, bid_plans = [], []
+                for _ in range(start, stop):
+                    listing, bid_plan = self.make_listing(bids_per_listing, closed_ratio)
+                    listings.append(listing)
+                    bid_plans.append(bid_plan)
+                listing_ids = self.bulk_create_listings(listings)
+
+                bids, comments = [], []
+                for listing, listing_id, bid_plan in zip(listings, listing_ids, bid_plans):
+                    for i, (user_id, price) in enumerate(bid_plan):
+                        # last bid of a closed listing won it
+                        is_winner = not listing.is_active and i == len(bid_plan) - 1
+                        bids.append(Bid(listing_id=listing_id, user_id=user_id, price=price, is_winner=is_winner))
+                    for _ in range(self.rng.randint(0, 2 * comments_per_listing)):
+                        comments.append(Comment(
+                            listing_id=listing_id,
+                            user_id=self.rng.choice(self.user_ids),
+                            content=random_text(self.rng, self.rng.randint(3, 20)),
+                        ))
+                Bid.objects.bulk_create(bids, batch_size=self.batch_size)
+                Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+
+                # leading bid is the last (max) bid of each listing
+                Listing.objects.filter(pk__in=listing_ids, bid_count__gt=0).update(
+                    leading_bid_id=Subquery(
+                        Bid.objects.filter(listing_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+                    ),
+                )
+            bids_count += len(bids)
+            comments_count += len(comments)
+            self.log(f'{stop}/{count} listings ({bids_count} bids, {comments_count} comments)')
+        return count, bids_count, comments_count
+
+    def make_listing(self, bids_per_listing, closed_ratio):
+        """Unsaved listing (with its bidding summary)
+        and its bids as [(user id, price)] in increasing price order.
+        """
+        rng = self.rng
+        owner_id = rng.choice(self.user_ids)
+        price = Decimal(rng.randint(1, 500))
+        is_active = rng.random() >= closed_ratio
+
+        bid_plan = []
+        current_price = price
+        for _ in range(rng.randint(0, 2 * bids_per_listing)):
+            bidder_id = rng.choice(self.user_ids)
+            if bidder_id == owner_id:
+                continue
+            current_price += Decimal(rng.randint(1, 20))
+            bid_plan.append((bidder_id, current_price))
+
+        # some auctions run until a set end time
+        ends_at = None
+        if rng.random() < 0.5:
+            days = rng.uniform(1, 14)
+            ends_at = self.now + timedelta(days=days) if is_active else self.now - timedelta(days=days)
+        # closed ones at end time, or whenever owners accepted a bid (up to 2 months ago)
+        closed_at = None
+        if not is_active:
+            closed_at = ends_at or self.now - timedelta(days=rng.uniform(0, 60))
+
+        listing = Listing(
+            title=random_text(rng, rng.randint(2, 6)).capitalize(),
+            description=random_text(rng, rng.randint(10, 60)),
+            price=price,
+            current_price=current_price,
+            bid_count=len(bid_plan),
+            owner_id=owner_id,
+            category_id=rng.choice(self.category_ids) if rng.random() < 0.9 else None,
+            is_active=is_active,
+            ends_at=ends_at,
+            closed_at=closed_at,
+        )
+        return listing, bid_plan
+
+    def bulk_create_listings(self, listings):
+        """Insert `listings`. Return their ids (in same order)."""
+        Listing.objects.bulk_create(listings)
+        if listings[0].pk is not None:
+            return [listing.pk for listing in listings]
+        # backend can't return ids of inserted rows (eg. sqlite)
+        # they're the last ones inserted (seeding is the only writer)
+        return list(Listing.objects.order_by('-id').values_list('id', flat=True)[:len(listings)])[::-1]
+
+    def seed_watchlists(self, watched_per_user):
+        """Have every user not watching anything yet
+        watch a few active listings.
+        Return number of watched listings.
+        """
+        watching = set(WatchlistEntry.objects.values_list('user_id', flat=True).distinct())
+        new_user_ids = [user_id for user_id in self.user_ids if user_id not in watching]
+
+        active_ids = list(Listing.objects.filter(is_active=True).values_list('id', flat=True))
+        if not active_ids or not watched_per_user:
+            return 0
+        entries = []
+        count = 0
+        for user_id in new_user_ids:
+            size = min(len(active_ids), self.rng.randint(0, 2 * watched_per_user))
+            entries.extend(
+                WatchlistEntry(user_id=user_id, listing_id=listing_id)
+                for listing_id in self.rng.sample(active_ids, size)
+            )
+            if len(entries) >= self.batch_size:
+                WatchlistEntry.objects.bulk_create(entries)
+                count += len(entries)
+                entries = []
+        WatchlistEntry.objects.bulk_create(entries)
+        count += len(entries)
+        self.log(f'{count} watchlist entries')
+        return count
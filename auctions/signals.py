@@ -0,0 +1,78 @@
+"""Keep derived data in sync whenever rows it's built from change:
+- cached pages (see auctions.caching)
+- search index (see auctions.search)
+- category summaries (see auctions.categories)
+- cached users (see auctions.auth)
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import auth, caching, categories, search
+from .models import Bid, Category, CategorySummary, Comment, Listing, User
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def listing_changed(sender, instance, **kwargs):
+    caching.listing_changed(instance.id, catalog=True)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    caching.bump_version(caching.CATALOG)
+
+
+@receiver(post_save, sender=Bid)
+@receiver(post_delete, sender=Bid)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def listing_child_changed(sender, instance, **kwargs):
+    caching.listing_changed(instance.listing_id)
+
+
+# searchable fields of a listing
+SEARCHED_FIELDS = {'title', 'description', 'category'}
+
+
+@receiver(post_save, sender=Listing)
+def index_listing(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCHED_FIELDS & set(update_fields):
+        search.index_listing(instance)
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_listing(sender, instance, **kwargs):
+    search.remove_listing(instance.id)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_listings(sender, instance, created, **kwargs):
+    # category name is searchable too
+    if not created:
+        for listing in instance.listings.select_related('category'):
+            search.index_listing(listing)
+
+
+@receiver(post_save, sender=Listing)
+def count_new_listing(sender, instance, created, **kwargs):
+    if created:
+        categories.refresh(instance.category_id, 1 if instance.is_active else 0)
+
+
+@receiver(post_delete, sender=Listing)
+def uncount_listing(sender, instance, **kwargs):
+    categories.refresh(instance.category_id, -1 if instance.is_active else 0)
+
+
+@receiver(post_save, sender=Category)
+def summarize_new_category(sender, instance, created, **kwargs):
+    if created:
+        CategorySummary.objects.create(category=instance)
+        caching.bump_version(categories.VERSION)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    auth.user_changed(instance.id)
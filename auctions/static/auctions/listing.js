@@ -17,14 +17,74 @@ function renderBidFormErrors(bidForm, errorsObj) {
 // after successful bids
 // reset price field and remove any errors in bidding form
 // then show new bids count
-function updateBidsCount(bidForm) {
-    const priceField = bidForm.querySelector(`[name="price"]`);
+function updateBidsCount(bidForm, fieldName, bidCount, note) {
+    const priceField = bidForm.querySelector(`[name="${fieldName}"]`);
     priceField.value = '';
     priceField.parentElement.querySelectorAll('.alert').forEach(elm => elm.remove());
 
-    const oldBidsCount = parseInt(bidForm.previousElementSibling.textContent.match(/\d+/));
-    const newBidsCount = oldBidsCount + 1;
-    bidForm.previousElementSibling.textContent = `${newBidsCount} bids so far. Your Bid is the Current Bid`;
+    renderBidsCount(bidCount, note);
+}
+
+// show bids count (and an optional note) of listing
+// counts sent by server are absolute
+// so it doesn't matter if same bid is reported twice (response + event)
+function renderBidsCount(bidCount, note='') {
+    const bidsCount = document.querySelector('.bids-count span');
+    if (bidsCount) {
+        bidsCount.textContent = `${bidCount} bid${bidCount == 1 ? '' : 's'} so far. ${note}`;
+    }
+}
+
+// show current max bid (only shown to listing owner)
+function renderMaxBid(price) {
+    const maxBid = document.querySelector('.bids-accept strong');
+    if (maxBid) {
+        maxBid.textContent = `$${price}`;
+    }
+}
+
+// listen to real-time events of listing (new bids, listing closed)
+// so that all viewers see them without reloading page
+// events are only served by asgi server
+// if not available (eg. wsgi dev server) connection just fails and page works as before
+function subscribeToListingEvents(listingId) {
+    if (!window.EventSource) {
+        return;
+    }
+    const source = new EventSource(`/listings/${listingId}/events`);
+
+    source.addEventListener('bid', (e) => {
+        const event = JSON.parse(e.data);
+        renderBidsCount(event.bid_count);
+        renderMaxBid(event.current_price);
+    });
+
+    source.addEventListener('closed', (e) => {
+        source.close();
+        // closed state is rendered in place (not by reloading page:
+        // all viewers would hit server at the same time)
+        renderClosed(JSON.parse(e.data));
+    });
+}
+
+// show listing as closed: no more bidding/accepting, final price if sold
+// (who won is only rendered by server, on next visit)
+function renderClosed(event) {
+    document.querySelectorAll('.bids-new, .bids-accept').forEach(elm => elm.remove());
+    renderBidsCount(event.bid_count);
+
+    const title = document.querySelector('.title-container h2');
+    if (title && !title.querySelector('.badge')) {
+        title.insertAdjacentHTML('beforeend', ' <span class="badge badge-secondary">Closed</span>');
+    }
+    const winner = document.querySelector('.bids-winner');
+    if (winner && event.bid_count > 0 && !winner.querySelector('.alert')) {
+        const alert = document.createElement('div');
+        alert.className = 'alert alert-primary';
+        alert.setAttribute('role', 'alert');
+        alert.textContent = `Sold for ($${event.current_price})!`;
+        winner.appendChild(alert);
+    }
 }
 
 // send an http request
@@ -60,7 +120,10 @@ async function sendRequest(url, method='GET', headers={}, body=null) {
     // not json will mainly be plaintext or html
     // nothing more to expect
     // because we control response content-type at server!
-    if (res.headers.get('content-type').match(/json/i)) {
+    // (no body at all, eg. 204 of watchlist changes)
+    if (res.status == 204) {
+        var resBody = null;
+    } else if (res.headers.get('content-type').match(/json/i)) {
         var resBody = await res.json();
     } else {
         var resBody = await res.text();
@@ -74,18 +137,23 @@ async function sendRequest(url, method='GET', headers={}, body=null) {
 
 // when user bid on listing
 // send a post request to server to create a new bid
-async function placeBid(listingId, bidForm) {
+// (or, for max bids, to let server bid for user up to that price)
+// note shown depends on whether user leads after it (eg. a max bid could outbid them right away)
+async function placeBid(
+    listingId, bidForm, action='bid', fieldName='price',
+    note='Your Bid is the Current Bid', outbidNote='You were Outbid by a Max Bid',
+) {
     const body = new URLSearchParams({
-        price: bidForm.querySelector('[name="price"]').value,
+        [fieldName]: bidForm.querySelector(`[name="${fieldName}"]`).value,
     });
     const headers = {
         'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
     };
 
     try {
-        const resBody = await sendRequest(`/listings/${listingId}/bid`, 'POST', headers, body);
+        const resBody = await sendRequest(`/listings/${listingId}/${action}`, 'POST', headers, body);
         // display new bids count
-        updateBidsCount(bidForm);
+        updateBidsCount(bidForm, fieldName, resBody.bid_count, resBody.is_leading ? note : outbidNote);
     } catch (error) {
         console.log(`place_bid | error | ${error.message}`);
         // display any errors to user
@@ -95,6 +163,58 @@ async function placeBid(listingId, bidForm) {
     }
 }
 
+// when user comments on listing
+// send comment to server and show it (rendered by server) on top of comments
+// instead of reloading page
+async function addComment(listingId, commentForm) {
+    const body = new URLSearchParams(new FormData(commentForm));
+    const headers = {
+        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+        'X-Requested-With': 'XMLHttpRequest',
+    };
+
+    try {
+        const fragment = await sendRequest(`/listings/${listingId}/comment`, 'POST', headers, body);
+        const commentList = document.querySelector('.comment-list ul');
+        commentList.querySelectorAll('.no-comments').forEach(elm => elm.remove());
+        commentList.insertAdjacentHTML('afterbegin', fragment);
+        commentForm.reset();
+        commentForm.querySelectorAll('.alert').forEach(elm => elm.remove());
+    } catch (error) {
+        console.log(`add_comment | error | ${error.message}`);
+        renderBidFormErrors(commentForm, JSON.parse(error.message));
+    }
+}
+
+// when user adds/removes listing to/from their watchlist
+// send change to server (which answers with no content)
+// then swap form for the other one (add <-> remove) instead of reloading page
+async function toggleWatchlist(watchlistForm) {
+    const headers = {
+        'X-Requested-With': 'XMLHttpRequest',
+    };
+
+    try {
+        await sendRequest(watchlistForm.action, 'POST', headers);
+        document.querySelectorAll('.watchlist-form').forEach(form => form.hidden = !form.hidden);
+    } catch (error) {
+        console.log(`watchlist | error | ${error.message}`);
+    }
+}
+
+// load next page of (older) comments in place of "load more" button
+// (next page brings its own button, if there are more)
+async function loadMoreComments(button) {
+    button.disabled = true;
+    try {
+        const fragment = await sendRequest(button.dataset.url);
+        button.parentElement.outerHTML = fragment;
+    } catch (error) {
+        console.log(`load_comments | error | ${error.message}`);
+        button.disabled = false;
+    }
+}
+
 document.addEventListener('DOMContentLoaded', () => {
     const listingDiv = document.querySelector('div.listing-details');
     const listingId = listingDiv.dataset.id;
@@ -111,4 +231,42 @@ document.addEventListener('DOMContentLoaded', () => {
             return false;
         }
     }
+
+    const maxBidForm = listingDiv.querySelector('.max-bid-form')
+    if (maxBidForm) {
+        maxBidForm.onsubmit = () => {
+            placeBid(
+                listingId, maxBidForm, 'max_bid', 'max_price',
+                'Your Max Bid is Set', 'Your Max Bid is Set, but an Earlier Max Bid Leads',
+            );
+            return false;
+        }
+    }
+
+    const commentForm = document.querySelector('.new-comment form');
+    if (commentForm) {
+        commentForm.onsubmit = () => {
+            addComment(listingId, commentForm);
+            return false;
+        }
+    }
+
+    // watchlist forms are only shown to logged in users
+    document.querySelectorAll('.watchlist-form').forEach(watchlistForm => {
+        watchlistForm.onsubmit = () => {
+            toggleWatchlist(watchlistForm);
+            return false;
+        }
+    });
+
+    const commentList = document.querySelector('.comment-list');
+    if (commentList) {
+        commentList.addEventListener('click', (e) => {
+            if (e.target.matches('.comments-more button')) {
+                loadMoreComments(e.target);
+            }
+        });
+    }
+
+    subscribeToListingEvents(listingId);
 })
@@ -0,0 +1,11 @@
+from django import template
+
+from auctions import images
+
+
+register = template.Library()
+
+@register.simple_tag
+def listing_image_url(listing, rendition):
+    # local (proxied and resized) url of listing image, see auctions.images
+    return images.image_url(listing, rendition)
@@ -16,18 +16,21 @@ def watchlist_forms(context):
     #  - listing is currently on current user's watchlist
     request = context['request']
     listing = context['listing']
+    # watchlist is loaded once per request (see auctions.watchlist)
+    is_on_watchlist = listing.id in request.watchlist
     can_watch = (
         request.user.is_authenticated
         and listing.is_active
-        and not request.user == listing.owner
-        and not request.user.watchlist.listings.filter(pk=listing.id).exists()
-    )
-    can_unwatch = (
-        request.user.is_authenticated
-        and request.user.watchlist.listings.filter(pk=listing.id).exists()
+        and not request.user.id == listing.owner_id
+        and not is_on_watchlist
     )
+    can_unwatch = is_on_watchlist
+    # scripts toggle between both forms in place (see listing.js)
+    # so the other one is rendered too (hidden) if it'd apply after toggling
+    can_rewatch = can_unwatch and listing.is_active and not request.user.id == listing.owner_id
     return {
         'listing': listing,
         'can_watch': can_watch,
-        'can_unwatch': can_unwatch
+        'can_unwatch': can_unwatch,
+        'can_rewatch': can_rewatch,
     }
@@ -1,7 +1,24 @@
-from django.test import TestCase
+import asyncio
+import http.server
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from .models import Bid, User, Listing
+from . import archive, benchmarking, bidding, categories, database, events, images, metrics, pagination, profiling, search, seeding, writebehind
+from .models import Bid, Category, CategorySummary, Comment, ListingArchive, ProxyBid, User, Listing, WatchlistEntry
 
 
 # init some data
@@ -244,3 +261,1725 @@ class AcceptBidTests(TestCase):
         # pov: db
         self.assertFalse(Listing.objects.first().is_active)
         self.assertTrue(Bid.objects.first().is_winner)
+
+
+class BidSummaryTests(TestCase):
+    """tests for listing's bidding summary (current_price, bid_count, leading_bid)"""
+    def setUp(self):
+        """populate db and config http client"""
+        # populate db
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+
+        listing = Listing.objects.create(owner=foo, **listing_fields)
+
+        # config client
+        self.owner = foo
+        self.bidder = bar
+        self.bidder_login_credentials = bar_credentials
+        self.listing = listing
+
+    def test_new_listing(self):
+        """check that a listing without bids is summarized by its initial price"""
+        self.assertEqual(self.listing.current_price, self.listing.price)
+        self.assertEqual(self.listing.bid_count, 0)
+        self.assertIsNone(self.listing.leading_bid)
+
+    def test_place_bid_updates_summary(self):
+        """check that placing bids updates listing's summary"""
+        self.client.login(**self.bidder_login_credentials)
+        self.client.post(f"/listings/{self.listing.id}/bid", {'price': 20})
+        self.client.post(f"/listings/{self.listing.id}/bid", {'price': 30})
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, 30)
+        self.assertEqual(self.listing.bid_count, 2)
+        self.assertEqual(self.listing.leading_bid, Bid.objects.last())
+
+    def test_display_listing_skips_bids_table(self):
+        """check that listing page reads bidding summary without querying bids"""
+        Bid.objects.create(listing=self.listing, user=self.bidder, price=20)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/listings/{self.listing.id}")
+        bid_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "auctions_bid"' in q['sql']]
+        self.assertEqual(bid_queries, [])
+        self.assertEqual(response.context['bids_count'], 1)
+        self.assertEqual(response.context['max_bid'], 20)
+
+    def test_sync_bid_summary_repairs(self):
+        """check that management command rebuilds a corrupted summary"""
+        bid = Bid.objects.create(listing=self.listing, user=self.bidder, price=20)
+        Listing.objects.filter(pk=self.listing.id).update(bid_count=5, current_price=1, leading_bid=None)
+
+        out = StringIO()
+        call_command('sync_bid_summary', stdout=out)
+        self.assertIn('1 listing(s) repaired', out.getvalue())
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 1)
+        self.assertEqual(self.listing.current_price, 20)
+        self.assertEqual(self.listing.leading_bid, bid)
+
+
+class BiddingEngineTests(TestCase):
+    """tests for bidding.place_bid and bidding.close_listing"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+
+        self.bidder = bar
+        self.bidder_login_credentials = bar_credentials
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+
+    def test_place_bid_fails_outbid(self):
+        """check that a bid not greater than current price is rejected"""
+        bidding.place_bid(self.listing, self.bidder, 20)
+        with self.assertRaises(bidding.Outbid) as cm:
+            bidding.place_bid(self.listing, self.bidder, 20)
+        self.assertEqual(cm.exception.current_price, 20)
+        self.assertEqual(self.listing.bids.count(), 1)
+
+    def test_place_bid_fails_closed(self):
+        """check that bidding on a closed listing is rejected"""
+        bidding.close_listing(self.listing)
+        with self.assertRaises(bidding.ListingClosed):
+            bidding.place_bid(self.listing, self.bidder, 20)
+
+    def test_close_listing_fails_twice(self):
+        """check that a listing could only be closed once"""
+        bidding.place_bid(self.listing, self.bidder, 20)
+        winner = bidding.close_listing(self.listing)
+        self.assertTrue(winner.is_winner)
+        with self.assertRaises(bidding.ListingClosed):
+            bidding.close_listing(self.listing)
+
+    def test_place_bid_view_conflict(self):
+        """check that a bid which passed form check but got outbid
+        before being saved is answered with a conflict
+        """
+        self.client.login(**self.bidder_login_credentials)
+        bidding.place_bid(self.listing, self.bidder, 50)
+
+        # simulate view reading max bid price before the above bid got in
+        with mock.patch('auctions.utils.get_max_bid_price', return_value=self.listing.price):
+            response = self.client.post(f"/listings/{self.listing.id}/bid", {'price': 30})
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('outbid', response.json())
+        self.assertEqual(self.listing.bids.count(), 1)
+
+
+class ListingExpiryTests(TestCase):
+    """tests for listings end time (bidding.close_expired_listings)"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+        now = timezone.now()
+
+        self.owner = foo
+        self.bidder = bar
+        self.ended = Listing.objects.create(owner=foo, ends_at=now - timedelta(minutes=1), **listing_fields)
+        self.ending = Listing.objects.create(owner=foo, ends_at=now + timedelta(hours=1), **listing_fields)
+        self.endless = Listing.objects.create(owner=foo, **listing_fields)
+
+    def test_no_bids_after_end(self):
+        """check that bids are rejected once end time has passed, even before closing"""
+        with self.assertRaises(bidding.ListingClosed):
+            bidding.place_bid(self.ended, self.bidder, 20)
+        bidding.place_bid(self.ending, self.bidder, 20)
+        bidding.place_bid(self.endless, self.bidder, 20)
+
+    def test_close_expired(self):
+        """check that only due listings get closed, with their leading bids as winners"""
+        bid = bidding.place_bid(self.ending, self.bidder, 20)
+
+        self.assertEqual(bidding.close_expired_listings(), [self.ended.id])
+        self.assertEqual(bidding.close_expired_listings(), [])
+
+        later = timezone.now() + timedelta(hours=2)
+        self.assertEqual(bidding.close_expired_listings(later), [self.ending.id])
+        bid.refresh_from_db()
+        self.assertTrue(bid.is_winner)
+        self.assertEqual(
+            set(Listing.objects.filter(is_active=True).values_list('id', flat=True)),
+            {self.endless.id},
+        )
+
+    def test_command_batches(self):
+        """check that command closes all due listings, batch by batch"""
+        past = timezone.now() - timedelta(minutes=1)
+        Listing.objects.bulk_create(
+            Listing(owner=self.owner, ends_at=past, current_price=10, **listing_fields)
+            for _ in range(24)
+        )
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('close_expired_listings', batch_size=10, stdout=out)
+        self.assertIn('25 listing(s) closed.', out.getvalue())
+        self.assertFalse(Listing.objects.filter(is_active=True, ends_at__lte=past).exists())
+        # same few queries per batch, whatever the batch size
+        # (savepoint, close due, read closed back, release; no bids: no winners to mark)
+        self.assertEqual(len(queries), 3 * 4)
+        self.assertEqual(bidding.next_expiry(), self.ending.ends_at)
+
+    def test_worker_survives_db_errors(self):
+        """check that worker (--loop) retries after db errors (eg. db locked) instead of exiting"""
+        close = bidding.close_expired_listings
+        calls = []
+
+        def close_expired_listings(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            if len(calls) == 3:
+                # (stop worker)
+                raise KeyboardInterrupt
+            return close(*args)
+
+        out = StringIO()
+        with mock.patch.object(bidding, 'close_expired_listings', side_effect=close_expired_listings), \
+                mock.patch('time.sleep'), self.assertLogs('auctions', 'WARNING'), \
+                mock.patch('auctions.management.commands.close_expired_listings.close_old_connections') as close_old:
+            call_command('close_expired_listings', loop=True, stdout=out)
+        self.assertEqual(len(calls), 3)
+        close_old.assert_called_once()
+        self.assertIn('1 listing(s) closed.', out.getvalue())
+        self.assertFalse(Listing.objects.get(pk=self.ended.pk).is_active)
+
+    def test_create_listing_end_time(self):
+        """check that end time of a new listing must be in the future"""
+        self.client.login(**foo_credentials)
+        data = {'title': 'title', 'description': 'description', 'price': 10}
+        response = self.client.post('/listings/new', {**data, 'ends_at': '2000-01-01T00:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ends_at', response.context['form'].errors)
+
+        ends_at = (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M')
+        response = self.client.post('/listings/new', {**data, 'ends_at': ends_at})
+        self.assertEqual(response.status_code, 302)
+
+
+class ProxyBiddingTests(TestCase):
+    """tests for max (proxy) bids (bidding.place_max_bid)"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        self.bar = User.objects.create_user(**bar_credentials)
+        self.baz = User.objects.create_user(username='baz', password='baz')
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+
+    def assertSummary(self, current_price, leader, bid_count):
+        listing = Listing.objects.select_related('leading_bid').get(pk=self.listing.pk)
+        self.assertEqual(listing.current_price, current_price)
+        self.assertEqual(listing.leading_bid.user, leader)
+        self.assertEqual(listing.bid_count, bid_count)
+
+    def test_lone_max_bid(self):
+        """check that a max bid just beats current price"""
+        bidding.place_max_bid(self.listing, self.bar, 100)
+        self.assertSummary(11, self.bar, 1)
+
+    def test_resolved_in_one_bid(self):
+        """check that competing max bids end up in one bid (no bid war)"""
+        bidding.place_max_bid(self.listing, self.bar, 100)
+        bidding.place_max_bid(self.listing, self.baz, 50)
+        # bar leads by runner-up's max + increment
+        self.assertSummary(51, self.bar, 2)
+
+        bidding.place_max_bid(self.listing, self.baz, 200)
+        self.assertSummary(101, self.baz, 3)
+        prices = list(self.listing.bids.values_list('price', flat=True))
+        self.assertEqual(prices, sorted(prices))
+
+    def test_tie_goes_to_earliest(self):
+        """check that of equal max bids, earliest one leads"""
+        bidding.place_max_bid(self.listing, self.bar, 100)
+        bidding.place_max_bid(self.listing, self.baz, 100)
+        self.assertSummary(100, self.bar, 2)
+
+    def test_manual_bid_outbid_by_proxy(self):
+        """check that a plain bid under someone's max price is outbid right away"""
+        bidding.place_max_bid(self.listing, self.bar, 100)
+        bidding.place_bid(self.listing, self.baz, 60)
+        self.assertSummary(61, self.bar, 3)
+
+        bidding.place_bid(self.listing, self.baz, 150)
+        self.assertSummary(150, self.baz, 4)
+
+    def test_view_outbid_by_proxy(self):
+        """check that bid view tells bidder they were outbid right away by a max bid"""
+        bidding.place_max_bid(self.listing, self.bar, 100)
+        self.client.login(username='baz', password='baz')
+        response = self.client.post(f'/listings/{self.listing.id}/bid', {'price': 60})
+        self.assertEqual(response.json(), {'bid_count': 3, 'current_price': '61.00', 'is_leading': False})
+        response = self.client.post(f'/listings/{self.listing.id}/bid', {'price': 150})
+        self.assertEqual(response.json(), {'bid_count': 4, 'current_price': '150.00', 'is_leading': True})
+
+    def test_max_bid_rejected(self):
+        """check that max bids under current price (or user's own max) are rejected"""
+        bidding.place_bid(self.listing, self.baz, 60)
+        with self.assertRaises(bidding.Outbid):
+            bidding.place_max_bid(self.listing, self.bar, 60)
+        bidding.place_max_bid(self.listing, self.bar, 100)
+        with self.assertRaises(bidding.MaxBidTooLow):
+            bidding.place_max_bid(self.listing, self.bar, 90)
+        self.assertEqual(ProxyBid.objects.get().max_price, 100)
+
+    def test_resolution_queries(self):
+        """check that resolving takes same queries whatever number of max bids"""
+        def queries_of_max_bid(user, max_price):
+            with CaptureQueriesContext(connection) as queries:
+                bidding.place_max_bid(self.listing, user, max_price)
+            return len(queries)
+
+        first = queries_of_max_bid(self.bar, 20)
+        ProxyBid.objects.bulk_create(
+            ProxyBid(listing=self.listing, user=User.objects.create(username=f'user{i}'), max_price=15)
+            for i in range(100)
+        )
+        self.assertEqual(queries_of_max_bid(self.baz, 200), first)
+        self.assertSummary(21, self.baz, 2)
+
+    def test_view(self):
+        """check that max bids are placed through view"""
+        self.client.login(**bar_credentials)
+        response = self.client.post(f'/listings/{self.listing.id}/max_bid', {'max_price': 100})
+        self.assertEqual(response.json(), {'bid_count': 1, 'current_price': '11.00', 'is_leading': True})
+
+        response = self.client.post(f'/listings/{self.listing.id}/max_bid', {'max_price': 5})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/listings/{self.listing.id}/max_bid', {'max_price': 50})
+        self.assertEqual(response.status_code, 409)
+
+
+class ListingEventsTests(TestCase):
+    """tests for real-time listing events (auctions.events) served by asgi app"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+        self.bidder = bar
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+
+    def stream_events(self, publish):
+        """connect to listing's events stream, run `publish` (sync)
+        and return everything streamed until client disconnects
+        """
+        from commerce.asgi import application
+
+        async def run():
+            sent = []
+            streaming = asyncio.Event()
+            disconnect = asyncio.Event()
+            messages = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message.get('more_body'):
+                    streaming.set()
+
+            scope = {'type': 'http', 'method': 'GET', 'path': f'/listings/{self.listing.id}/events'}
+            app = asyncio.ensure_future(application(scope, receive, send))
+            await streaming.wait()
+            await asyncio.get_running_loop().run_in_executor(None, publish)
+            # let published events get delivered before disconnecting
+            await asyncio.sleep(0.1)
+            disconnect.set()
+            await app
+            return sent
+
+        sent = asyncio.run(run())
+        self.assertEqual(sent[0]['status'], 200)
+        return b''.join(m.get('body', b'') for m in sent[1:])
+
+    def test_bid_pushed(self):
+        """check that subscribers get new bids (price and count)"""
+        def publish():
+            events.get_broker().publish(
+                events.listing_channel(self.listing.id),
+                {'type': 'bid', 'listing_id': self.listing.id, 'bid_count': 1, 'current_price': '20.00'},
+            )
+
+        body = self.stream_events(publish)
+        self.assertIn(b'event: bid\n', body)
+        self.assertIn(b'"bid_count": 1', body)
+
+    def test_place_bid_publishes_on_commit(self):
+        """check that bidding engine publishes bids and closing (once committed)"""
+        broker = events.InProcessBroker()
+        with mock.patch('auctions.events._broker', broker), mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                bidding.place_bid(self.listing, self.bidder, 20)
+                publish.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                bidding.close_listing(self.listing)
+
+        channel = events.listing_channel(self.listing.id)
+        (bid_channel, bid_event), (closed_channel, closed_event) = [c.args for c in publish.call_args_list]
+        self.assertEqual((bid_channel, closed_channel), (channel, channel))
+        self.assertEqual(bid_event['bid_count'], 1)
+        self.assertEqual(bid_event['current_price'], 20)
+        self.assertEqual(closed_event['type'], 'closed')
+        # (viewers render closed state from event itself)
+        self.assertEqual((closed_event['bid_count'], closed_event['current_price']), (1, 20))
+
+    def test_expired_publishes_closed(self):
+        """check that closing expired listings publishes their final summary"""
+        bidding.place_bid(self.listing, self.bidder, 20)
+        Listing.objects.filter(pk=self.listing.pk).update(ends_at=timezone.now() - timedelta(minutes=1))
+        broker = events.InProcessBroker()
+        with mock.patch('auctions.events._broker', broker), mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                bidding.close_expired_listings()
+        channel, event = publish.call_args.args
+        self.assertEqual(channel, events.listing_channel(self.listing.id))
+        self.assertEqual(
+            (event['type'], event['bid_count'], event['current_price']), ('closed', 1, 20),
+        )
+
+    def test_unsubscribed_on_disconnect(self):
+        """check that closed connections don't leak subscriptions"""
+        self.stream_events(lambda: None)
+        self.assertNotIn(events.listing_channel(self.listing.id), events.get_broker().subscriptions)
+
+
+class AsyncViewsTests(TransactionTestCase):
+    """tests for async variants of read-heavy pages
+    (transactional: their queries run in other threads, with own db connections)
+    """
+    def setUp(self):
+        """populate db and clear cache"""
+        cache.clear()
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+        category = Category.objects.create(name='category#1')
+
+        self.listing = Listing.objects.create(owner=foo, category=category, **listing_fields)
+        Comment.objects.create(listing=self.listing, user=bar, content='nice item')
+        bar.watched_listings.add(self.listing)
+
+        self.viewer = bar
+        self.category = category
+
+    def normalize(self, response):
+        # csrf tokens are masked differently on each render
+        content = response.content.decode().replace('/async', '')
+        return re.sub(r'name="csrfmiddlewaretoken" value="[^"]*"', '', content)
+
+    def test_pages_match_sync_pages(self):
+        """check that async pages show same content as sync ones"""
+        self.client.force_login(self.viewer)
+        for sync_url, async_url in (
+            ('/', '/async/'),
+            (f'/listings/{self.listing.id}', f'/async/listings/{self.listing.id}'),
+            ('/categories', '/async/categories'),
+            (f'/categories/{self.category.id}', f'/async/categories/{self.category.id}'),
+        ):
+            with self.subTest(url=async_url):
+                sync_response = self.client.get(sync_url)
+                async_response = self.client.get(async_url)
+                self.assertEqual(async_response.status_code, 200)
+                self.assertEqual(self.normalize(async_response), self.normalize(sync_response))
+
+    def test_not_found(self):
+        """check that missing listings/categories are 404s"""
+        self.assertEqual(self.client.get(f'/async/listings/{self.listing.id + 1}').status_code, 404)
+        self.assertEqual(self.client.get(f'/async/categories/{self.category.id + 1}').status_code, 404)
+
+    def test_listing_json(self):
+        """check that listing api gathers listing, comments and watchlist state"""
+        data = self.client.get(f'/async/api/listings/{self.listing.id}').json()
+        self.assertEqual(data['title'], self.listing.title)
+        self.assertEqual(data['comments'], [{'user': 'bar', 'content': 'nice item'}])
+        self.assertFalse(data['is_watched'])
+
+        self.client.force_login(self.viewer)
+        data = self.client.get(f'/async/api/listings/{self.listing.id}').json()
+        self.assertTrue(data['is_watched'])
+
+
+class ConcurrentBiddingTests(TransactionTestCase):
+    """stress tests for bidding engine under concurrent bidders"""
+    bidders_count = 8
+    bids_per_bidder = 40
+
+    def setUp(self):
+        """populate db"""
+        owner = User.objects.create_user(**foo_credentials)
+        self.bidders = [
+            User.objects.create_user(username=f'bidder{i}', password='bidder')
+            for i in range(self.bidders_count)
+        ]
+        self.listing = Listing.objects.create(owner=owner, **listing_fields)
+
+    def run_concurrently(self, targets):
+        """run each of `targets` in its own thread and wait for all of them"""
+        barrier = threading.Barrier(len(targets))
+        errors = []
+
+        def run(target):
+            barrier.wait()
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def bid_repeatedly(self, bidder, outcomes):
+        """keep bidding (on top of current price) as `bidder`"""
+        for i in range(self.bids_per_bidder):
+            price = Listing.objects.get(pk=self.listing.id).current_price + 1 + i % 3
+            try:
+                bidding.place_bid(self.listing, bidder, price)
+                outcomes.append('placed')
+            except bidding.Outbid:
+                outcomes.append('outbid')
+            except bidding.ListingClosed:
+                outcomes.append('closed')
+
+    def test_prices_are_monotonic(self):
+        """check that concurrent bids are stored in increasing price order"""
+        outcomes = []
+        self.run_concurrently([
+            lambda bidder=bidder: self.bid_repeatedly(bidder, outcomes)
+            for bidder in self.bidders
+        ])
+
+        prices = list(self.listing.bids.order_by('id').values_list('price', flat=True))
+        self.assertEqual(len(outcomes), self.bidders_count * self.bids_per_bidder)
+        self.assertEqual(len(prices), outcomes.count('placed'))
+        self.assertTrue(all(a < b for a, b in zip(prices, prices[1:])))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, len(prices))
+        self.assertEqual(self.listing.current_price, prices[-1])
+        self.assertEqual(self.listing.leading_bid, self.listing.bids.last())
+
+    def test_exactly_one_winner(self):
+        """check that closing a listing during a bidding burst
+        marks exactly one (the last) bid as winner
+        """
+        outcomes = []
+        closers = []
+
+        def close():
+            for _ in range(self.bids_per_bidder):
+                try:
+                    closers.append(bidding.close_listing(self.listing))
+                except bidding.ListingClosed:
+                    pass
+
+        self.run_concurrently(
+            [lambda bidder=bidder: self.bid_repeatedly(bidder, outcomes) for bidder in self.bidders]
+            + [close, close]
+        )
+
+        self.assertEqual(len(closers), 1)
+        winners = Bid.objects.filter(listing=self.listing, is_winner=True)
+        if closers[0] is None:
+            self.assertFalse(winners.exists())
+        else:
+            self.assertEqual(list(winners), [self.listing.bids.last()])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked for sqlite only')
+class IndexUsageTests(TestCase):
+    """check that hot listing queries are answered by partial indexes (not table scans)"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(f'USING INDEX {index_name}', queryset.explain())
+
+    def test_active_listings_pages(self):
+        active = Listing.objects.filter(is_active=True).order_by('-id')
+        self.assertUsesIndex(active[:10], 'listing_active_idx')
+        self.assertUsesIndex(active.filter(category_id=1)[:10], 'listing_active_category_idx')
+        self.assertUsesIndex(active.filter(owner_id=self.listing.owner_id)[:10], 'listing_active_owner_idx')
+
+
+@mock.patch('auctions.pagination.PAGE_SIZE', 2)
+class PaginationTests(TestCase):
+    """tests for keyset pagination of listings pages"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        self.listings = [Listing.objects.create(owner=foo, **listing_fields) for _ in range(5)]
+        self.ids = [listing.id for listing in self.listings]
+
+    def test_first_page(self):
+        """check that first page has newest listings and only a next link"""
+        response = self.client.get('/')
+        page = response.context['page']
+        self.assertEqual([l.id for l in page], self.ids[:-3:-1])
+        self.assertIsNone(page.previous_url)
+        self.assertEqual(page.next_url, f'/?after={self.ids[3]}')
+
+    def test_walk_forth_and_back(self):
+        """check that following next then previous links gets same pages"""
+        first = self.client.get('/').context['page']
+        second = self.client.get(first.next_url).context['page']
+        last = self.client.get(second.next_url).context['page']
+        self.assertEqual([l.id for l in second], [self.ids[2], self.ids[1]])
+        self.assertEqual([l.id for l in last], [self.ids[0]])
+        self.assertIsNone(last.next_url)
+
+        back = self.client.get(last.previous_url).context['page']
+        self.assertEqual([l.id for l in back], [l.id for l in second])
+        back = self.client.get(back.previous_url).context['page']
+        self.assertEqual([l.id for l in back], [l.id for l in first])
+        self.assertIsNone(back.previous_url)
+
+    def test_json_variant(self):
+        """check that pages could be fetched as json"""
+        response = self.client.get('/?format=json')
+        data = response.json()
+        self.assertEqual([l['id'] for l in data['results']], self.ids[:-3:-1])
+        self.assertEqual(data['next'], f'/?format=json&after={self.ids[3]}')
+        self.assertIsNone(data['previous'])
+
+        response = self.client.get(f'/users/{foo_credentials["username"]}?format=json')
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_invalid_cursor(self):
+        """check that a malformed cursor is rejected"""
+        response = self.client.get('/?after=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class WatchlistTests(TestCase):
+    """tests for watchlist views and per-request watchlist (request.watchlist)"""
+    def setUp(self):
+        """populate db and config http client"""
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+        self.watcher = bar
+        self.client.force_login(bar)
+
+    def test_add_and_remove(self):
+        """check that listings could be watched then unwatched (but not twice)"""
+        response = self.client.post(f"/listings/{self.listing.id}/watch")
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.watcher.watched_listings.filter(pk=self.listing.id).exists())
+        response = self.client.post(f"/listings/{self.listing.id}/watch")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(f"/listings/{self.listing.id}/unwatch")
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(self.watcher.watched_listings.exists())
+        response = self.client.post(f"/listings/{self.listing.id}/unwatch")
+        self.assertEqual(response.status_code, 400)
+
+    def test_users_created_anyhow(self):
+        """check that users not created by signing up (eg. superusers) have a watchlist too"""
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin)
+        self.assertContains(self.client.get(f"/listings/{self.listing.id}"), 'Add to Watchlist')
+        self.client.post(f"/listings/{self.listing.id}/watch")
+        self.assertEqual(list(admin.watched_listings.all()), [self.listing])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/watchlist')
+        self.assertContains(response, self.listing.title)
+        # listings of watchlist: one join with entries of user
+        listing_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "auctions_listing"' in q['sql']]
+        self.assertEqual(len(listing_queries), 1)
+        self.assertEqual(listing_queries[0].count('JOIN'), 1)
+        self.assertIn('"auctions_watchlistentry"."user_id" =', listing_queries[0])
+
+    def test_loaded_once_per_request(self):
+        """check that layout and watchlist forms share one watchlist query"""
+        self.watcher.watched_listings.add(self.listing)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/listings/{self.listing.id}")
+        self.assertContains(response, 'Remove from Watchlist')
+        watchlist_queries = [q for q in ctx.captured_queries if 'auctions_watchlist' in q['sql']]
+        self.assertEqual(len(watchlist_queries), 1)
+
+    @override_settings(WATCHLIST_CACHE_TIMEOUT=60)
+    def test_cached_across_requests(self):
+        """check that cached watchlist skips db and is invalidated on add/remove"""
+        cache.clear()
+        self.client.get('/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/')
+        self.assertFalse([q for q in ctx.captured_queries if 'auctions_watchlist' in q['sql']])
+
+        self.client.post(f"/listings/{self.listing.id}/watch")
+        response = self.client.get(f"/listings/{self.listing.id}")
+        self.assertContains(response, 'Remove from Watchlist')
+
+
+class PageCacheTests(TestCase):
+    """tests for caching of anonymous pages and listing fragments (auctions.caching)"""
+    def setUp(self):
+        """populate db and clear cache"""
+        cache.clear()
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+        self.owner = foo
+        self.bidder = bar
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+
+    def assertCached(self, url):
+        """check that a second visit to `url` doesn't touch db"""
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_pages_cached(self):
+        """check that anonymous pages are served from cache"""
+        for url in ('/', f'/listings/{self.listing.id}', '/categories'):
+            with self.subTest(url=url):
+                self.assertCached(url)
+
+    def test_new_listing_invalidates_index(self):
+        """check that index shows a listing created after it was cached"""
+        self.assertCached('/')
+        Listing.objects.create(owner=self.owner, **dict(listing_fields, title='fresh listing'))
+        self.assertContains(self.client.get('/'), 'fresh listing')
+
+    def test_bid_invalidates_listing_page(self):
+        """check that a cached listing page never shows a stale bids count"""
+        self.assertContains(self.assertCached(f'/listings/{self.listing.id}'), '0 bids so far')
+        bidding.place_bid(self.listing, self.bidder, 20)
+        self.assertContains(self.client.get(f'/listings/{self.listing.id}'), '1 bid so far')
+
+    def test_close_invalidates_pages(self):
+        """check that closed listings leave cached index and show closed on listing page"""
+        self.assertContains(self.assertCached('/'), self.listing.title)
+        self.assertCached(f'/listings/{self.listing.id}')
+        bidding.close_listing(self.listing)
+        self.assertNotContains(self.client.get('/'), self.listing.title)
+        self.assertContains(self.client.get(f'/listings/{self.listing.id}'), 'Closed')
+
+    def test_comment_invalidates_fragment(self):
+        """check that cached comments list of loggedin users shows new comments"""
+        self.client.force_login(self.bidder)
+        self.assertContains(self.client.get(f'/listings/{self.listing.id}'), 'No comments yet')
+        self.client.post(f'/listings/{self.listing.id}/comment', {'content': 'nice item'})
+        self.assertContains(self.client.get(f'/listings/{self.listing.id}'), 'nice item')
+
+    def test_loggedin_pages_not_cached(self):
+        """check that pages of loggedin users are always rendered"""
+        self.client.force_login(self.bidder)
+        self.client.get('/')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/')
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+
+class ApiTests(TestCase):
+    """tests for read-only json api (auctions.api)"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+        self.category = Category.objects.create(name='category#1')
+        self.listing = Listing.objects.create(owner=foo, category=self.category, **listing_fields)
+        self.closed_listing = Listing.objects.create(owner=foo, is_active=False, **listing_fields)
+        self.bidder = bar
+
+    def test_listings(self):
+        """check that active listings are listed with selected fields only"""
+        response = self.client.get('/api/v1/listings?fields=id,title,owner')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': self.listing.id, 'title': self.listing.title, 'owner': 'foo'},
+        ])
+
+    def test_unknown_field(self):
+        """check that selecting unknown fields is rejected"""
+        self.assertEqual(self.client.get('/api/v1/listings?fields=id,password').status_code, 400)
+
+    def test_listing_detail_conditional(self):
+        """check that unchanged listings are answered with 304 until a bid changes them"""
+        response = self.client.get(f'/api/v1/listings/{self.listing.id}')
+        self.assertEqual(response.json()['current_price'], '10.00')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = self.client.get(f'/api/v1/listings/{self.listing.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        bidding.place_bid(self.listing, self.bidder, 20)
+        response = self.client.get(f'/api/v1/listings/{self.listing.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_price'], '20.00')
+
+    def test_listings_conditional(self):
+        """check that an unchanged page of listings is answered with 304"""
+        etag = self.client.get('/api/v1/listings')['ETag']
+        response = self.client.get('/api/v1/listings', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_listing_bids(self):
+        """check that bids of a listing are listed newest first"""
+        bidding.place_bid(self.listing, self.bidder, 20)
+        bidding.place_bid(self.listing, self.bidder, 30)
+        results = self.client.get(f'/api/v1/listings/{self.listing.id}/bids').json()['results']
+        self.assertEqual([bid['price'] for bid in results], ['30.00', '20.00'])
+        self.assertEqual(self.client.get(f'/api/v1/listings/{self.listing.id + 100}/bids').status_code, 404)
+
+    def test_categories(self):
+        """check that categories are listed"""
+        response = self.client.get('/api/v1/categories')
+        self.assertEqual(response.json()['results'], [{'id': self.category.id, 'name': 'category#1'}])
+
+    def test_export(self):
+        """check that export streams every listing (active or not) as ndjson"""
+        response = self.client.get('/api/v1/listings/export?fields=id,is_active')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'id': self.listing.id, 'is_active': True},
+            {'id': self.closed_listing.id, 'is_active': False},
+        ])
+
+
+class SearchTests(TestCase):
+    """tests for listings full-text search (auctions.search)"""
+    def setUp(self):
+        """populate db"""
+        foo = User.objects.create_user(**foo_credentials)
+        self.cameras = Category.objects.create(name='cameras')
+        self.camera = Listing.objects.create(
+            owner=foo, category=self.cameras, title='Vintage camera',
+            description='old film camera, works fine', price=50,
+        )
+        self.lens = Listing.objects.create(
+            owner=foo, category=self.cameras, title='Zoom lens',
+            description='fits any vintage camera', price=20,
+        )
+        self.bike = Listing.objects.create(
+            owner=foo, title='Road bike', description='light and fast', price=300,
+        )
+        self.closed = Listing.objects.create(
+            owner=foo, title='Broken camera', description='for parts', price=5, is_active=False,
+        )
+
+    def assertFound(self, query, listings, **filters):
+        self.assertEqual(search.search(query, **filters), listings)
+
+    def test_prefix_and_all_terms(self):
+        """check that terms match as prefixes and listings must match all of them"""
+        self.assertFound('cam', [self.camera, self.lens])
+        self.assertFound('vintage lens', [self.lens])
+        self.assertFound('camera bike', [])
+        self.assertFound('  ', [])
+
+    def test_title_ranked_first(self):
+        """check that a title match outranks a description match"""
+        self.assertFound('camera', [self.camera, self.lens])
+        self.assertFound('vintage', [self.camera, self.lens])
+
+    def test_filters(self):
+        """check filtering by state, category and price"""
+        self.assertFound('camera', [self.camera, self.closed, self.lens], is_active=None)
+        self.assertFound('camera', [self.closed], is_active=False)
+        self.assertFound('light', [], category_id=self.cameras.id)
+        self.assertFound('camera', [self.lens], max_price=20)
+        self.assertFound('camera', [self.camera], min_price=21)
+
+    def test_index_kept_in_sync(self):
+        """check that edited/deleted listings and renamed categories are reindexed"""
+        self.bike.title = 'Mountain bike'
+        self.bike.save()
+        self.assertFound('mountain', [self.bike])
+        self.assertFound('road', [])
+
+        self.cameras.name = 'photography'
+        self.cameras.save()
+        # equally ranked, newest first
+        self.assertFound('photo', [self.lens, self.camera])
+
+        self.lens.delete()
+        self.assertFound('photo', [self.camera])
+
+    def test_inverted_index_backend(self):
+        """check that fallback (db agnostic) backend finds and ranks the same"""
+        with mock.patch.object(search, '_backend', search.InvertedIndexBackend()):
+            search.rebuild_index()
+            self.assertFound('cam', [self.camera, self.lens])
+            self.assertFound('vintage lens', [self.lens])
+            self.assertFound('camera', [self.lens], max_price=20)
+
+            self.bike.title = 'Mountain bike'
+            self.bike.save()
+            self.assertFound('mountain', [self.bike])
+
+    def test_view(self):
+        """check search page, its json variant and invalid params"""
+        response = self.client.get('/search', {'q': 'camera'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['listings']), [self.camera, self.lens])
+
+        response = self.client.get('/search', {'q': 'camera', 'include_closed': 'on', 'format': 'json'})
+        self.assertEqual(
+            [listing['id'] for listing in response.json()['results']],
+            [self.camera.id, self.closed.id, self.lens.id],
+        )
+
+        self.assertEqual(self.client.get('/search', {'q': 'camera', 'min_price': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/search').status_code, 200)
+
+
+class SeedingTests(TestCase):
+    """tests for bulk seeding (auctions.seeding)"""
+    def test_seed(self):
+        """check that seeded data is consistent (bidding summary, winners, search index)"""
+        counts = seeding.Seeder(batch_size=50).seed(
+            users=20, categories=3, listings=120, bids_per_listing=3, comments_per_listing=1, watched_per_user=2,
+        )
+        self.assertEqual(Listing.objects.count(), 120)
+        self.assertEqual(Bid.objects.count(), counts['bids'])
+        self.assertEqual(WatchlistEntry.objects.count(), counts['watchlist entries'])
+
+        out = StringIO()
+        call_command('sync_bid_summary', dry_run=True, stdout=out)
+        self.assertIn('0 listing(s) out of sync', out.getvalue())
+        self.assertEqual(
+            Bid.objects.filter(is_winner=True).count(),
+            Listing.objects.filter(is_active=False, bid_count__gt=0).count(),
+        )
+        listing = Listing.objects.first()
+        self.assertIn(listing, search.search(listing.title, is_active=None))
+        self.assertTrue(self.client.login(username='user0', password=seeding.SEED_PASSWORD))
+
+
+class BenchmarkingTests(TransactionTestCase):
+    """tests for per-url benchmarks (auctions.benchmarking)
+    (transactional: async views query from other threads, with own db connections)
+    """
+    def test_run_benchmarks(self):
+        """check that every url is benchmarked successfully with all metrics"""
+        seeding.Seeder(batch_size=50).seed(users=20, categories=3, listings=40)
+        results = benchmarking.run_benchmarks(repeat=1)
+
+        names = {name for name, _ in benchmarking.named_urls()}
+        self.assertLessEqual(names, set(results))
+        for label, metrics in results.items():
+            self.assertLess(metrics['status'], 400, label)
+        self.assertEqual(results['api_categories']['queries'], 1)
+        self.assertGreater(results['display_listing']['render_ms'], 0)
+        self.assertGreater(results['async_display_listing']['db_ms'], 0)
+
+    def test_compare(self):
+        """check that only changes beyond thresholds (and new urls) are reported, increases as regressions"""
+        metrics = {'status': 200, 'wall_ms': 40.0, 'queries': 4, 'db_ms': 1.0, 'render_ms': 5.0, 'peak_kb': 300.0}
+        baseline = {'100': {'index': metrics, 'login': metrics}}
+        results = {'100': {
+            'index': {**metrics, 'wall_ms': 50.0, 'queries': 5},
+            'login': {**metrics, 'wall_ms': 8.0, 'status': 500},
+            'new_url': metrics,
+        }}
+        self.assertEqual(benchmarking.compare(baseline, results), [
+            ('100', 'index', 'queries', 4, 5, True),
+            ('100', 'login', 'status', 200, 500, True),
+            ('100', 'login', 'wall_ms', 40.0, 8.0, False),
+            ('100', 'new_url', 'status', None, 200, False),
+        ])
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1)
+class ProfilingTests(TestCase):
+    """tests for request profiling (auctions.profiling)"""
+    def setUp(self):
+        """populate db, clear cache and report"""
+        cache.clear()
+        profiling.report.clear()
+        foo = User.objects.create_user(**foo_credentials)
+        User.objects.create_user(username='admin', password='admin', is_staff=True)
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+
+    def test_server_timing(self):
+        """check that profiled responses break their time down"""
+        response = self.client.get(f'/listings/{self.listing.id}')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+;desc="templates", total;dur=[\d.]+$')
+
+    def test_report(self):
+        """check that profiles are aggregated by url, with queries and templates"""
+        self.client.login(**foo_credentials)
+        for _ in range(2):
+            self.client.get(f'/listings/{self.listing.id}')
+        self.client.get('/')
+
+        stats = profiling.report.as_dict()['display_listing']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['avg_queries'], 0)
+        self.assertTrue(any('auctions_listing' in sql['sql'] for sql in stats['sql']))
+        templates = {template['name'] for template in stats['templates']}
+        self.assertLessEqual(
+            {'auctions/listing.html', 'auctions/layout.html', 'auctions/watchlist_forms.html'}, templates,
+        )
+        self.assertNotIn('cprofile', stats)
+
+        # staff only
+        self.assertEqual(self.client.get('/profiling/report').status_code, 302)
+        self.client.login(username='admin', password='admin')
+        response = self.client.get('/profiling/report')
+        self.assertIn('index', response.json())
+
+    def test_sql_grouped(self):
+        """check that statements differing only by IN list length or literals are grouped, and bounded"""
+        self.assertEqual(
+            profiling.normalize_sql('SELECT "x" FROM "t" U0 WHERE "id" IN (%s, %s, %s) AND "a" = \'b\' LIMIT 21 OFFSET 40'),
+            'SELECT "x" FROM "t" U0 WHERE "id" IN (...) AND "a" = ? LIMIT ? OFFSET ?',
+        )
+        stats = profiling.UrlStats()
+        for i in range(profiling.MAX_SQL + 50):
+            profile = profiling.RequestProfile()
+            profile.sql = {f'statement {"x" * i}': [1, 0.001]}
+            stats.add(profile, 0.01)
+        self.assertEqual(len(stats.sql), profiling.MAX_SQL + 1)
+        self.assertEqual(stats.sql[profiling.OTHER_SQL][0], 50)
+
+    @override_settings(PROFILING_CPROFILE=True)
+    def test_cprofile(self):
+        """check that cProfile stats are reported if enabled"""
+        self.client.get('/')
+        self.assertIn('cumulative', profiling.report.as_dict()['index']['cprofile'])
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        """check that nothing is profiled by default"""
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(profiling.report.as_dict(), {})
+
+
+class MetricsTests(TestCase):
+    """tests for metrics (auctions.metrics)"""
+    def setUp(self):
+        """populate db and reset metrics"""
+        cache.clear()
+        for metric in metrics.registry.metrics.values():
+            metric.reset()
+        self.foo = User.objects.create_user(**foo_credentials)
+        self.bar = User.objects.create_user(**bar_credentials)
+        self.listing = Listing.objects.create(owner=self.foo, **listing_fields)
+
+    def test_bids(self):
+        """check that bids are counted by outcome"""
+        self.client.login(**bar_credentials)
+        # proxy bids for bar
+        self.client.post(f'/listings/{self.listing.id}/max_bid', {'max_price': self.listing.price + 10})
+        self.client.post(f'/listings/{self.listing.id}/bid', {'price': self.listing.price + 20})
+        # rejected by form (price too low)
+        self.client.post(f'/listings/{self.listing.id}/bid', {'price': 1})
+
+        self.assertEqual(metrics.BIDS.get(kind='bid', outcome='placed'), 1)
+        self.assertEqual(metrics.BIDS.get(kind='bid', outcome='rejected'), 1)
+        self.assertEqual(metrics.BIDS.get(kind='max_bid', outcome='placed'), 1)
+        self.assertEqual(metrics.PROXY_BIDS.get(), 1)
+
+        self.client.login(**foo_credentials)
+        self.client.post(f'/listings/{self.listing.id}/close')
+        self.assertEqual(metrics.ACCEPTED_BIDS.get(outcome='accepted'), 1)
+        self.assertEqual(metrics.LISTINGS_CLOSED.get(reason='accepted'), 1)
+
+    def test_comments_and_watchlist(self):
+        """check that comments and watchlist changes are counted"""
+        self.client.login(**bar_credentials)
+        self.client.post(f'/listings/{self.listing.id}/comment', {'content': 'nice'})
+        self.client.post(f'/listings/{self.listing.id}/watch')
+        self.client.post(f'/listings/{self.listing.id}/watch')
+        self.client.post(f'/listings/{self.listing.id}/unwatch')
+
+        self.assertEqual(metrics.COMMENTS.get(outcome='added'), 1)
+        self.assertEqual(metrics.WATCHLIST_CHANGES.get(action='add', outcome='done'), 1)
+        self.assertEqual(metrics.WATCHLIST_CHANGES.get(action='add', outcome='rejected'), 1)
+        self.assertEqual(metrics.WATCHLIST_CHANGES.get(action='remove', outcome='done'), 1)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_endpoint(self):
+        """check that /metrics exports requests, db queries and counters in text format"""
+        self.client.get(f'/listings/{self.listing.id}')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('# TYPE auctions_request_duration_seconds histogram', text)
+        self.assertIn(
+            'auctions_request_duration_seconds_count{view="display_listing",method="GET",status="200"} 1', text,
+        )
+        self.assertIn('auctions_request_duration_seconds_bucket{view="display_listing",method="GET",status="200",le="+Inf"} 1', text)
+        self.assertRegex(text, r'auctions_db_query_duration_seconds_count\{alias="default",statement="SELECT"\} [1-9]')
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_endpoint_restricted(self):
+        """check that /metrics is refused to anyone but staff and allowed addresses"""
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.login(**bar_credentials)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+        bar = User.objects.get(username='bar')
+        bar.is_staff = True
+        bar.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_multiprocess(self):
+        """check that metrics of other processes (files in METRICS_DIR) are added up"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.COMMENTS.inc(outcome='added')
+            # written by another worker
+            other = {
+                'auctions_comments_total': [[['added'], 2]],
+                'auctions_request_duration_seconds': [[['index', 'GET', '200'], [[1] + [0] * 13, 0.0005]]],
+            }
+            with open(f'{directory}/1.json', 'w') as f:
+                json.dump(other, f)
+            text = self.client.get('/metrics').content.decode()
+        self.assertIn('auctions_comments_total{outcome="added"} 3', text)
+        self.assertIn('auctions_request_duration_seconds_count{view="index",method="GET",status="200"} 1', text)
+
+
+# a 1x1 png
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082'
+)
+fetched_urls = []
+
+
+def stub_fetch(url):
+    """image fetcher of tests: never hits network"""
+    fetched_urls.append(url)
+    if 'broken' in url:
+        raise images.ImageError('broken')
+    return PNG
+
+
+class ImageProxyTests(TestCase):
+    """tests for listing images proxy (auctions.images)"""
+    def setUp(self):
+        """populate db, stub fetcher and use an empty cache dir"""
+        cache.clear()
+        fetched_urls.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(IMAGE_FETCHER='auctions.tests.stub_fetch', IMAGE_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        foo = User.objects.create_user(**foo_credentials)
+        self.listing = Listing.objects.create(
+            owner=foo, **{**listing_fields, 'img_url': 'https://images.example.com/camera.png'},
+        )
+
+    def test_pages_link_local_images(self):
+        """check that pages link proxied renditions, not remote image"""
+        thumb_url = images.image_url(self.listing, 'thumb')
+        self.assertContains(self.client.get('/'), f'src="{thumb_url}"')
+        response = self.client.get(f'/listings/{self.listing.id}')
+        self.assertContains(response, f'src="{images.image_url(self.listing, "detail")}"')
+        self.assertNotContains(response, self.listing.img_url)
+
+    def test_fetched_once(self):
+        """check that image is fetched once and served with long-lived cache headers"""
+        for rendition in ['thumb', 'detail', 'thumb']:
+            response = self.client.get(images.image_url(self.listing, rendition))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertIn('immutable', response['Cache-Control'])
+            if images.Image is None:
+                self.assertEqual(b''.join(response.streaming_content), PNG)
+        self.assertEqual(fetched_urls, [self.listing.img_url])
+
+    def test_changed_image(self):
+        """check that links to an older image redirect to current one"""
+        old_url = images.image_url(self.listing, 'thumb')
+        self.listing.img_url = 'https://images.example.com/lens.png'
+        self.listing.save()
+        self.assertRedirects(
+            self.client.get(old_url), images.image_url(self.listing, 'thumb'), fetch_redirect_response=False,
+        )
+        self.assertEqual(self.client.get(f'/images/{self.listing.id}/huge/{images.url_digest("x")}').status_code, 404)
+
+    def test_broken_image(self):
+        """check that broken images fall back to placeholder (and aren't refetched right away)"""
+        self.listing.img_url = 'https://images.example.com/broken.png'
+        self.listing.save()
+        for _ in range(2):
+            response = self.client.get(images.image_url(self.listing, 'thumb'))
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('notfound.png', response['Location'])
+        self.assertEqual(len(fetched_urls), 1)
+
+    def test_evicted_while_served(self):
+        """check that an image evicted (eg. by another process) right after its lookup is fetched again"""
+        url = images.image_url(self.listing, 'thumb')
+        b''.join(self.client.get(url).streaming_content)
+        image_cache = images.get_cache()
+        lookup = image_cache.lookup
+
+        def lookup_then_evict(key):
+            cached = lookup(key)
+            if cached is not None:
+                os.remove(cached[0])
+            return cached
+        with mock.patch.object(image_cache, 'lookup', side_effect=lookup_then_evict):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content))
+        self.assertEqual(fetched_urls, [self.listing.img_url] * 2)
+
+    def test_lru_eviction(self):
+        """check that least recently used files are evicted to stay under max size"""
+        with tempfile.TemporaryDirectory() as directory:
+            # room for 2 renditions (100 bytes and their ~75 bytes refs)
+            image_cache = images.ImageCache(directory, max_bytes=450)
+            first = image_cache.store('a' * 64, b'1' * 100, 'image/png')[0]
+            second = image_cache.store('b' * 64, b'2' * 100, 'image/png')[0]
+            # second is least recently used
+            for path in [second, image_cache.ref_path('b' * 64)]:
+                os.utime(path, (0, 0))
+            image_cache.store('c' * 64, b'3' * 100, 'image/png')
+            self.assertTrue(os.path.exists(first))
+            self.assertFalse(os.path.exists(second))
+            self.assertIsNone(image_cache.lookup('b' * 64))
+            # same content is stored once
+            self.assertEqual(image_cache.store('d' * 64, b'1' * 100, 'image/png')[0], first)
+
+    def test_internal_hosts(self):
+        """check that default fetcher refuses internal hosts and other schemes"""
+        for url in ['http://127.0.0.1/a.png', 'http://10.0.0.1/a.png', 'file:///etc/passwd']:
+            with self.assertRaises(images.ImageError):
+                images.fetch_url(url)
+
+    def test_redirect_to_internal_host(self):
+        """check that default fetcher checks every redirect hop (and connects to checked address)"""
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append((self.path, self.headers['Host']))
+                self.send_response(302)
+                self.send_header('Location', f'http://127.0.0.1:{self.server.server_port}/internal.png')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        public_address = images.public_address
+
+        def resolve(hostname, port):
+            # a "public" host (served by local server), anything else as usual
+            return '127.0.0.1' if hostname == 'images.example.com' else public_address(hostname, port)
+        with mock.patch.object(images, 'public_address', side_effect=resolve):
+            with self.assertRaisesRegex(images.ImageError, 'host not allowed: 127.0.0.1'):
+                images.fetch_url(f'http://images.example.com:{server.server_port}/camera.png')
+        # redirect wasn't followed
+        self.assertEqual(requests, [('/camera.png', f'images.example.com:{server.server_port}')])
+
+
+class ArchiveTests(TestCase):
+    """tests for archival of long closed listings (auctions.archive)"""
+    def setUp(self):
+        """populate db: a listing closed long ago (bids, comments, proxies) and a recently closed one"""
+        cache.clear()
+        foo = User.objects.create_user(**foo_credentials)
+        bar = User.objects.create_user(**bar_credentials)
+        baz = User.objects.create_user(username='baz', password='baz')
+        self.bar = bar
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+        bidding.place_max_bid(self.listing, baz, 30)
+        bidding.place_bid(self.listing, bar, 40)
+        Comment.objects.create(listing=self.listing, user=bar, content='still available?')
+        Comment.objects.create(listing=self.listing, user=foo, content='yes')
+        self.winning_bid = bidding.close_listing(self.listing)
+        Listing.objects.filter(pk=self.listing.pk).update(closed_at=timezone.now() - timedelta(days=40))
+
+        self.recent = Listing.objects.create(owner=foo, **listing_fields)
+        bidding.place_bid(self.recent, bar, 20)
+        bidding.close_listing(self.recent)
+
+    def test_archive(self):
+        """check that only long closed listings are archived, leaving their summary and winning bid"""
+        self.assertEqual(archive.archive_closed_listings(days=30), [self.listing.id])
+        self.assertEqual(archive.archive_closed_listings(days=30), [])
+
+        self.assertEqual(list(Bid.objects.filter(listing=self.listing)), [self.winning_bid])
+        self.assertFalse(Comment.objects.filter(listing=self.listing).exists())
+        self.assertFalse(ProxyBid.objects.filter(listing=self.listing).exists())
+        self.assertEqual(Bid.objects.filter(listing=self.recent).count(), 1)
+
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertIsNotNone(listing.archived_at)
+        self.assertEqual((listing.bid_count, listing.current_price, listing.leading_bid), (2, 40, self.winning_bid))
+
+        payload = ListingArchive.objects.get(listing=self.listing)
+        self.assertEqual(len(archive.unpack(payload.bids)), 2)
+        self.assertEqual([row[2] for row in archive.unpack(payload.comments)], ['still available?', 'yes'])
+
+        bids = archive.archived_bids(self.listing.id)
+        # (proxy of baz bid once, then got outbid by bar)
+        self.assertEqual([bid.price for bid in bids], [40, 11])
+        self.assertEqual([bid.is_winner for bid in bids], [True, False])
+        self.assertEqual(bids[0].user, self.bar)
+
+    def test_summary_kept_by_sync(self):
+        """check that syncing bidding summaries leaves archived listings (and their bid count) alone"""
+        archive.archive_closed_listings(days=30)
+        out = StringIO()
+        call_command('sync_bid_summary', stdout=out)
+        self.assertIn('0 listing(s) repaired', out.getvalue())
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).bid_count, 2)
+
+    def test_read_through(self):
+        """check that listing page and api still show archived comments and bids"""
+        call_command('archive_closed_listings', days=30, stdout=StringIO())
+        response = self.client.get(f'/listings/{self.listing.id}')
+        self.assertContains(response, 'still available?')
+        self.assertContains(response, 'yes')
+        self.assertContains(response, '$40')
+
+        results = self.client.get(f'/api/v1/listings/{self.listing.id}/bids').json()['results']
+        self.assertEqual([(bid['price'], bid['user']) for bid in results], [('40.00', 'bar'), ('11.00', 'baz')])
+        older = self.client.get(f'/api/v1/listings/{self.listing.id}/bids?after={results[0]["id"]}').json()
+        self.assertEqual([bid['price'] for bid in older['results']], ['11.00'])
+
+    def test_compact(self):
+        """check that archived rows are packed and compressed"""
+        comments = [[i, 1, 'same old comment'] for i in range(1000)]
+        self.assertLess(len(archive.pack(comments)), len(json.dumps(comments)) / 10)
+        self.assertEqual(archive.unpack(archive.pack(comments)), comments)
+
+
+class CommentsTests(TestCase):
+    """tests for paginated comments and adding comments in place"""
+    def setUp(self):
+        """populate db: a listing with more than a page of comments"""
+        cache.clear()
+        foo = User.objects.create_user(**foo_credentials)
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+        Comment.objects.bulk_create([
+            Comment(listing=self.listing, user=foo, content=f'comment#{i}')
+            for i in range(pagination.PAGE_SIZE + 5)
+        ])
+        self.comment_ids = list(self.listing.comments.order_by('-id').values_list('id', flat=True))
+
+    def test_first_page_inlined(self):
+        """check that listing page shows newest page of comments and links the next one"""
+        response = self.client.get(f'/listings/{self.listing.id}')
+        newest, oldest = f'comment#{pagination.PAGE_SIZE + 4}', 'comment#0'
+        self.assertContains(response, newest)
+        self.assertNotContains(response, f'{oldest}<')
+        next_url = f'/listings/{self.listing.id}/comments?after={self.comment_ids[pagination.PAGE_SIZE - 1]}'
+        self.assertContains(response, f'data-url="{next_url}"')
+
+        # next page: rest of comments, no more pages
+        response = self.client.get(next_url)
+        self.assertEqual([int(i) for i in re.findall(r'data-id="(\d+)"', response.content.decode())], self.comment_ids[pagination.PAGE_SIZE:])
+        self.assertNotContains(response, 'comments-more')
+        data = self.client.get(f'{next_url}&format=json').json()
+        self.assertEqual(data['results'][-1]['content'], 'comment#0')
+        self.assertIsNone(data['next'])
+
+    def test_add_comment_fragment(self):
+        """check that scripts adding a comment get it back rendered (or form errors)"""
+        self.client.login(**foo_credentials)
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        response = self.client.post(f'/listings/{self.listing.id}/comment', {'content': 'fresh one'}, **ajax)
+        self.assertEqual(response.status_code, 201)
+        self.assertContains(response, 'fresh one', status_code=201)
+        self.assertNotContains(response, '<ul', status_code=201)
+
+        response = self.client.post(f'/listings/{self.listing.id}/comment', {'content': ''}, **ajax)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content', json.loads(response.json()))
+
+        # without scripts: redirected back to listing
+        response = self.client.post(f'/listings/{self.listing.id}/comment', {'content': 'plain'})
+        self.assertRedirects(response, f'/listings/{self.listing.id}')
+
+
+class CategorySummaryTests(TestCase):
+    """tests for cached category summaries (auctions.categories)"""
+    def setUp(self):
+        """populate db: a category with two listings, an empty one"""
+        cache.clear()
+        self.foo = User.objects.create_user(**foo_credentials)
+        self.bar = User.objects.create_user(**bar_credentials)
+        self.category = Category.objects.create(name='books')
+        self.empty = Category.objects.create(name='toys')
+        self.cheap = Listing.objects.create(owner=self.foo, category=self.category, **listing_fields)
+        self.pricey = Listing.objects.create(owner=self.foo, category=self.category, **{**listing_fields, 'price': 50})
+
+    def assertSummary(self, category, active_listings, min_price, max_price):
+        summary = CategorySummary.objects.get(pk=category.pk)
+        self.assertEqual(
+            (summary.active_listings, summary.min_price, summary.max_price),
+            (active_listings, min_price, max_price),
+        )
+        self.assertEqual(
+            {key: categories.get_summary(category.id)[key] for key in ('active_listings', 'min_price', 'max_price')},
+            {'active_listings': active_listings, 'min_price': min_price, 'max_price': max_price},
+        )
+
+    def test_kept_up_to_date(self):
+        """check that summaries follow listings being created, bid on, closed and deleted"""
+        self.assertSummary(self.category, 2, 10, 50)
+        self.assertSummary(self.empty, 0, None, None)
+
+        bidding.place_bid(self.cheap, self.bar, 20)
+        self.assertSummary(self.category, 2, 20, 50)
+        bidding.close_listing(self.pricey)
+        self.assertSummary(self.category, 1, 20, 20)
+
+        Listing.objects.filter(pk=self.cheap.pk).update(ends_at=timezone.now() - timedelta(minutes=1))
+        bidding.close_expired_listings()
+        self.assertSummary(self.category, 0, None, None)
+
+        listing = Listing.objects.create(owner=self.foo, category=self.empty, **listing_fields)
+        self.assertSummary(self.empty, 1, 10, 10)
+        listing.delete()
+        self.assertSummary(self.empty, 0, None, None)
+
+    def test_bids(self):
+        """check that bids only touch (and invalidate) summary when they move price range"""
+        middle = Listing.objects.create(owner=self.foo, category=self.category, **{**listing_fields, 'price': 30})
+        categories.get_summaries()
+        bidding.place_bid(middle, self.bar, 40)
+        with self.assertNumQueries(0):
+            categories.get_summaries()
+        self.assertSummary(self.category, 3, 10, 50)
+
+        # over max price
+        bidding.place_bid(middle, self.bar, 60)
+        self.assertSummary(self.category, 3, 10, 60)
+        # cheapest listing
+        bidding.place_bid(self.cheap, self.bar, 20)
+        self.assertSummary(self.category, 3, 20, 60)
+
+    def test_pages(self):
+        """check that categories page and nav show counts and price ranges, off one cached read"""
+        response = self.client.get('/categories')
+        self.assertContains(response, '$10.00 - $50.00')
+        nav = re.search(r'<ul class="nav nav-categories">(.*?)</ul>', response.content.decode(), re.S).group(1)
+        self.assertIn('books', nav)
+        self.assertNotIn('toys', nav)
+
+        with self.assertNumQueries(0):
+            categories.get_summaries()
+        response = self.client.get(f'/categories/{self.category.id}')
+        self.assertContains(response, '2 active listings, $10.00 - $50.00')
+
+    def test_rebuild_command(self):
+        """check that command recomputes summaries missed by incremental updates"""
+        Listing.objects.filter(pk=self.cheap.pk).update(category=self.empty)
+        CategorySummary.objects.filter(pk=self.empty.pk).delete()
+        out = StringIO()
+        call_command('rebuild_category_summary', stdout=out)
+        self.assertIn('rebuilt', out.getvalue())
+        self.assertSummary(self.category, 1, 50, 50)
+        self.assertSummary(self.empty, 1, 10, 10)
+
+
+@override_settings(WRITE_BEHIND_INTERVAL=3600)
+class WriteBehindTests(TestCase):
+    """tests for batched watchlist changes and comments (auctions.writebehind)"""
+    ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    def setUp(self):
+        """populate db: a listing, two would-be watchers"""
+        cache.clear()
+        foo = User.objects.create_user(**foo_credentials)
+        self.bar = User.objects.create_user(**bar_credentials)
+        self.baz = User.objects.create_user(username='baz', password='baz')
+        self.listing = Listing.objects.create(owner=foo, **listing_fields)
+        self.client.force_login(self.bar)
+        self.addCleanup(writebehind.flush)
+
+    def watchers(self):
+        return set(self.listing.watchers.values_list('id', flat=True))
+
+    def test_watchlist_batched(self):
+        """check that watchlist changes are queued, then written in one batch"""
+        response = self.client.post(f'/listings/{self.listing.id}/watch', **self.ajax)
+        self.assertEqual(response.status_code, 204)
+        client = self.client_class()
+        client.force_login(self.baz)
+        self.assertEqual(client.post(f'/listings/{self.listing.id}/watch', **self.ajax).status_code, 204)
+        self.assertEqual(self.watchers(), set())
+        self.assertEqual(len(writebehind.queue), 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            writebehind.flush()
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.watchers(), {self.bar.id, self.baz.id})
+
+        # without scripts: still redirected back to listing
+        response = self.client.post(f'/listings/{self.listing.id}/unwatch')
+        self.assertRedirects(response, f'/listings/{self.listing.id}')
+        writebehind.flush()
+        self.assertEqual(self.watchers(), {self.baz.id})
+
+    def test_read_own_writes(self):
+        """check that users see their own queued changes (others see them once flushed)"""
+        self.client.post(f'/listings/{self.listing.id}/watch', **self.ajax)
+        response = self.client.post(f'/listings/{self.listing.id}/comment', {'content': 'queued one'}, **self.ajax)
+        self.assertContains(response, 'queued one', status_code=202)
+        self.assertFalse(Comment.objects.exists())
+
+        anonymous = self.client_class()
+        self.assertNotContains(anonymous.get(f'/listings/{self.listing.id}/comments'), 'queued one')
+        self.assertEqual(len(writebehind.queue), 2)
+
+        response = self.client.get(f'/listings/{self.listing.id}')
+        self.assertContains(response, 'queued one')
+        self.assertEqual(response.context['request'].watchlist.ids, {self.listing.id})
+        self.assertEqual(len(writebehind.queue), 0)
+        # comments written in bulk still invalidate cached listing pages
+        self.assertContains(anonymous.get(f'/listings/{self.listing.id}/comments'), 'queued one')
+
+    def test_deleted_listing_dropped(self):
+        """check that writes queued for listings deleted since are dropped"""
+        dropped = metrics.WRITES_BEHIND.get(kind='comment', outcome='dropped')
+        self.client.post(f'/listings/{self.listing.id}/watch', **self.ajax)
+        self.client.post(f'/listings/{self.listing.id}/comment', {'content': 'too late'}, **self.ajax)
+        self.assertEqual(len(writebehind.queue), 2)
+        self.listing.delete()
+        writebehind.flush()
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(WatchlistEntry.objects.exists())
+        self.assertEqual(metrics.WRITES_BEHIND.get(kind='comment', outcome='dropped'), dropped + 1)
+
+    @override_settings(WRITE_BEHIND_MAX_PENDING=1)
+    def test_full_queue_db_error(self):
+        """check that a request flushing a full queue doesn't fail on db errors (writes are kept)"""
+        with mock.patch.object(writebehind.queue, 'write', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('auctions.writebehind', 'WARNING'):
+            response = self.client.post(f'/listings/{self.listing.id}/watch', **self.ajax)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(writebehind.queue), 1)
+        writebehind.flush()
+        self.assertEqual(self.watchers(), {self.bar.id})
+
+    @override_settings(WRITE_BEHIND_INTERVAL=0.01)
+    def test_flusher_survives_errors(self):
+        """check that flusher thread outlives any error (and is restarted if it died anyway)"""
+        queue = writebehind.WriteQueue()
+        written = [threading.Event(), threading.Event()]
+
+        def write(watchlist_changes, comments):
+            if written[0].is_set():
+                written[1].set()
+            else:
+                written[0].set()
+                raise RuntimeError('not a db error')
+
+        with mock.patch.object(queue, 'write', side_effect=write), self.assertLogs('auctions.writebehind', 'ERROR'):
+            queue.put('watch', self.bar.id, self.listing.id)
+            self.assertTrue(written[0].wait(5))
+            queue.put('watch', self.baz.id, self.listing.id)
+            self.assertTrue(written[1].wait(5))
+        self.assertTrue(queue.flusher.is_alive())
+
+        # died anyway (eg. by a SystemExit): next write starts a new one
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        queue.flusher = dead
+        with mock.patch.object(queue, 'write'):
+            queue.put('unwatch', self.bar.id, self.listing.id)
+            queue.flush()
+        self.assertIsNot(queue.flusher, dead)
+        self.assertTrue(queue.flusher.is_alive())
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db', USER_CACHE_TIMEOUT=60, WATCHLIST_CACHE_TIMEOUT=60,
+)
+class AuthFastPathTests(TestCase):
+    """tests for cached sessions and users (auctions.auth)"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(**foo_credentials)
+        self.client.login(**foo_credentials)
+        self.client.get('/categories')
+
+    def test_no_queries(self):
+        """check that logged in pages need no query to load session and user"""
+        with self.assertNumQueries(0):
+            response = self.client.get('/categories')
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_invalidated_on_change(self):
+        """check that cached user is reloaded once changed, and logged out by password change"""
+        self.user.email = 'foo@example.com'
+        self.user.save()
+        response = self.client.get('/categories')
+        self.assertEqual(response.context['user'].email, 'foo@example.com')
+
+        self.user.set_password('changed')
+        self.user.save()
+        response = self.client.get('/categories')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_invalidated_on_deactivation(self):
+        """check that a deactivated user is logged out right away, not once cached user expires"""
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/categories')
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_model_backend_sessions(self):
+        """check that sessions logged in by plain ModelBackend stay valid"""
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get('/categories')
+        self.assertEqual(response.context['user'], self.user)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'pragmas are sqlite only')
+class SqlitePragmasTests(TestCase):
+    """tests for per connection sqlite tuning (auctions.database)"""
+    def pragmas(self):
+        with connection.cursor() as cursor:
+            return {
+                name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                # (not ones that can't change within tests' transaction, eg. synchronous)
+                for name in ('temp_store', 'busy_timeout', 'cache_size')
+            }
+
+    def apply(self, pragmas):
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            database.apply_sqlite_pragmas(sender=None, connection=connection)
+
+    def test_applied_on_connection(self):
+        """check that configured pragmas are run on new connections, outside of query log"""
+        # (back to test db's own afterwards)
+        self.addCleanup(self.apply, self.pragmas())
+        with CaptureQueriesContext(connection) as ctx:
+            self.apply({'temp_store': 'MEMORY', 'busy_timeout': 1234, 'cache_size': -4000})
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(self.pragmas(), {'temp_store': 2, 'busy_timeout': 1234, 'cache_size': -4000})
+
+        # nothing configured: nothing run
+        self.apply({})
+        self.assertEqual(self.pragmas()['busy_timeout'], 1234)
+
+
+class QueryBudgetMixin:
+    """pin max number of db queries per page
+    no matter how many rows (listings, bids, comments, watched listings) page has.
+    subclasses set `rows`.
+    """
+    rows = 1
+
+    # page: (max queries for anonymous user, max queries for logged in user)
+    # logged in pages also load session, user and watched listings (see layout.html)
+    # all pages show categories nav: one cached read (a query on a cold cache only)
+    budgets = {
+        'index': (2, 5),
+        'display_listing': (2, 5),
+        'user_profile': (2, 5),
+        'display_category': (2, 5),
+        'display_watchlist': (None, 4),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        """populate db with `rows` of each kind"""
+        owner = User.objects.create_user(**foo_credentials)
+        viewer = User.objects.create_user(**bar_credentials)
+        category = Category.objects.create(name='category#1')
+
+        Listing.objects.bulk_create(
+            Listing(owner=owner, category=category, current_price=listing_fields['price'], **listing_fields)
+            for _ in range(cls.rows)
+        )
+        listing = Listing.objects.first()
+        Bid.objects.bulk_create(
+            Bid(listing=listing, user=viewer, price=listing_fields['price'] + i + 1)
+            for i in range(cls.rows)
+        )
+        call_command('sync_bid_summary', stdout=StringIO())
+        Comment.objects.bulk_create(
+            Comment(listing=listing, user=viewer, content=f'comment#{i}')
+            for i in range(cls.rows)
+        )
+        viewer.watched_listings.add(*Listing.objects.all())
+
+        cls.owner = owner
+        cls.viewer = viewer
+        cls.category = category
+        cls.listing = listing
+
+    def setUp(self):
+        # measure pages as rendered (not served from cache)
+        cache.clear()
+
+    def urls(self):
+        return {
+            'index': reverse('index'),
+            'display_listing': reverse('display_listing', args=(self.listing.id,)),
+            'user_profile': reverse('user_profile', args=(self.owner.username,)),
+            'display_category': reverse('display_category', args=(self.category.id,)),
+            'display_watchlist': reverse('display_watchlist'),
+        }
+
+    def assertMaxQueries(self, max_queries, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx.captured_queries), max_queries,
+            '\n'.join(q['sql'] for q in ctx.captured_queries),
+        )
+
+    def test_anonymous_budgets(self):
+        """check pages queries for users who aren't loggedin"""
+        for page, url in self.urls().items():
+            max_queries = self.budgets[page][0]
+            if max_queries is None:
+                continue
+            with self.subTest(page=page):
+                self.assertMaxQueries(max_queries, url)
+
+    def test_loggedin_budgets(self):
+        """check pages queries for loggedin users"""
+        self.client.force_login(self.viewer)
+        for page, url in self.urls().items():
+            with self.subTest(page=page):
+                self.assertMaxQueries(self.budgets[page][1], url)
+
+
+class QueryBudgetOneRowTests(QueryBudgetMixin, TestCase):
+    rows = 1
+
+
+class QueryBudgetHundredRowsTests(QueryBudgetMixin, TestCase):
+    rows = 100
+
+
+class QueryBudgetTenThousandRowsTests(QueryBudgetMixin, TestCase):
+    rows = 10000
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, async_views, images, metrics, profiling, views
 
 urlpatterns = [
     path("", views.index, name="index"),
@@ -12,14 +12,40 @@ urlpatterns = [
     path("users/<str:username>", views.ProfileView.as_view(), name="user_profile"),
     path("categories/<int:pk>", views.OneCategoryView.as_view(), name="display_category"),
     path("categories", views.AllCategoriesView.as_view(), name="all_categories"),
+    path("search", views.search_listings, name="search"),
 
     path("listings/<int:listing_id>/bid", views.place_bid, name="place_bid"),
+    path("listings/<int:listing_id>/max_bid", views.place_max_bid, name="place_max_bid"),
 
     path("listings/<int:listing_id>/close", views.accept_max_bid, name="accept_max_bid"),
 
     path("listings/<int:listing_id>/comment", views.add_comment, name="add_comment"),
+    path("listings/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
 
     path("listings/<int:listing_id>/watch", views.add_to_watchlist, name="add_to_watchlist"),
     path("listings/<int:listing_id>/unwatch", views.remove_from_watchlist, name="remove_from_watchlist"),
     path("watchlist", views.WatchlistView.as_view(), name="display_watchlist"),
+
+    # read-only json api
+    path("api/v1/listings", api.listings, name="api_listings"),
+    path("api/v1/listings/export", api.export_listings, name="api_export_listings"),
+    path("api/v1/listings/<int:listing_id>", api.listing_detail, name="api_listing"),
+    path("api/v1/listings/<int:listing_id>/bids", api.listing_bids, name="api_listing_bids"),
+    path("api/v1/categories", api.categories, name="api_categories"),
+
+    # profiled requests report (see auctions.profiling)
+    path("profiling/report", profiling.report_view, name="profiling_report"),
+
+    # listing images (proxied and resized, see auctions.images)
+    path("images/<int:listing_id>/<str:rendition>/<str:digest>", images.image_view, name="listing_image"),
+
+    # metrics (prometheus text format, see auctions.metrics)
+    path("metrics", metrics.metrics_view, name="metrics"),
+
+    # async variants of read-heavy pages (best served by an asgi server)
+    path("async/", async_views.index, name="async_index"),
+    path("async/listings/<int:listing_id>", async_views.display_listing, name="async_display_listing"),
+    path("async/categories", async_views.all_categories, name="async_all_categories"),
+    path("async/categories/<int:pk>", async_views.display_category, name="async_display_category"),
+    path("async/api/listings/<int:listing_id>", async_views.listing_json, name="async_listing_json"),
 ]
@@ -1,15 +1,29 @@
-from django.db.models import Max
-
-
 def get_max_bid_price(listing):
     """Get price of max bid on specific `listing`.
     max price is:
     - if listing has no bids yet: listing initial price
     - if listing has bids: price of most recent one
+    both cases are already tracked by `listing.current_price`
+    so no need to query bids.
     """
-    max_bid = listing.bids.last()
-    if max_bid is None:
-        max_bid_price = listing.price
-    else:
-        max_bid_price = max_bid.price
-    return max_bid_price
+    return listing.current_price
+
+
+def listing_to_dict(listing):
+    """Serialize `listing` (summary fields only) for json responses."""
+    return {
+        'id': listing.id,
+        'title': listing.title,
+        'description': listing.description,
+        'img_url': listing.img_url,
+        'price': listing.price,
+        'current_price': listing.current_price,
+        'bid_count': listing.bid_count,
+        'is_active': listing.is_active,
+        'url': listing.get_absolute_url(),
+    }
+
+
+def is_ajax(request):
+    """Was request sent by page's scripts (see listing.js), expecting a fragment back?"""
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
@@ -1,22 +1,57 @@
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.views.generic import ListView, DetailView
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
+from django.views.generic import DetailView, TemplateView
 from django.views.generic.edit import CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 
-from . import utils
-from .models import User, Listing, Category, Watchlist
-from .forms import NewBidForm, NewCommentForm
+from . import archive, bidding, caching, categories, metrics, pagination, search, utils, writebehind
+from .models import User, Listing, Category
+from .forms import MaxBidForm, NewBidForm, NewCommentForm, NewListingForm, SearchForm
 
 
+@caching.cache_anonymous_page(lambda: caching.get_version(caching.CATALOG))
 def index(request):
+    page = pagination.paginate(request, Listing.objects.filter(is_active=True))
+    if pagination.wants_json(request):
+        return pagination.json_response(page)
     return render(request, "auctions/index.html", {
-        "listings": Listing.objects.filter(is_active=True)
+        "listings": page,
+        "page": page,
+    })
+
+
+def search_listings(request):
+    """Search listings by text (title, description, category)
+    optionally filtered by category, price range and state.
+    """
+    form = SearchForm(request.GET)
+    if not form.is_valid():
+        if pagination.wants_json(request):
+            return JsonResponse(form.errors, status=400)
+        return render(request, "auctions/search.html", {"form": form}, status=400 if request.GET else 200)
+
+    data = form.cleaned_data
+    listings = search.search(
+        data['q'],
+        is_active=None if data['include_closed'] else True,
+        category_id=data['category'],
+        min_price=data['min_price'],
+        max_price=data['max_price'],
+    )
+    if pagination.wants_json(request):
+        return JsonResponse({'results': [utils.listing_to_dict(listing) for listing in listings]})
+    return render(request, "auctions/search.html", {
+        "form": form,
+        "listings": listings,
     })
 
 
@@ -66,12 +101,8 @@ def register(request):
             return render(request, "auctions/register.html", {
                 "message": "Username already taken."
             })
-        login(request, user)
-        
-        # create watchlist once user signed up successfully
-        user_watchlist = Watchlist(user=request.user)
-        user_watchlist.save()
-
+        # (new user wasn't authenticated by a backend, pick first one: cached)
+        login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
         return HttpResponseRedirect(reverse("index"))
     else:
         return render(request, "auctions/register.html")
@@ -80,7 +111,7 @@ def register(request):
 class CreateListingView(LoginRequiredMixin, CreateView):
     """Create a new listing."""
     model = Listing
-    fields = ['title', 'description', 'img_url', 'price', 'category']
+    form_class = NewListingForm
     template_name = 'auctions/create_listing.html'
     login_url = 'login'
 
@@ -89,12 +120,67 @@ class CreateListingView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+@caching.cache_anonymous_page(
+    lambda listing_id: caching.get_version(caching.listing_version_name(listing_id))
+)
 def display_listing(request, listing_id):
     """Display details of specific listing (`listing_id`)"""
-    listing = Listing.objects.get(pk=listing_id)
+    # user's own queued comments show up
+    writebehind.read_own_writes(request)
+
+    # fetch everything listing page shows about listing in one query
+    listing = get_object_or_404(
+        Listing.objects.select_related('leading_bid', 'owner', 'category'),
+        pk=listing_id,
+    )
+
+    # first page of comments is queried lazily
+    # (not at all if comments list fragment is cached)
+    # from archive for long closed listings
+    comments = SimpleLazyObject(lambda: first_comments_page(request, listing))
+
+    return render(request, 'auctions/listing.html', listing_page_context(request, listing, comments))
+
+
+def first_comments_page(request, listing):
+    """Newest comments of `listing`, inlined in its page
+    (older ones are loaded page by page from `listing_comments`).
+    """
+    return pagination.first_page(
+        request, archive.listing_comments(listing), reverse('listing_comments', args=(listing.id,)),
+    )
 
+
+@require_GET
+def listing_comments(request, listing_id):
+    """A page of comments of specific listing (`listing_id`), newest first
+    (keyset paginated: `?after=<comment id>`),
+    as html fragment (`comment_items.html`) or json (`?format=json`).
+    """
+    writebehind.read_own_writes(request)
+    listing = get_object_or_404(Listing.objects.only('id', 'archived_at'), pk=listing_id)
+    if listing.archived_at is not None:
+        page = pagination.paginate_list(request, archive.archived_comments(listing_id))
+    else:
+        page = pagination.paginate(request, listing.comments.select_related('user'))
+    if pagination.wants_json(request):
+        return JsonResponse({
+            'results': [
+                {'id': comment.id, 'user': comment.user.username, 'content': comment.content}
+                for comment in page
+            ],
+            'next': page.next_url,
+        })
+    return render(request, 'auctions/comment_items.html', {'comments': page})
+
+
+def listing_page_context(request, listing, comments):
+    """Build context of listing page for `listing` (and its `comments`)
+    as seen by current user.
+    """
     # bidding details
-    bids_count = listing.bids.count()
+    # read from listing's bidding summary (no need to query bids)
+    bids_count = listing.bid_count
     max_bid_price = utils.get_max_bid_price(listing)
     # what bid-related parts can user see?
     # for active listings:
@@ -112,11 +198,12 @@ def display_listing(request, listing_id):
     # when to show bidding form?
     #   - user is logged in
     #   - user isn't listing owner
-    #   - listing is active
+    #   - listing is active (and hasn't reached its end time)
     can_place_bid = (
         request.user.is_authenticated
         and listing.owner != request.user
         and listing.is_active
+        and not listing.has_ended
     )
 
     # when to show accept_bid/close_listing form?
@@ -137,21 +224,22 @@ def display_listing(request, listing_id):
     # NOTE:
     # - if listing is closed there must be a winning bid
     # - and that winning bid is always the last bid
-    latest_bid = listing.bids.last()
+    latest_bid = listing.leading_bid
     inform_and_congrats_user = (
         not listing.is_active
-        and latest_bid.user == request.user
+        and latest_bid is not None
+        and latest_bid.user_id == request.user.id
     )
     # when to show winning bid?
     #   - listing is closed
     #   - user isn't owner of winning bid
     inform_but_not_congrats = (
         not listing.is_active
-        and latest_bid.user != request.user
+        and latest_bid is not None
+        and latest_bid.user_id != request.user.id
     )
 
     # commenting details
-    comments = listing.comments.all()
     # what comment-related parts can user see?
     # for active listings:
     #   - commenting form: loggedin users (owner, others)
@@ -167,7 +255,7 @@ def display_listing(request, listing_id):
         and listing.is_active
     )
 
-    return render(request, 'auctions/listing.html', {
+    return {
         'listing': listing,
         'bids_count': bids_count,
         'max_bid': max_bid_price,
@@ -175,12 +263,16 @@ def display_listing(request, listing_id):
         'can_place_bid': can_place_bid,
         'can_accept_bid': can_accept_bid,
         'bid_form': NewBidForm(max_bid_price=None),
+        'max_bid_form': MaxBidForm(max_bid_price=None),
         'inform_and_congrats_user': inform_and_congrats_user,
         'inform_but_not_congrats': inform_but_not_congrats,
         'comments': comments,
         'can_write_comment': can_write_comment,
         'comment_form': NewCommentForm(),
-    })
+        # comments list is cached as a fragment
+        'cache_timeout': caching.get_timeout(),
+        'listing_version': caching.get_version(caching.listing_version_name(listing.id)),
+    }
 
 
 @login_required(login_url='login')
@@ -196,29 +288,83 @@ def place_bid(request, listing_id):
     is_owner = listing.owner == request.user
     is_closed = not listing.is_active
     if is_closed or is_owner:
+        metrics.BIDS.inc(kind='bid', outcome='rejected')
         return HttpResponseBadRequest()
 
     # validate bidding form
+    # NOTE: price check here is just a fast path
+    # by the time bid is saved, someone else might have outbid user
+    # so bidding engine checks price again (atomically)
     max_bid_price = utils.get_max_bid_price(listing)
     form = NewBidForm(request.POST, max_bid_price=max_bid_price)
     if form.is_valid():
         # if valid price
         # create a new bid
-        form.instance.user = request.user
-        form.instance.listing = listing
-        form.save()
+        try:
+            bidding.place_bid(listing, request.user, form.cleaned_data['price'])
+        except bidding.ListingClosed:
+            metrics.BIDS.inc(kind='bid', outcome='closed')
+            return HttpResponseBadRequest()
+        except bidding.Outbid as e:
+            metrics.BIDS.inc(kind='bid', outcome='outbid')
+            # another bid got in first
+            # send a conflict with same errors format as form errors
+            form.add_error('price', ValidationError(str(e), code='outbid'))
+            errors = form.errors.as_json(escape_html=True)
+            return JsonResponse(errors, safe=False, status=409)
+        metrics.BIDS.inc(kind='bid', outcome='placed')
         # and send new bids count to client
-        # do we really need to query db each time?
-        # cant increment whatever user sees instead?
-        # anyway, whenver user refresh page
-        # all correct data will be there
-        return HttpResponse()
+        # (same summary is pushed to other viewers, see auctions.events)
+        # bid might have been outbid right away by someone's max bid
+        return JsonResponse({
+            'bid_count': listing.bid_count,
+            'current_price': listing.current_price,
+            'is_leading': listing.leading_bid.user_id == request.user.id,
+        })
     else:
+        # (eg. price too low by `NewBidForm.clean_price`)
+        metrics.BIDS.inc(kind='bid', outcome='rejected')
         # access form errors and send to client
         errors = form.errors.as_json(escape_html=True)
         return JsonResponse(errors, safe=False, status=400)
 
 
+@login_required(login_url='login')
+@require_POST
+def place_max_bid(request, listing_id):
+    """Set max price user would pay for specific listing (`listing_id`)
+    and let bidding engine bid for them (see `bidding.place_max_bid`).
+    """
+    listing = get_object_or_404(Listing, pk=listing_id)
+    if not listing.is_active or listing.owner == request.user:
+        metrics.BIDS.inc(kind='max_bid', outcome='rejected')
+        return HttpResponseBadRequest()
+
+    form = MaxBidForm(request.POST, max_bid_price=utils.get_max_bid_price(listing))
+    if not form.is_valid():
+        metrics.BIDS.inc(kind='max_bid', outcome='rejected')
+        errors = form.errors.as_json(escape_html=True)
+        return JsonResponse(errors, safe=False, status=400)
+
+    try:
+        bidding.place_max_bid(listing, request.user, form.cleaned_data['max_price'])
+    except bidding.ListingClosed:
+        metrics.BIDS.inc(kind='max_bid', outcome='closed')
+        return HttpResponseBadRequest()
+    except (bidding.Outbid, bidding.MaxBidTooLow) as e:
+        metrics.BIDS.inc(kind='max_bid', outcome='outbid')
+        form.add_error('max_price', ValidationError(str(e), code='outbid'))
+        errors = form.errors.as_json(escape_html=True)
+        return JsonResponse(errors, safe=False, status=409)
+    metrics.BIDS.inc(kind='max_bid', outcome='placed')
+    # (an earlier max bid of same or higher price keeps leading)
+    return JsonResponse({
+        'bid_count': listing.bid_count,
+        'current_price': listing.current_price,
+        'is_leading': listing.leading_bid_id is not None and listing.leading_bid.user_id == request.user.id,
+    })
+
+
 @login_required(login_url='login')
 @require_POST
 def accept_max_bid(request, listing_id):
@@ -235,10 +381,12 @@ def accept_max_bid(request, listing_id):
     #  - listing has no bids yet
     not_owner = listing.owner != request.user
     is_closed = not listing.is_active
-    has_no_bids = listing.bids.count() == 0
+    has_no_bids = listing.bid_count == 0
     if not_owner:
+        metrics.ACCEPTED_BIDS.inc(outcome='rejected')
         return HttpResponse(status=401)
     if is_closed or has_no_bids:
+        metrics.ACCEPTED_BIDS.inc(outcome='rejected')
         return HttpResponseBadRequest()
 
     # find max bid and mark it as winner
@@ -246,13 +394,14 @@ def accept_max_bid(request, listing_id):
     # because bids have increasing prices
     # we ensure that when inserting a new bid
     # (new bid must be greater than all previous bids)
-    max_bid = listing.bids.last()
-    max_bid.is_winner = True
-    max_bid.save()
-
-    # close listing
-    listing.is_active = False
-    listing.save()
+    # and close listing
+    # both done atomically by bidding engine
+    try:
+        bidding.close_listing(listing)
+    except bidding.ListingClosed:
+        metrics.ACCEPTED_BIDS.inc(outcome='closed')
+        return HttpResponseBadRequest()
+    metrics.ACCEPTED_BIDS.inc(outcome='accepted')
 
     # redirect to listing_details page
     return redirect(reverse('display_listing', args=(listing_id,)))
@@ -262,19 +411,35 @@ def accept_max_bid(request, listing_id):
 @require_POST
 def add_comment(request, listing_id):
     # get listing and handle if not found
-    listing = get_object_or_404(Listing, pk=listing_id)
+    listing = get_object_or_404(Listing.objects.only('id', 'is_active'), pk=listing_id)
 
     # reject comments on closed listings
     if not listing.is_active:
+        metrics.COMMENTS.inc(outcome='rejected')
         return HttpResponseBadRequest()
 
     # process form
+    # scripts get new comment (rendered) or form errors back
+    # instead of reloading whole page
     form = NewCommentForm(request.POST)
     if form.is_valid():
         form.instance.listing = listing
         form.instance.user = request.user
-        form.save()
+        if writebehind.is_enabled():
+            # written with next batch (see auctions.writebehind)
+            writebehind.queue.put('comment', request.user.id, listing.id, form.instance.content)
+            metrics.COMMENTS.inc(outcome='queued')
+            status = 202
+        else:
+            form.save()
+            metrics.COMMENTS.inc(outcome='added')
+            status = 201
+        if utils.is_ajax(request):
+            return render(request, 'auctions/comment_items.html', {'comments': [form.instance]}, status=status)
         return redirect(reverse('display_listing', args=(listing_id,)))
+    metrics.COMMENTS.inc(outcome='rejected')
+    if utils.is_ajax(request):
+        return JsonResponse(form.errors.as_json(escape_html=True), safe=False, status=400)
     return HttpResponseBadRequest()
 
 
@@ -282,21 +447,26 @@ def add_comment(request, listing_id):
 @require_POST
 def add_to_watchlist(request, listing_id):
     # get listing and handle if not found
-    listing = get_object_or_404(Listing, pk=listing_id)
+    listing = get_object_or_404(Listing.objects.only('id', 'is_active', 'owner_id'), pk=listing_id)
 
     # reject watching:
     # - closed listings
     # - one's own listings
     # - listings that are already/currently on user's watchlist
     is_closed = not listing.is_active
-    is_owner = request.user == listing.owner
-    is_on_wachlist = request.user.watchlist.listings.filter(pk=listing_id).exists()
+    is_owner = request.user.id == listing.owner_id
+    is_on_wachlist = listing.id in request.watchlist
     if is_closed or is_owner or is_on_wachlist:
+        metrics.WATCHLIST_CHANGES.inc(action='add', outcome='rejected')
         return HttpResponseBadRequest()
 
-    # add listing to user's watchlist
-    request.user.watchlist.listings.add(listing)
+    # add listing to user's watchlist (now or queued)
+    request.watchlist.add(listing)
+    metrics.WATCHLIST_CHANGES.inc(action='add', outcome='done')
 
+    # scripts toggle watchlist forms in place (see listing.js)
+    if utils.is_ajax(request):
+        return HttpResponse(status=204)
     # redirect to listing details page
     return redirect(reverse('display_listing', args=(listing_id,)))
 
@@ -305,20 +475,24 @@ def add_to_watchlist(request, listing_id):
 @require_POST
 def remove_from_watchlist(request, listing_id):
     # get listing and handle if not found
-    listing = get_object_or_404(Listing, pk=listing_id)
+    listing = get_object_or_404(Listing.objects.only('id'), pk=listing_id)
 
     # reject unwatching listings that NOT currenlty on user's watchlist
-    if not request.user.watchlist.listings.filter(pk=listing_id).exists():
+    if listing.id not in request.watchlist:
+        metrics.WATCHLIST_CHANGES.inc(action='remove', outcome='rejected')
         return HttpResponseBadRequest()
 
-    # remove listing from user's watchlist
-    request.user.watchlist.listings.remove(listing)
+    # remove listing from user's watchlist (now or queued)
+    request.watchlist.remove(listing)
+    metrics.WATCHLIST_CHANGES.inc(action='remove', outcome='done')
 
+    if utils.is_ajax(request):
+        return HttpResponse(status=204)
     # redirect to listing details page
     return redirect(reverse('display_listing', args=(listing_id,)))
 
 
-class ProfileView(DetailView):
+class ProfileView(pagination.ListingsPageMixin, DetailView):
     """Display profile page.
     A profile page shows user info and their current active listings.
     """
@@ -328,38 +502,53 @@ class ProfileView(DetailView):
     def get_object(self):
         return get_object_or_404(User, username=self.kwargs['username'])
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['listings'] = context['profile_user'].listings.filter(is_active=True)
-        return context
+    def get_listings(self):
+        return self.object.listings.filter(is_active=True)
+
+
+def categories_version(**kwargs):
+    # category pages show listings (catalog) and summaries (prices move with bids)
+    return f'{caching.get_version(caching.CATALOG)}.{caching.get_version(categories.VERSION)}'
 
 
-class AllCategoriesView(ListView):
+@method_decorator(caching.cache_anonymous_page(categories_version), name='dispatch')
+class AllCategoriesView(TemplateView):
     """List all categories on website.
-    Each category is displayed as link that leads to category page.
+    Each category is displayed as link that leads to category page
+    along with its active listings count and price range (see auctions.categories).
     """
-    model = Category
-    context_object_name = 'categories'
     template_name = 'auctions/categories.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # one cached read, no matter how many categories/listings
+        context['categories'] = categories.get_summaries()
+        return context
+
 
-class OneCategoryView(DetailView):
+@method_decorator(caching.cache_anonymous_page(categories_version), name='dispatch')
+class OneCategoryView(pagination.ListingsPageMixin, DetailView):
     """Display category page.
     A category page lists all active listing in that category.
     """
     model = Category
     template_name = 'auctions/category.html'
 
+    def get_listings(self):
+        return self.object.listings.filter(is_active=True)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['listings'] = context['category'].listings.filter(is_active=True)
+        context['summary'] = categories.get_summary(self.object.id)
         return context
 
 
-class WatchlistView(LoginRequiredMixin, ListView):
+class WatchlistView(LoginRequiredMixin, pagination.ListingsPageMixin, TemplateView):
     login_url = 'login'
     template_name = 'auctions/watchlist.html'
-    context_object_name = 'listings'
 
-    def get_queryset(self):
-        return self.request.user.watchlist.listings.all()
+    def get_listings(self):
+        # user's own queued watchlist changes show up
+        writebehind.read_own_writes(self.request)
+        # one query: listings joined with user's entries (an index seek)
+        return Listing.objects.filter(watchlist_entries__user=self.request.user)
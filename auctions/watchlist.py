@@ -0,0 +1,90 @@
+"""Watchlist membership of current user.
+
+`WatchlistMiddleware` attaches a `WatchedListings` to each request
+(`request.watchlist`), which loads ids of listings on user's watchlist
+at most once per request, so layout (watchlist count), `watchlist_forms`
+and watchlist views all share a single query.
+
+Ids could also be cached across requests (`WATCHLIST_CACHE_TIMEOUT` setting,
+0 disables it), in which case they are invalidated whenever user's watchlist
+changes through `WatchedListings.add`/`remove`.
+
+Changes could also be queued and written in batches (see auctions.writebehind),
+in which case user's pending changes are written before their ids are loaded.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from . import writebehind
+from .models import WatchlistEntry
+
+
+def cache_key(user_id):
+    return f'auctions:watchlist:{user_id}'
+
+
+def invalidate(user_id):
+    """Drop cached watchlist of user (`user_id`)."""
+    cache.delete(cache_key(user_id))
+
+
+class WatchedListings:
+    """Ids of listings on watchlist of request's user."""
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def ids(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            return set()
+        writebehind.read_own_writes(self.request)
+
+        timeout = getattr(settings, 'WATCHLIST_CACHE_TIMEOUT', 0)
+        if timeout:
+            ids = cache.get(cache_key(user.id))
+            if ids is not None:
+                return ids
+
+        # index only: (user, listing) unique index
+        ids = set(WatchlistEntry.objects.filter(user_id=user.id).values_list('listing_id', flat=True))
+        if timeout:
+            cache.set(cache_key(user.id), ids, timeout)
+        return ids
+
+    def __contains__(self, listing_id):
+        return listing_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, listing):
+        """Add `listing` to user's watchlist (now or, if enabled, by write-behind queue)."""
+        if writebehind.is_enabled():
+            writebehind.queue.put('watch', self.request.user.id, listing.id)
+        else:
+            self.request.user.watched_listings.add(listing)
+            invalidate(self.request.user.id)
+        self.ids.add(listing.id)
+
+    def remove(self, listing):
+        """Remove `listing` from user's watchlist (now or, if enabled, by write-behind queue)."""
+        if writebehind.is_enabled():
+            writebehind.queue.put('unwatch', self.request.user.id, listing.id)
+        else:
+            self.request.user.watched_listings.remove(listing)
+            invalidate(self.request.user.id)
+        self.ids.discard(listing.id)
+
+
+class WatchlistMiddleware:
+    """Attach watchlist of current user to request (`request.watchlist`).
+    Must come after `AuthenticationMiddleware`.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.watchlist = WatchedListings(request)
+        return self.get_response(request)
@@ -0,0 +1,204 @@
+"""Write-behind queue (opt-in) for high volume, low stakes writes:
+watchlist additions/removals and new comments.
+
+With `WRITE_BEHIND_INTERVAL` setting set (seconds), views still validate
+these writes but queue them (`queue.put`) instead of writing them one row
+at a time. Queued writes are flushed in batches by a background thread
+(at most every `WRITE_BEHIND_INTERVAL` seconds), right away by the request
+that queues `WRITE_BEHIND_MAX_PENDING`th write, and at exit:
+- watchlist changes of same user and listing collapse into the last one,
+  then go in as one bulk insert (of watchlist entries) and one delete
+- comments go in as one bulk insert
+Bulk writes send no signals, so flush invalidates cached listing pages
+and watchlists of what it wrote itself.
+
+Read-your-writes: views call `read_own_writes(request)` before reading
+watchlist or comments, which flushes queue right away if request's user
+has writes pending (or being written). It costs nothing while queue is empty.
+NOTE: queue is per process; with several worker processes, a user only
+reads their own writes on the process that queued them (or once flushed).
+
+Unset (0): writes happen right away, as before.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+
+from . import caching, metrics, watchlist
+from .models import Comment, Listing, User, WatchlistEntry
+
+
+logger = logging.getLogger(__name__)
+
+def is_enabled():
+    return bool(getattr(settings, 'WRITE_BEHIND_INTERVAL', 0))
+
+
+class WriteQueue:
+    """Pending writes of this process (see module docstring)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        # writes are flushed one batch at a time
+        self.flush_lock = threading.Lock()
+        # (user id, listing id): True (watch) or False (unwatch), last one wins
+        self.watchlist = {}
+        # (user id, listing id, content)
+        self.comments = []
+        # users with writes queued or being written
+        self.users = set()
+        self.pid = os.getpid()
+        self.wakeup = threading.Event()
+        self.flusher = None
+
+    def __len__(self):
+        return len(self.watchlist) + len(self.comments)
+
+    def put(self, kind, user_id, listing_id, content=None):
+        """Queue a write: `watch`/`unwatch` listing (`listing_id`)
+        or `comment` on it (`content`), by user (`user_id`).
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                # forked: pending writes (and flusher thread) are parent's
+                self.pid = os.getpid()
+                self.flusher = None
+                self.watchlist, self.comments, self.users = {}, [], set()
+            if self.flusher is None:
+                atexit.register(self.flush)
+            if self.flusher is None or not self.flusher.is_alive():
+                # (first write, or flusher died anyway)
+                self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+                self.flusher.start()
+            if kind == 'comment':
+                self.comments.append((user_id, listing_id, content))
+            else:
+                self.watchlist[(user_id, listing_id)] = kind == 'watch'
+            self.users.add(user_id)
+            full = len(self) >= getattr(settings, 'WRITE_BEHIND_MAX_PENDING', 1000)
+        if full:
+            # backpressure: request queuing it writes the batch,
+            # but never fails for it (writes get queued back, flusher retries them)
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.warning('write-behind flush failed, %d write(s) queued back', len(self), exc_info=True)
+                self.wakeup.set()
+        else:
+            self.wakeup.set()
+
+    def has_pending(self, user_id):
+        return user_id in self.users
+
+    def flush_periodically(self):
+        while True:
+            self.wakeup.wait()
+            # let writes pile up
+            time.sleep(getattr(settings, 'WRITE_BEHIND_INTERVAL', 0) or 1)
+            self.wakeup.clear()
+            # nothing may stop this thread: queued writes would pile up unflushed
+            try:
+                self.flush()
+            except DatabaseError:
+                # writes got queued back (next flush retries them)
+                logger.warning('write-behind flush failed, %d write(s) queued back', len(self), exc_info=True)
+            except Exception:
+                logger.exception('write-behind flush failed')
+            finally:
+                # this thread's own connection
+                connection.close()
+
+    def flush(self):
+        """Write all pending writes (in one transaction).
+        On db errors, writes are queued back (and error is raised).
+        """
+        with self.flush_lock:
+            with self.lock:
+                watchlist, comments = self.watchlist, self.comments
+                self.watchlist, self.comments = {}, []
+            try:
+                if watchlist or comments:
+                    self.write(watchlist, comments)
+            except DatabaseError:
+                with self.lock:
+                    # newer changes of same user/listing win
+                    for key, watch in watchlist.items():
+                        self.watchlist.setdefault(key, watch)
+                    self.comments[:0] = comments
+                for kind, count in count_kinds(watchlist, comments).items():
+                    if count:
+                        metrics.WRITES_BEHIND.inc(count, kind=kind, outcome='failed')
+                raise
+            finally:
+                with self.lock:
+                    self.users = {user_id for user_id, _ in self.watchlist} | {c[0] for c in self.comments}
+
+    def write(self, watchlist_changes, comments):
+        user_ids = {user_id for user_id, _ in watchlist_changes} | {c[0] for c in comments}
+        listing_ids = {listing_id for _, listing_id in watchlist_changes} | {c[1] for c in comments}
+        with transaction.atomic():
+            # writes of users/listings deleted since are dropped
+            user_ids = set(User.objects.filter(pk__in=user_ids).values_list('id', flat=True))
+            listing_ids = set(Listing.objects.filter(pk__in=listing_ids).values_list('id', flat=True))
+            added, removed = [], defaultdict(list)
+            for (user_id, listing_id), watch in watchlist_changes.items():
+                if user_id not in user_ids or listing_id not in listing_ids:
+                    continue
+                if watch:
+                    added.append(WatchlistEntry(user_id=user_id, listing_id=listing_id))
+                else:
+                    removed[user_id].append(listing_id)
+            new_comments = [
+                Comment(user_id=user_id, listing_id=listing_id, content=content)
+                for user_id, listing_id, content in comments
+                if user_id in user_ids and listing_id in listing_ids
+            ]
+            # (rows already there are skipped)
+            WatchlistEntry.objects.bulk_create(added, ignore_conflicts=True)
+            if removed:
+                WatchlistEntry.objects.filter(reduce(or_, (
+                    Q(user_id=user_id, listing_id__in=ids) for user_id, ids in removed.items()
+                ))).delete()
+            Comment.objects.bulk_create(new_comments)
+
+        # no signals were sent
+        if new_comments:
+            caching.bump_version(*{caching.listing_version_name(c.listing_id) for c in new_comments})
+        for user_id in {user_id for user_id, _ in watchlist_changes}:
+            watchlist.invalidate(user_id)
+
+        written = {'watch': len(added), 'unwatch': sum(map(len, removed.values())), 'comment': len(new_comments)}
+        for kind, count in count_kinds(watchlist_changes, comments).items():
+            if written[kind]:
+                metrics.WRITES_BEHIND.inc(written[kind], kind=kind, outcome='written')
+            if count > written[kind]:
+                metrics.WRITES_BEHIND.inc(count - written[kind], kind=kind, outcome='dropped')
+
+
+def count_kinds(watchlist_changes, comments):
+    """Number of writes of each kind (`watch`, `unwatch`, `comment`)."""
+    watched = sum(watchlist_changes.values())
+    return {'watch': watched, 'unwatch': len(watchlist_changes) - watched, 'comment': len(comments)}
+
+
+queue = WriteQueue()
+
+
+def flush():
+    queue.flush()
+
+
+def read_own_writes(request):
+    """Flush pending writes now if request's user has some
+    (so that what's read next reflects them).
+    """
+    if queue.users and request.user.is_authenticated and queue.has_pending(request.user.id):
+        queue.flush()
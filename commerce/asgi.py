@@ -3,6 +3,10 @@ ASGI config for commerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Besides django app, it serves real-time listing events
+(Server-Sent Events, see auctions.events) which need long-lived responses
+that shouldn't hold a django worker thread each.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
@@ -13,4 +17,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# must be imported after django is set up
+from auctions import events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        match = events.EVENTS_PATH.match(scope['path'])
+        if match:
+            return await events.listing_events(scope, receive, send, int(match['listing_id']))
+    return await django_application(scope, receive, send)
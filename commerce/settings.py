@@ -41,11 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.profiling.ProfilingMiddleware',
+    'auctions.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'auctions.watchlist.WatchlistMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,6 +66,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'auctions.categories.nav_categories',
             ],
         },
     },
@@ -78,11 +82,114 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # file-based (not in-memory) test db
+        # so that concurrent tests (threads) get real db locking
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
+# pragmas run on every new sqlite connection (see auctions.database)
+# none in development, see commerce/settings_production.py
+SQLITE_PRAGMAS = {}
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# local memory cache is per process, so when running multiple processes
+# set AUCTIONS_CACHE_DIR to share a file-based cache between them
+
+if os.environ.get('AUCTIONS_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['AUCTIONS_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Sessions and authentication
+# https://docs.djangoproject.com/en/3.2/topics/http/sessions/#configuring-the-session-engine
+# AUCTIONS_SESSION_BACKEND:
+# - 'cached_db': read from cache, db only on cache misses (default)
+# - 'signed_cookies': stored in (signed) cookie itself, never in db
+#   (but sessions can't be revoked server side)
+# - 'db': a query per request
+# (cached sessions and users need a cache shared by all processes, see above)
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('AUCTIONS_SESSION_BACKEND', 'cached_db')
+
+# users of sessions are loaded from cache too (see auctions.auth)
+# (sessions logged in by plain ModelBackend, eg. before it, stay valid)
+AUTHENTICATION_BACKENDS = [
+    'auctions.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# seconds to cache users of sessions (0: a query per request)
+USER_CACHE_TIMEOUT = 60 * 5
+
+# seconds to cache pages/fragments rendered for listing pages (see auctions.caching)
+# 0: caching is disabled
+PAGE_CACHE_TIMEOUT = 60 * 5
+
+# full-text search backend of listings (see auctions.search)
+# 'fts5' (sqlite only), 'inverted' (any db) or 'auto'
+SEARCH_BACKEND = 'auto'
+
+# pub/sub broker of real-time listing events (see auctions.events)
+# in-process broker only reaches clients connected to the same process
+EVENTS_BROKER = 'auctions.events.InProcessBroker'
+
+# seconds to cache ids of each user's watched listings across requests
+# (0: load them once per request)
+WATCHLIST_CACHE_TIMEOUT = 0
+
+# seconds between flushes of queued watchlist changes/comments (see auctions.writebehind)
+# (0: they are written right away)
+WRITE_BEHIND_INTERVAL = float(os.environ.get('AUCTIONS_WRITE_BEHIND_INTERVAL', 0))
+
+# queued writes flushed right away (by request queuing the last one)
+WRITE_BEHIND_MAX_PENDING = 1000
+
+# share of requests profiled (0 to 1) by auctions.profiling.ProfilingMiddleware
+# (0: middleware is disabled altogether)
+PROFILING_SAMPLE_RATE = float(os.environ.get('AUCTIONS_PROFILING_SAMPLE_RATE', 0))
+
+# also run cProfile on profiled requests (slows them down a lot)
+PROFILING_CPROFILE = False
+
+# directory (shared by all worker processes) where each process
+# writes its metrics for `/metrics` to add up (see auctions.metrics)
+# (unset: `/metrics` only shows metrics of process serving it)
+METRICS_DIR = os.environ.get('AUCTIONS_METRICS_DIR')
+
+# seconds between writes of a process' metrics to METRICS_DIR
+METRICS_FLUSH_INTERVAL = 5
+
+# addresses (eg. of prometheus) allowed to read `/metrics` without logging in as staff
+# comma separated in AUCTIONS_METRICS_ALLOWED_IPS
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get('AUCTIONS_METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# listing images proxy (see auctions.images)
+# fetcher: dotted path of a callable (url -> image bytes)
+IMAGE_FETCHER = 'auctions.images.fetch_url'
+IMAGE_FETCH_TIMEOUT = 5
+IMAGE_MAX_BYTES = 5 * 1024 * 1024
+IMAGE_CACHE_DIR = os.environ.get('AUCTIONS_IMAGE_CACHE_DIR', os.path.join(BASE_DIR, 'image_cache'))
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# days after closing a listing that its bids and comments are archived
+# by `manage.py archive_closed_listings` (see auctions.archive)
+ARCHIVE_AFTER_DAYS = 30
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
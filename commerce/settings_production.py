@@ -0,0 +1,75 @@
+"""
+Production settings for commerce project:
+    DJANGO_SETTINGS_MODULE=commerce.settings_production
+
+Same as development settings (commerce/settings.py), except for:
+- debug off, secret key and allowed hosts from environment
+- a cache shared by all processes is required (AUCTIONS_CACHE_DIR):
+  sessions, users (auctions.auth) and versions of cached pages live there,
+  and a per process cache would serve each process its own (stale) copy
+- persistent db connections (`CONN_MAX_AGE`)
+- sqlite tuned for concurrent reads and writes (WAL, see auctions.database)
+- or PostgreSQL instead (AUCTIONS_DB_ENGINE=postgresql, needs psycopg2)
+
+Check with `python manage.py check --deploy --settings=commerce.settings_production`.
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+
+DEBUG = False
+
+SECRET_KEY = os.environ['AUCTIONS_SECRET_KEY']
+
+ALLOWED_HOSTS = [host for host in os.environ.get('AUCTIONS_ALLOWED_HOSTS', '').split(',') if host]
+
+# local memory cache (default without it) is per process
+if not os.environ.get('AUCTIONS_CACHE_DIR'):
+    raise ImproperlyConfigured(
+        'Set AUCTIONS_CACHE_DIR: production needs a cache shared by all processes '
+        '(cached sessions, users and page versions).'
+    )
+
+
+# Database
+# https://docs.djangoproject.com/en/3.2/ref/databases/#persistent-connections
+# AUCTIONS_DB_ENGINE: 'sqlite' (default) or 'postgresql'
+
+# seconds each connection is reused for (instead of a new one per request)
+CONN_MAX_AGE = int(os.environ.get('AUCTIONS_CONN_MAX_AGE', 600))
+
+if os.environ.get('AUCTIONS_DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('AUCTIONS_DB_NAME', 'commerce'),
+            'USER': os.environ.get('AUCTIONS_DB_USER', ''),
+            'PASSWORD': os.environ.get('AUCTIONS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('AUCTIONS_DB_HOST', ''),
+            'PORT': os.environ.get('AUCTIONS_DB_PORT', ''),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+        }
+    }
+    SQLITE_PRAGMAS = {}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('AUCTIONS_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'TEST': {
+                'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+            },
+        }
+    }
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('AUCTIONS_SQLITE_BUSY_TIMEOUT', 5000)),
+        'mmap_size': 256 * 1024 * 1024,
+    }